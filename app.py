@@ -1,12 +1,17 @@
 import streamlit as st
 import os
-from dotenv import load_dotenv
-from core.music_data_collector import MusicDataCollector
-from core.music_knowledge_base import MusicKnowledgeBase
-from core.music_advisor import MusicAdvisor
 from core.auth_manager import AuthManager
+from core.chatify_service import SessionNotFound, profile_summary
+from core.metrics import start_metrics_server
 
-load_dotenv()
+# Prometheus-style /metrics endpoint (only if CHATIFY_METRICS_PORT is set)
+start_metrics_server()
+
+# Chat messages rendered per page (older ones behind "Show earlier messages", 0 = all)
+CHAT_PAGE_SIZE = int(os.getenv("CHATIFY_CHAT_PAGE_SIZE", "20"))
+
+# With a backend URL this app is a thin client of core.backend_service
+BACKEND_URL = os.getenv("CHATIFY_BACKEND_URL")
 
 st.set_page_config(
     page_title="Chatify",
@@ -17,25 +22,56 @@ st.set_page_config(
 # Initialize session states
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
-if "token_info" not in st.session_state:
-    st.session_state.token_info = None
 if "user_id" not in st.session_state:
     st.session_state.user_id = None
 if "music_data" not in st.session_state:
     st.session_state.music_data = None
-if "knowledge_base" not in st.session_state:
-    st.session_state.knowledge_base = None
-if "advisor" not in st.session_state:
-    st.session_state.advisor = None
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "data_loaded" not in st.session_state:
     st.session_state.data_loaded = False
 if "initializing" not in st.session_state:
     st.session_state.initializing = False
+if "history_shown" not in st.session_state:
+    st.session_state.history_shown = CHAT_PAGE_SIZE
+
+# Stateless objects are built once per process, not on every rerun
+@st.cache_resource(show_spinner=False)
+def get_auth_manager():
+    return AuthManager()
+
+@st.cache_resource(show_spinner=False)
+def get_auth_url():
+    return get_auth_manager().get_auth_url()
+
+def get_service():
+    """
+    Chatify pipeline: a client of the remote backend if CHATIFY_BACKEND_URL is set
+    (one per browser session, it holds that session's backend token), otherwise the
+    in-process ChatifyService shared by every session
+    """
+    if BACKEND_URL:
+        if 'backend_client' not in st.session_state:
+            from core.backend_client import BackendClient
+            st.session_state.backend_client = BackendClient(BACKEND_URL)
+        return st.session_state.backend_client
+    return get_local_service()
+
+@st.cache_resource(show_spinner=False)
+def get_local_service():
+    from core.chatify_service import ChatifyService
+    from core.refresh_scheduler import RefreshScheduler
+    from core.session_manager import SessionManager
+    service = ChatifyService(oauth=get_auth_manager().sp_oauth)
+    # Keeps recently active users' data fresh for their next visit
+    RefreshScheduler(service).start()
+    # Gives back the memory of sessions idle for CHATIFY_SESSION_IDLE_MINUTES
+    SessionManager(service).start()
+    return service
 
 # Initialize authentication manager
-auth_manager = AuthManager()
+auth_manager = get_auth_manager()
+service = get_service()
 
 # Clean up old files without user_id (one-time cleanup)
 def cleanup_old_files():
@@ -49,6 +85,9 @@ def cleanup_old_files():
     if os.path.exists("user_music_data.json"):
         old_files.append("user_music_data.json")
     
+    # Tokens are no longer persisted, drop any left from older versions
+    old_files.extend(glob.glob("user_token_*.json"))
+    
     # Remove old files
     for old_file in old_files:
         try:
@@ -71,14 +110,13 @@ def handle_auth_callback():
         token_info = auth_manager.get_access_token(code)
         
         if token_info:
-            st.session_state.token_info = token_info
             st.session_state.authenticated = True
             
-            # Get user_id immediately after authentication
-            user_id = auth_manager.get_user_id(token_info)
-            if user_id and user_id != 'unknown_user':
-                # Store user_id in session state
-                st.session_state.user_id = user_id
+            # The service keeps one Spotify session per user (cached profile, token refresh)
+            try:
+                st.session_state.user_id = service.login(token_info)
+            except Exception as e:
+                print(f"Error logging in: {e}")
 
             st.query_params.clear()
             st.rerun()
@@ -91,90 +129,28 @@ handle_auth_callback()
 def initialize_system():
     """Initializes system with authenticated user data"""
     try:
+        user_id = st.session_state.user_id
+        print(f"User ID: {user_id}")  # Debug
+        
+        # Verify token belongs to this user
+        if not user_id or user_id == 'unknown_user':
+            raise ValueError("Could not get user ID from token")
+        
+        # Timed (initialize_system span) and tagged with the user inside the service
         with st.status("Initializing Chatify...", expanded=True) as status:
-            # First, get user ID quickly (single API call)
-            status.update(label="Checking your profile...")
-            user_id = auth_manager.get_user_id(st.session_state.token_info)
-            print(f"User ID: {user_id}")  # Debug
-            
-            # Verify token belongs to this user
-            if not user_id or user_id == 'unknown_user':
-                raise ValueError("Could not get user ID from token")
-            
-            # Store user_id in session state
-            st.session_state.user_id = user_id
-            
-            # Clean up old files from other users (keep current user's cache)
-            import glob
-            for token_file in glob.glob("user_token_*.json"):
-                if token_file != f"user_token_{user_id}.json":
-                    try:
-                        os.remove(token_file)
-                    except:
-                        pass
-            
-            for data_file in glob.glob("user_music_data_*.json"):
-                if data_file != f"user_music_data_{user_id}.json":
-                    try:
-                        os.remove(data_file)
-                    except:
-                        pass
-            
-            # Check if knowledge base already exists for this user
-            status.update(label="Checking knowledge base...")
-            knowledge_base = MusicKnowledgeBase(user_id=user_id)
-            
-            # Check if collection exists (uses cache, very fast)
-            if knowledge_base.collection_exists():
-                status.update(label="Knowledge base found! Loading your data...")
-                # Collection exists, try to load from cache file first (fast)
-                try:
-                    import json
-                    data_filename = f"user_music_data_{user_id}.json"
-                    if os.path.exists(data_filename):
-                        with open(data_filename, "r", encoding='utf-8') as f:
-                            music_data = json.load(f)
-                            # Verify it's the same user
-                            if music_data.get('user_profile', {}).get('id') == user_id:
-                                st.session_state.music_data = music_data
-                                status.update(label="Data loaded from cache!")
-                            else:
-                                # Different user, need to collect fresh data
-                                raise FileNotFoundError("User mismatch")
-                    else:
-                        raise FileNotFoundError("No cached data")
-                except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
-                    # No cached data, different user, or encoding error - collect fresh data
-                    status.update(label="Collecting your music profile...")
-                    collector = MusicDataCollector(st.session_state.token_info)
-                    music_data = collector.collect_all_data()
-                    st.session_state.music_data = music_data
-                    # Save to cache for next time
-                    collector.save_data_to_file(f"user_music_data_{user_id}.json")
-            else:
-                # Collection doesn't exist, need to collect all data
-                status.update(label="Collecting your music profile...")
-                collector = MusicDataCollector(st.session_state.token_info)
-                music_data = collector.collect_all_data()
-                st.session_state.music_data = music_data
-                
-                status.update(label="Creating knowledge base...")
-                knowledge_base.initialize_knowledge_base(music_data, force_recreate=False)
-                
-                # Save to cache for next time
-                collector.save_data_to_file(f"user_music_data_{user_id}.json")
-            
-            st.session_state.knowledge_base = knowledge_base
-            
-            status.update(label="Setting up your Chatify...")
-            advisor = MusicAdvisor(knowledge_base, st.session_state.music_data, st.session_state.token_info)
-            st.session_state.advisor = advisor
-            
+            # Only what the sidebar shows: the full data stays in the service, where idle
+            # sessions give it back
+            st.session_state.music_data = profile_summary(service.initialize(
+                user_id, progress=lambda label: status.update(label=label)
+            ))
             status.update(label="System ready!", state="complete")
         
         st.session_state.data_loaded = True
         st.success("Your Chatify is ready! You can start asking questions.")
         
+    except SessionNotFound:
+        # The backend lost the session (e.g. restarted): sign in again
+        logout()
     except Exception as e:
         st.session_state.initializing = False
         st.error(f"Error initializing system: {e}")
@@ -184,34 +160,17 @@ def initialize_system():
 def update_knowledge_base():
     """Updates the knowledge base with fresh data"""
     try:
-        user_id = st.session_state.get('user_id')
-        if not user_id:
-            user_id = auth_manager.get_user_id(st.session_state.token_info)
-            st.session_state.user_id = user_id
-        
+        user_id = st.session_state.user_id
         with st.status("Updating Knowledge Base...", expanded=True) as status:
-            status.update(label="Collecting fresh music data...")
-            collector = MusicDataCollector(st.session_state.token_info)
-            music_data = collector.collect_all_data()
-            st.session_state.music_data = music_data
-            
-            status.update(label="Updating knowledge base...")
-            st.session_state.knowledge_base.update_knowledge_base(music_data)
-            
-            # Update cache file
-            collector.save_data_to_file(f"user_music_data_{user_id}.json")
-            
-            status.update(label="Refreshing advisor...")
-            st.session_state.advisor = MusicAdvisor(
-                st.session_state.knowledge_base, 
-                music_data, 
-                st.session_state.token_info
-            )
-            
+            st.session_state.music_data = profile_summary(service.update(
+                user_id, progress=lambda label: status.update(label=label)
+            ))
             status.update(label="Knowledge base updated!", state="complete")
         
         st.success("Your knowledge base has been updated with the latest data!")
         
+    except SessionNotFound:
+        logout()
     except Exception as e:
         st.error(f"Error updating knowledge base: {e}")
         import traceback
@@ -219,11 +178,11 @@ def update_knowledge_base():
 
 def logout():
     """Logs out the user and clears all session data"""
-    # Close Weaviate connection if exists
-    if st.session_state.knowledge_base:
+    # Drop the user's session in the service (stops its token refreshes)
+    if st.session_state.get('user_id'):
         try:
-            st.session_state.knowledge_base.close()
-        except:
+            service.logout(st.session_state.user_id)
+        except Exception:
             pass
     
     # Clear ALL session state
@@ -232,17 +191,92 @@ def logout():
     
     # Reinitialize basic session states
     st.session_state.authenticated = False
-    st.session_state.token_info = None
     st.session_state.music_data = None
-    st.session_state.knowledge_base = None
-    st.session_state.advisor = None
     st.session_state.messages = []
     st.session_state.data_loaded = False
     st.session_state.initializing = False
     st.session_state.user_id = None
+    st.session_state.history_shown = CHAT_PAGE_SIZE
     
     st.rerun()
 
+@st.fragment
+def render_sidebar():
+    """Sidebar contents; widget clicks rerun only this fragment"""
+    st.title("Chatify")
+    st.markdown("---")
+    
+    st.subheader("Settings")
+    
+    if st.session_state.data_loaded:
+        st.success("System ready")
+        
+        if st.session_state.music_data:
+            st.subheader("Your Music Profile")
+            user_name = st.session_state.music_data['user_profile'].get('display_name', 'User')
+            user_id = st.session_state.music_data['user_profile'].get('id', 'unknown')
+            st.write(f"**{user_name}**")
+            
+            top_artists = st.session_state.music_data.get('top_artists', [])[:3]
+            if top_artists:
+                st.write("**Top Artists:**")
+                for artist in top_artists:
+                    st.write(f"- {artist['name']}")
+        
+        st.markdown("---")
+        st.subheader("Data Management")
+        
+        if st.button("Update Knowledge Base", use_container_width=True, type="secondary"):
+            update_knowledge_base()
+            st.rerun()
+    
+    st.markdown("---")
+    if st.button("Sign Out", use_container_width=True, type="secondary"):
+        logout()
+
+def show_earlier_messages():
+    st.session_state.history_shown += CHAT_PAGE_SIZE
+
+def render_chat_history():
+    """Render the latest page of messages; older ones only when asked for"""
+    messages = st.session_state.messages
+    shown = len(messages) if CHAT_PAGE_SIZE <= 0 else st.session_state.history_shown
+    hidden = max(len(messages) - shown, 0)
+    if hidden:
+        st.button(f"Show earlier messages ({hidden})", key="show_earlier", on_click=show_earlier_messages)
+    
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+@st.fragment
+def render_chat():
+    """Chat history and input; sending a message reruns only this fragment"""
+    render_chat_history()
+
+    if prompt := st.chat_input("Ask your Chatify something..."):
+        if not st.session_state.data_loaded:
+            st.error("System is initializing, please wait...")
+            st.stop()
+    
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        with st.chat_message("assistant"):
+            with st.spinner("Your advisor is thinking..."):
+                try:
+                    response = service.ask(st.session_state.user_id, prompt)
+                    st.markdown(response)
+                    st.session_state.messages.append({"role": "assistant", "content": response})
+                except SessionNotFound:
+                    # The service restarted or dropped the session: sign in again
+                    logout()
+                except Exception as e:
+                    error_msg = f"Sorry, there was an error: {str(e)}"
+                    st.markdown(error_msg)
+                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
 # Login screen
 if not st.session_state.authenticated:
     st.title("Welcome to Chatify")
@@ -262,7 +296,7 @@ if not st.session_state.authenticated:
     with col2:
         st.info("**Sign in with your Spotify account to get started**")
         
-        auth_url = auth_manager.get_auth_url()
+        auth_url = get_auth_url()
 
         st.markdown(f"""
         <a href="{auth_url}" target="_self">
@@ -285,36 +319,7 @@ else:
         st.rerun()
     
     with st.sidebar:
-        st.title("Chatify")
-        st.markdown("---")
-        
-        st.subheader("Settings")
-        
-        if st.session_state.data_loaded:
-            st.success("System ready")
-            
-            if st.session_state.music_data:
-                st.subheader("Your Music Profile")
-                user_name = st.session_state.music_data['user_profile'].get('display_name', 'User')
-                user_id = st.session_state.music_data['user_profile'].get('id', 'unknown')
-                st.write(f"**{user_name}**")
-                
-                top_artists = st.session_state.music_data.get('top_artists', [])[:3]
-                if top_artists:
-                    st.write("**Top Artists:**")
-                    for artist in top_artists:
-                        st.write(f"- {artist['name']}")
-            
-            st.markdown("---")
-            st.subheader("Data Management")
-            
-            if st.button("Update Knowledge Base", use_container_width=True, type="secondary"):
-                update_knowledge_base()
-                st.rerun()
-        
-        st.markdown("---")
-        if st.button("Sign Out", use_container_width=True, type="secondary"):
-            logout()
+        render_sidebar()
 
     st.title("Your Personalized Chatify")
     st.markdown("Chat with your intelligent music assistant that knows your taste and helps you discover new music.")
@@ -325,36 +330,9 @@ else:
         with col1:
             if st.button("Analyze My Profile", use_container_width=True, type="secondary"):
                 with st.spinner("Analyzing your music profile..."):
-                    analysis = st.session_state.advisor.analyze_profile()
+                    analysis = service.analyze_profile(st.session_state.user_id)
                     st.session_state.messages.append({"role": "user", "content": "Analyze my music profile in detail"})
                     st.session_state.messages.append({"role": "assistant", "content": analysis})
                     st.rerun()
 
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-    if prompt := st.chat_input("Ask your Chatify something..."):
-        if not st.session_state.data_loaded:
-            st.error("System is initializing, please wait...")
-            st.stop()
-        
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-
-        with st.chat_message("assistant"):
-            with st.spinner("Your advisor is thinking..."):
-                try:
-                    response = st.session_state.advisor.ask(prompt)
-                    # Update session state in case music_data was updated during auto-initialization
-                    if st.session_state.advisor.music_data:
-                        st.session_state.music_data = st.session_state.advisor.music_data
-                    if st.session_state.advisor.knowledge_base:
-                        st.session_state.knowledge_base = st.session_state.advisor.knowledge_base
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
-                    error_msg = f"Sorry, there was an error: {str(e)}"
-                    st.markdown(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
\ No newline at end of file
+    render_chat()
@@ -0,0 +1,131 @@
+"""
+Load benchmark for the headless backend: how many concurrent sessions per core
+Starts core.backend_service in-process on top of the offline stand-ins (fake Spotify
+server, LocalVectorStore, hash embeddings, FakeLLM) and, for each concurrency level,
+runs that many sessions through BackendClient: login, initialize, then a series of
+questions. Reports ask latency, throughput and CPU use; sessions per core is the
+highest level whose p95 ask latency stays within --slo-ms, divided by the core count.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_backend --sessions 1,2,4,8,16 --questions 5
+    python -m benchmarks.bench_backend --llm-latency 1.0 --workers 64 --slo-ms 2500
+"""
+import argparse
+import contextlib
+import os
+import resource
+import tempfile
+import threading
+import time
+
+from benchmarks.fakes import FakeLLM, FakeSpotifyServer, HashEmbeddings
+from benchmarks.run_benchmarks import summarize
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile, sample_questions
+from core.backend_client import BackendClient
+from core.backend_service import BackendServer
+from core.chatify_service import ChatifyService
+from core.llm_gateway import LLMGateway
+from core.local_vector_store import LocalVectorStore
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_session(client, token, questions, think_time, results):
+    start = time.perf_counter()
+    user_id = client.login({'access_token': token})
+    client.initialize(user_id)
+    results['initialize'].append(time.perf_counter() - start)
+
+    for question in questions:
+        start = time.perf_counter()
+        client.ask(user_id, question)
+        results['ask'].append(time.perf_counter() - start)
+        if think_time:
+            time.sleep(think_time)
+    client.logout(user_id)
+
+
+def run_level(backend_url, level, questions, think_time):
+    """Run `level` concurrent sessions; returns latencies, wall and CPU seconds"""
+    client = BackendClient(backend_url)
+    results = {'initialize': [], 'ask': [], 'errors': []}
+
+    def session(i):
+        try:
+            run_session(client, f"load_{level}_{i}", questions, think_time, results)
+        except Exception as e:
+            results['errors'].append(str(e))
+
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(level)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - wall_start, cpu_seconds() - cpu_start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backend load benchmark (sessions per core)")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='small')
+    parser.add_argument('--sessions', default='1,2,4,8,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--questions', type=int, default=5, help="Questions per session")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Seconds between a session's questions")
+    parser.add_argument('--workers', type=int, default=None, help="Backend worker pool size")
+    parser.add_argument('--spotify-latency', type=float, default=0.0)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--llm-concurrency', type=int, default=8, help="LLM gateway slots")
+    parser.add_argument('--slo-ms', type=float, default=1000.0, help="p95 ask latency target")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's progress output")
+    args = parser.parse_args(argv)
+
+    raw = generate_raw_profile(args.profile)
+    questions = sample_questions(build_music_data(raw), n=args.questions)
+    cores = os.cpu_count() or 1
+    repo_root = os.getcwd()
+
+    service = ChatifyService(
+        vector_client=LocalVectorStore(),
+        embedding_model=HashEmbeddings(),
+        llm=LLMGateway(FakeLLM(latency=args.llm_latency), concurrency=args.llm_concurrency)
+    )
+
+    print(f"{args.profile} profile, {args.questions} questions per session, {cores} cores, "
+          f"LLM latency {args.llm_latency * 1000:.0f} ms\n")
+    print(f"{'sessions':>8} {'init p50':>9} {'init p95':>9} {'ask p50':>8} {'ask p95':>8} "
+          f"{'asks/s':>7} {'CPU %':>6} {'errors':>6}")
+
+    sustained = 0
+    # User caches and play logs are written relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='chatify_load_') as workdir:
+        os.chdir(workdir)
+        try:
+            with FakeSpotifyServer(raw, latency=args.spotify_latency, per_token_users=True) as spotify, \
+                    BackendServer(service, host='127.0.0.1', port=0, workers=args.workers) as backend:
+                os.environ['SPOTIFY_API_PREFIX'] = spotify.api_prefix
+                for level in [int(s) for s in args.sessions.split(',') if s.strip()]:
+                    with open(os.devnull, 'w') as devnull, \
+                            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+                        results, wall, cpu = run_level(backend.url, level, questions, args.think_time)
+                    init = summarize(results['initialize'])
+                    ask = summarize(results['ask'])
+                    throughput = len(results['ask']) / wall if wall else 0.0
+                    cpu_pct = 100 * cpu / (wall * cores) if wall else 0.0
+                    print(f"{level:>8} {init['p50_ms']:>9.0f} {init['p95_ms']:>9.0f} {ask['p50_ms']:>8.0f} "
+                          f"{ask['p95_ms']:>8.0f} {throughput:>7.1f} {cpu_pct:>6.1f} {len(results['errors']):>6}")
+                    if results['errors']:
+                        print(f"         first error: {results['errors'][0]}")
+                    elif ask['p95_ms'] <= args.slo_ms:
+                        sustained = level
+        finally:
+            os.chdir(repo_root)
+
+    print(f"\nsessions per core within p95 ask <= {args.slo_ms:.0f} ms: {sustained / cores:.2f} "
+          f"({sustained} concurrent sessions on {cores} cores)")
+
+
+if __name__ == '__main__':
+    main()
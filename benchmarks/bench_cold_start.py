@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark: time from a fresh interpreter to a rendered login page
+Each run starts a new Python process that renders app.py with Streamlit's AppTest
+(no session, so the login screen) and reports which heavy modules got imported.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_cold_start --runs 5
+    python -m benchmarks.bench_cold_start --importtime   # per-module breakdown
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Modules that must not be imported just to show the login page
+HEAVY_MODULES = (
+    'torch', 'transformers', 'sentence_transformers', 'langchain_huggingface',
+    'langchain_google_genai', 'weaviate', 'onnxruntime', 'numpy',
+)
+
+CHILD_SCRIPT = r"""
+import json, os, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+elapsed = time.perf_counter() - start
+titles = [t.value for t in at.title]
+print("RESULT " + json.dumps({
+    "seconds": elapsed,
+    "login_page": "Welcome to Chatify" in titles,
+    "exceptions": [str(e.value) for e in at.exception],
+    "heavy_modules": sorted(m for m in HEAVY if m in sys.modules),
+}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    # SpotifyOAuth refuses to build without credentials; any value renders the page
+    env.setdefault('SPOTIFY_CLIENT_ID', 'bench-client-id')
+    env.setdefault('SPOTIFY_CLIENT_SECRET', 'bench-client-secret')
+    env.setdefault('SPOTIFY_REDIRECT_URI', 'http://localhost:8501')
+    return env
+
+
+def run_once():
+    """Returns (wall seconds including interpreter start, result dict)"""
+    script = f"HEAVY = {HEAVY_MODULES!r}\n" + CHILD_SCRIPT
+    import time
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=child_env())
+    wall = time.perf_counter() - start
+    for line in completed.stdout.splitlines():
+        if line.startswith('RESULT '):
+            return wall, json.loads(line[len('RESULT '):])
+    raise RuntimeError(f"Cold start run failed:\n{completed.stderr[-2000:]}")
+
+
+def import_breakdown(top=15):
+    """Cumulative import time (ms) of the slowest top-level modules imported by app.py's core"""
+    code = "import core.auth_manager, core.music_advisor, core.music_knowledge_base, core.music_data_collector"
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=child_env()
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match and len(match.group(3)) <= 2:
+            rows.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time-to-login-page benchmark")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--importtime', action='store_true', help="Show the slowest imports of the core modules")
+    args = parser.parse_args(argv)
+
+    walls, renders = [], []
+    result = None
+    for _ in range(args.runs):
+        wall, result = run_once()
+        walls.append(wall)
+        renders.append(result['seconds'])
+
+    print(f"time to login page (process start -> rendered): median {statistics.median(walls):.3f} s, "
+          f"min {min(walls):.3f} s over {args.runs} runs")
+    print(f"script render (imports + AppTest run):          median {statistics.median(renders):.3f} s")
+    print(f"login page rendered: {result['login_page']}")
+    if result['exceptions']:
+        print(f"exceptions: {result['exceptions']}")
+    print(f"heavy modules loaded at login: {', '.join(result['heavy_modules']) or 'none'}")
+
+    if args.importtime:
+        print("\nslowest imports (cumulative ms):")
+        for ms, module in import_breakdown():
+            print(f"  {ms:>9.1f}  {module}")
+
+
+if __name__ == '__main__':
+    main()
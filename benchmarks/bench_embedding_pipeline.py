@@ -0,0 +1,99 @@
+"""
+Scaling of the multi-process embedding pipeline (core.embedding_pipeline)
+Ingests the documents of a synthetic library into LocalVectorStore with 1 (in-process,
+no pool), 2, 4 and 8 workers and reports wall time, documents per second and speedup
+over one worker. Worker start-up (spawn + model load) is measured separately.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_embedding_pipeline --profile xl --workers 1,2,4,8
+    python -m benchmarks.bench_embedding_pipeline --embeddings onnx --profile large
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile
+from core.embedding_pipeline import EmbeddingPipeline
+from core.local_vector_store import LocalVectorStore
+from core.music_knowledge_base import MusicKnowledgeBase
+
+
+def ingest(knowledge_base, documents, pipeline=None):
+    """Embed and upload `documents` into a fresh collection; returns seconds"""
+    store = LocalVectorStore()
+    knowledge_base._create_collection(store)
+    start = time.perf_counter()
+    if pipeline is None:
+        vectors = knowledge_base._embed_documents(documents)
+        knowledge_base._upload_documents(store, documents, vectors)
+    else:
+        pipeline.embed_and_upload(
+            documents, lambda docs, vectors: knowledge_base._upload_documents(store, docs, vectors)
+        )
+    elapsed = time.perf_counter() - start
+    collection = store.collections.get(knowledge_base.collection_name)
+    assert len(collection) == len(documents), "every document must be stored"
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding pipeline scaling benchmark")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='xl')
+    parser.add_argument('--workers', default='1,2,4,8', help="Comma-separated worker counts")
+    parser.add_argument('--embeddings', choices=('hash', 'torch', 'onnx'), default='hash',
+                        help="hash: CPU-bound stand-in, no model download")
+    parser.add_argument('--shard-size', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    # The ONNX model directory is relative to the repository; pool workers start in the temp directory
+    from core.embeddings import ONNX_MODEL_DIR
+    os.environ.setdefault('CHATIFY_ONNX_MODEL_DIR', os.path.abspath(ONNX_MODEL_DIR))
+    repo_root = os.getcwd()
+
+    # The knowledge base's user files are written relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='chatify_bench_') as workdir:
+        os.chdir(workdir)
+        try:
+            run(args)
+        finally:
+            os.chdir(repo_root)
+
+
+def run(args):
+    music_data = build_music_data(generate_raw_profile(args.profile))
+    if args.embeddings == 'hash':
+        model, model_spec = HashEmbeddings(), HashEmbeddings()
+    else:
+        from core.embeddings import get_embedding_model
+        model, model_spec = get_embedding_model(args.embeddings), args.embeddings
+    knowledge_base = MusicKnowledgeBase(user_id="bench", embedding_model=model, ingestion_mode="tracks")
+    documents = knowledge_base._create_documents(music_data)
+
+    print(f"{len(documents)} documents ({args.profile} profile, {args.embeddings} embeddings, "
+          f"{os.cpu_count()} cores)\n")
+    print(f"{'workers':>7} {'start s':>8} {'ingest s':>9} {'docs/s':>9} {'speedup':>8}")
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+        pipeline = None
+        startup = 0.0
+        if workers > 1:
+            pipeline = EmbeddingPipeline(model_spec, workers=workers, shard_size=args.shard_size)
+            start = time.perf_counter()
+            pipeline.warm_up()
+            startup = time.perf_counter() - start
+        try:
+            seconds = min(ingest(knowledge_base, documents, pipeline) for _ in range(args.repeats))
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+        baseline = baseline or seconds
+        print(f"{workers:>7} {startup:>8.2f} {seconds:>9.2f} {len(documents) / seconds:>9.0f} "
+              f"{baseline / seconds:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
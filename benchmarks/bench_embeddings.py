@@ -0,0 +1,101 @@
+"""
+Compare embedding backends: sentence-transformers (torch) vs int8 ONNX Runtime
+Reports document throughput, single-query latency and retrieval agreement
+(overlap of the top-k documents each backend retrieves for the same questions).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_embeddings --profile medium --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.run_benchmarks import summarize
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile, sample_questions
+from core.embeddings import get_embedding_model
+from core.music_knowledge_base import MusicKnowledgeBase
+
+
+def as_matrix(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def measure_backend(model, texts, questions, repeats):
+    """Returns (docs/sec, query latency samples, document matrix, question matrix)"""
+    model.embed_documents(texts[:8])  # warm-up
+
+    start = time.perf_counter()
+    doc_vectors = model.embed_documents(texts)
+    throughput = len(texts) / (time.perf_counter() - start)
+
+    latencies = []
+    question_vectors = []
+    for _ in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            vector = model.embed_query(question)
+            latencies.append(time.perf_counter() - start)
+            if len(question_vectors) < len(questions):
+                question_vectors.append(vector)
+
+    return throughput, latencies, as_matrix(doc_vectors), as_matrix(question_vectors)
+
+
+def top_k(doc_matrix, query_matrix, k):
+    scores = query_matrix @ doc_matrix.T
+    return [set(np.argsort(-row)[:k]) for row in scores]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='small')
+    parser.add_argument('--backends', default='torch,onnx', help="Comma-separated, first one is the reference")
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    music_data = build_music_data(generate_raw_profile(args.profile))
+    knowledge_base = MusicKnowledgeBase(user_id="bench", embedding_model=HashEmbeddings())
+    texts = [doc.page_content for doc in knowledge_base._create_documents(music_data)]
+    questions = sample_questions(music_data, n=args.questions)
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        model = get_embedding_model(backend)
+        load_seconds = time.perf_counter() - start
+        throughput, latencies, doc_matrix, query_matrix = measure_backend(model, texts, questions, args.repeats)
+        results[backend] = {
+            'load_s': load_seconds,
+            'throughput': throughput,
+            'latency': summarize(latencies),
+            'docs': doc_matrix,
+            'queries': query_matrix,
+        }
+
+    print(f"{len(texts)} documents, {len(questions)} questions ({args.profile} profile)\n")
+    print(f"{'backend':<8} {'load s':>8} {'docs/s':>10} {'query p50 ms':>13} {'query p95 ms':>13}")
+    for backend in backends:
+        r = results[backend]
+        print(f"{backend:<8} {r['load_s']:>8.2f} {r['throughput']:>10.1f} "
+              f"{r['latency']['p50_ms']:>13.2f} {r['latency']['p95_ms']:>13.2f}")
+
+    reference = backends[0]
+    ref = results[reference]
+    ref_top = top_k(ref['docs'], ref['queries'], args.k)
+    for backend in backends[1:]:
+        other = results[backend]
+        other_top = top_k(other['docs'], other['queries'], args.k)
+        overlap = np.mean([len(a & b) / args.k for a, b in zip(ref_top, other_top)])
+        cosine = float(np.mean(np.sum(ref['docs'] * other['docs'], axis=1)))
+        print(f"\n{backend} vs {reference}: top-{args.k} agreement {overlap:.3f}, "
+              f"mean document cosine {cosine:.4f}, speedup {other['throughput'] / ref['throughput']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Load test of one Chatify process: N concurrent users running the full flow
+Each simulated user goes through the OAuth callback (code exchanged on the fake accounts
+endpoint, then login), initialize_system, several ask turns and an update, against the
+offline stand-ins with configurable latencies: FakeSpotifyServer (Spotify), SlowVectorStore
+(Weaviate), FakeLLM behind the LLM gateway (Gemini) and HashEmbeddings.
+
+Concurrency ramps through --users. Each level reports throughput, p50/p95/p99 per stage,
+memory growth and errors; the saturation point is the last level before throughput stops
+growing. --save-baseline / --baseline catch scaling regressions (exit code 1).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_load --users 1,2,4,8,16,32 --asks 5
+    python -m benchmarks.bench_load --spotify-latency 0.05 --weaviate-latency 0.03 --llm-latency 1.5
+    python -m benchmarks.bench_load --backend            # through core.backend_service over HTTP
+    python -m benchmarks.bench_load --baseline benchmarks/load_baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+from benchmarks.fakes import FakeLLM, FakeSpotifyServer, HashEmbeddings, SlowVectorStore
+from benchmarks.run_benchmarks import compare_to_baseline, summarize
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile, sample_questions
+from core.llm_gateway import LLMGateway
+from core.local_vector_store import LocalVectorStore
+from core.session_manager import resident_memory_mb
+
+STAGES = ('oauth_callback', 'initialize', 'ask', 'update', 'flow')
+
+# A level is saturated when it adds less than this much throughput over the previous one
+SATURATION_GAIN = 0.1
+
+# Seconds between memory samples while a level runs
+MEMORY_SAMPLE_SECONDS = 0.05
+
+
+def run_user(auth, service, code, questions, think_time, timings, errors):
+    """One user's full flow; appends seconds per stage to `timings`"""
+    flow_start = time.perf_counter()
+    stage = 'oauth_callback'
+    try:
+        start = time.perf_counter()
+        token_info = auth.get_access_token(code)
+        if not token_info:
+            raise RuntimeError("token exchange failed")
+        user_id = service.login(token_info)
+        timings[stage].append(time.perf_counter() - start)
+
+        stage = 'initialize'
+        start = time.perf_counter()
+        service.initialize(user_id)
+        timings[stage].append(time.perf_counter() - start)
+
+        stage = 'ask'
+        for question in questions:
+            if think_time:
+                time.sleep(think_time)
+            start = time.perf_counter()
+            service.ask(user_id, question)
+            timings[stage].append(time.perf_counter() - start)
+
+        stage = 'update'
+        start = time.perf_counter()
+        service.update(user_id)
+        timings[stage].append(time.perf_counter() - start)
+
+        service.logout(user_id)
+        timings['flow'].append(time.perf_counter() - flow_start)
+    except Exception as e:
+        errors.append(f"{stage}: {e}")
+
+
+class MemorySampler:
+    """Peak resident memory while a level runs"""
+
+    def __init__(self):
+        self.peak_mb = resident_memory_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(MEMORY_SAMPLE_SECONDS):
+            self.peak_mb = max(self.peak_mb, resident_memory_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, resident_memory_mb())
+
+
+def run_level(auth, service, level, questions, think_time):
+    """Run `level` users at once; returns {stage: summary, '_meta': {...}}"""
+    timings = {stage: [] for stage in STAGES}
+    errors = []
+    threads = [
+        threading.Thread(target=run_user, args=(auth, service, f"load{level}_{i}", questions,
+                                                think_time, timings, errors))
+        for i in range(level)
+    ]
+    rss_before = resident_memory_mb()
+    wall_start = time.perf_counter()
+    with MemorySampler() as memory:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - wall_start
+
+    report = {stage: summarize(samples) for stage, samples in timings.items() if samples}
+    report['_meta'] = {
+        'users': level,
+        'completed': len(timings['flow']),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_s': round(wall, 3),
+        'asks_per_s': round(len(timings['ask']) / wall, 2) if wall else 0.0,
+        'flows_per_min': round(60 * len(timings['flow']) / wall, 1) if wall else 0.0,
+        'rss_before_mb': round(rss_before, 1),
+        'rss_peak_mb': round(memory.peak_mb, 1),
+        # Memory still held once every user of the level logged out
+        'rss_retained_mb': round(resident_memory_mb() - rss_before, 1),
+        'rss_per_user_mb': round((memory.peak_mb - rss_before) / level, 2),
+    }
+    return report
+
+
+def saturation_point(results):
+    """Largest level whose successor adds less than SATURATION_GAIN throughput (None if still scaling)"""
+    levels = sorted(results.values(), key=lambda r: r['_meta']['users'])
+    for previous, current in zip(levels, levels[1:]):
+        if current['_meta']['asks_per_s'] < previous['_meta']['asks_per_s'] * (1 + SATURATION_GAIN):
+            return previous['_meta']
+    return None
+
+
+def throughput_regressions(results, baseline, tolerance):
+    """Levels whose throughput fell below baseline * (1 - tolerance)"""
+    regressions = []
+    for level, report in results.items():
+        base = baseline.get(level, {}).get('_meta')
+        if not base or not base['asks_per_s']:
+            continue
+        if report['_meta']['asks_per_s'] < base['asks_per_s'] * (1 - tolerance):
+            regressions.append(
+                f"{level} users: {report['_meta']['asks_per_s']:.1f} asks/s < baseline {base['asks_per_s']:.1f}"
+            )
+    return regressions
+
+
+def print_level(report):
+    meta = report['_meta']
+    for stage in STAGES:
+        if stage not in report:
+            continue
+        s = report[stage]
+        print(f"{meta['users']:>5} {stage:<15} {s['count']:>5} {s['p50_ms']:>9.0f} {s['p95_ms']:>9.0f} "
+              f"{s['p99_ms']:>9.0f}")
+    print(f"{meta['users']:>5} {meta['completed']}/{meta['users']} flows in {meta['wall_s']:.1f}s, "
+          f"{meta['asks_per_s']:.1f} asks/s, RSS {meta['rss_before_mb']:.0f} -> peak {meta['rss_peak_mb']:.0f} MB "
+          f"({meta['rss_per_user_mb']:.1f} MB/user, {meta['rss_retained_mb']:+.1f} MB retained), "
+          f"{meta['errors']} errors")
+    if meta['first_error']:
+        print(f"      first error: {meta['first_error']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the full Chatify flow")
+    parser.add_argument('--users', default='1,2,4,8,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--asks', type=int, default=5, help="Questions per user")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Seconds before each question")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='small')
+    parser.add_argument('--spotify-latency', type=float, default=0.02, help="Seconds per Spotify request")
+    parser.add_argument('--weaviate-latency', type=float, default=0.01, help="Seconds per Weaviate call")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds per Gemini call")
+    parser.add_argument('--llm-jitter', type=float, default=0.0)
+    parser.add_argument('--embedding-latency', type=float, default=0.0, help="Seconds per embedded text")
+    parser.add_argument('--llm-concurrency', type=int, default=8, help="LLM gateway slots")
+    parser.add_argument('--backend', action='store_true',
+                        help="Go through core.backend_service over HTTP instead of calling the service")
+    parser.add_argument('--workers', type=int, default=None, help="Backend worker pool size (--backend)")
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help="p95 ask latency target")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--baseline', help="Compare against this JSON report")
+    parser.add_argument('--save-baseline', help="Write the report as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's progress output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # spotipy deprecates the as_dict=True the app passes, once per callback
+    warnings.simplefilter('ignore', DeprecationWarning)
+    # The OAuth client needs credentials, never used against the real accounts service
+    for name in ('SPOTIFY_CLIENT_ID', 'SPOTIFY_CLIENT_SECRET'):
+        os.environ.setdefault(name, 'load-test')
+    os.environ.setdefault('SPOTIFY_REDIRECT_URI', 'http://127.0.0.1:8501/callback')
+
+    from core.auth_manager import AuthManager
+    from core.backend_client import BackendClient
+    from core.backend_service import BackendServer
+    from core.chatify_service import ChatifyService
+
+    raw = generate_raw_profile(args.profile)
+    questions = sample_questions(build_music_data(raw), n=args.asks)
+    levels = [int(u) for u in args.users.split(',') if u.strip()]
+    auth = AuthManager()
+    service = ChatifyService(
+        oauth=auth.sp_oauth,
+        vector_client=SlowVectorStore(LocalVectorStore(), args.weaviate_latency),
+        embedding_model=HashEmbeddings(latency=args.embedding_latency),
+        llm=LLMGateway(FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter), concurrency=args.llm_concurrency)
+    )
+
+    print(f"{args.profile} profile, {args.asks} asks per user, {os.cpu_count()} cores, latencies: "
+          f"Spotify {args.spotify_latency * 1000:.0f} ms, Weaviate {args.weaviate_latency * 1000:.0f} ms, "
+          f"LLM {args.llm_latency * 1000:.0f} ms ({'backend over HTTP' if args.backend else 'in-process'})\n")
+    print(f"{'users':>5} {'stage':<15} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    results = {}
+    repo_root = os.getcwd()
+    # User caches and play logs are written relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='chatify_load_') as workdir:
+        os.chdir(workdir)
+        try:
+            with FakeSpotifyServer(raw, latency=args.spotify_latency, per_token_users=True) as spotify, \
+                    (BackendServer(service, host='127.0.0.1', port=0, workers=args.workers)
+                     if args.backend else contextlib.nullcontext()) as backend:
+                os.environ['SPOTIFY_API_PREFIX'] = spotify.api_prefix
+                auth.sp_oauth.OAUTH_TOKEN_URL = spotify.token_url
+                target = BackendClient(backend.url) if backend else service
+                for level in levels:
+                    with open(os.devnull, 'w') as devnull, \
+                            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+                        results[str(level)] = run_level(auth, target, level, questions, args.think_time)
+                    print_level(results[str(level)])
+        finally:
+            os.chdir(repo_root)
+
+    saturated = saturation_point(results)
+    if saturated:
+        print(f"\nsaturation: {saturated['users']} users ({saturated['asks_per_s']:.1f} asks/s); "
+              f"more users only add latency")
+    else:
+        print(f"\nsaturation: not reached, throughput still grows at {levels[-1]} users")
+    within_slo = [int(level) for level, r in results.items()
+                  if not r['_meta']['errors'] and r.get('ask', {}).get('p95_ms', float('inf')) <= args.slo_ms]
+    print(f"largest level with p95 ask <= {args.slo_ms:.0f} ms: {max(within_slo, default=0)} users")
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = (compare_to_baseline(results, baseline, args.tolerance)
+                       + throughput_regressions(results, baseline, args.tolerance))
+        if regressions:
+            print("\nREGRESSIONS:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Streamlit rerun latency against chat history length
+Renders the logged-in page of app.py with Streamlit's AppTest (as a thin client of a
+stand-in backend), with paginated history (CHATIFY_CHAT_PAGE_SIZE) and with every
+message rendered.
+AppTest always reruns the whole script, so chat submits here are an upper bound:
+in the browser they only rerun the chat fragment.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_rerun --history 0,50,200,1000 --runs 5
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.fakes import FakeLLM
+from core.backend_client import BackendClient
+from core.backend_service import BackendServer
+
+ANSWER = (
+    "Based on your **top artists** you could try:\n\n"
+    "- *Song A* by Artist A, similar energy to your favourites\n"
+    "- *Song B* by Artist B, from a genre you play a lot lately\n\n"
+    "You have been listening to a lot of indie rock this month. " * 3
+)
+
+
+class BenchService:
+    """Minimal ChatifyService stand-in: the benchmark measures rendering, not retrieval"""
+
+    def __init__(self):
+        self.llm = FakeLLM(latency=0.0, answer_words=120)
+
+    def login(self, token_info):
+        return 'bench'
+
+    def ask(self, user_id, question):
+        return self.llm.invoke(ANSWER + question).content
+
+    def logout(self, user_id):
+        pass
+
+    def active_users(self):
+        return 1
+
+    def hydrated_users(self):
+        return 1
+
+
+def make_app(history_length, client):
+    from streamlit.logger import get_logger
+    from streamlit.testing.v1 import AppTest
+
+    # AppTest warns about a missing ScriptRunContext when session_state is seeded
+    get_logger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel('ERROR')
+
+    at = AppTest.from_file('app.py', default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['data_loaded'] = True
+    at.session_state['user_id'] = 'bench'
+    at.session_state['backend_client'] = client
+    at.session_state['music_data'] = {
+        'user_profile': {'id': 'bench', 'display_name': 'Bench'},
+        'top_artists': [{'name': 'Artist A'}, {'name': 'Artist B'}, {'name': 'Artist C'}],
+    }
+    at.session_state['messages'] = [
+        {'role': 'user', 'content': f"Question {i}: what should I listen to?"} if i % 2 == 0
+        else {'role': 'assistant', 'content': ANSWER}
+        for i in range(history_length)
+    ]
+    return at
+
+
+def measure(history_length, runs, client):
+    """Median seconds of a plain rerun and of a chat submit"""
+    at = make_app(history_length, client)
+    at.run()
+    reruns, submits = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        at.chat_input[0].set_value("Recommend something new").run()
+        submits.append(time.perf_counter() - start)
+        # Keep the history length constant between runs
+        del at.session_state['messages'][-2:]
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return statistics.median(reruns), statistics.median(submits), len(at.chat_message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rerun latency vs chat history length")
+    parser.add_argument('--history', default='0,50,200,1000', help="Comma-separated message counts")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('SPOTIFY_CLIENT_ID', 'bench-client-id')
+    os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'bench-client-secret')
+    os.environ.setdefault('SPOTIFY_REDIRECT_URI', 'http://localhost:8501')
+
+    print(f"{'history':>8} {'mode':<10} {'shown':>9} {'rerun ms':>9} {'submit ms':>10}")
+    with BackendServer(BenchService(), host='127.0.0.1', port=0) as backend:
+        os.environ['CHATIFY_BACKEND_URL'] = backend.url
+        # Handed to the app as its browser session's client, with this login's token
+        client = BackendClient(backend.url)
+        client.login({'access_token': 'bench'})
+        for history_length in [int(h) for h in args.history.split(',') if h.strip()]:
+            for mode, page_size in (('paginated', args.page_size), ('all', 0)):
+                os.environ['CHATIFY_CHAT_PAGE_SIZE'] = str(page_size)
+                rerun, submit, rendered = measure(history_length, args.runs, client)
+                print(f"{history_length:>8} {mode:<10} {rendered:>9} {rerun * 1000:>9.1f} {submit * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Retrieval quality vs latency: which k, distance cutoff and type filter to use
+Builds the knowledge base of a synthetic profile in LocalVectorStore and a golden set of
+questions about artists, songs, albums, genres and playlists of that profile, each with
+its expected documents. Every setting (ingestion mode x pipeline x k x max distance x
+filter) is scored on:
+- recall@k: expected documents retrieved / min(expected, k)
+- hit rate: questions with at least one expected document retrieved
+- prompt tokens: size of the chat prompt built from the results (~4 characters per token)
+- retrieval and end-to-end latency; the LLM call is modeled from the prompt size
+  (--llm-base-ms + --llm-ms-per-1k-tokens) instead of slept, so large sweeps stay fast
+The "advisor" pipeline is MusicAdvisor._search (entity lookup, vector search, drill-down),
+"vector" is plain knowledge_base.search. The fastest setting per mode and pipeline with
+recall@k >= --min-recall is printed as the recommended default.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_retrieval --profile medium
+    python -m benchmarks.bench_retrieval --ingestion rollup --k 5,10,15,25 --max-distance none,0.6
+    python -m benchmarks.bench_retrieval --embeddings onnx --output retrieval.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakes import FakeLLM, HashEmbeddings
+from benchmarks.run_benchmarks import percentile
+from benchmarks.synthetic import GENRES, PROFILE_SIZES, build_music_data, generate_raw_profile
+from core.local_vector_store import LocalVectorStore
+from core.music_advisor import MusicAdvisor
+from core.music_knowledge_base import MusicKnowledgeBase
+
+SONG_TYPES = {'saved_track', 'top_track', 'track'}
+
+# Document types searched by each --filters preset (None: every type)
+FILTERS = {
+    'all': lambda types: None,
+    'no_playlists': lambda types: sorted(types - {'playlist_tracks'}),
+    'no_songs': lambda types: sorted(types - SONG_TYPES),
+}
+
+
+def golden_set(music_data, per_kind=10, seed=11):
+    """
+    Questions with a predicate selecting their expected documents
+    Returns: List of (kind, question, is_expected(document))
+    """
+    rng = random.Random(seed)
+    artists = sorted({a['name'] for a in music_data['top_artists']})
+    tracks = sorted({t['name'] for t in music_data['saved_tracks']})
+    albums = sorted({t['album'] for t in music_data['saved_tracks'] if t.get('album')})
+    genres = sorted({g for a in music_data['artists_info'].values() for g in a.get('genres', [])} & set(GENRES))
+    playlists = sorted({p['name'] for p in music_data['playlists']})
+
+    def pick(names):
+        return rng.sample(names, min(per_kind, len(names)))
+
+    questions = []
+    for artist in pick(artists):
+        questions.append(('artist', f"What do you think about {artist}?",
+                          lambda doc, a=artist: doc.metadata.get('artist_name') == a))
+    for track in pick(tracks):
+        questions.append(('song', f"Is {track} one of my favorite songs?",
+                          lambda doc, t=track: doc.metadata.get('track_name') == t))
+    for album in pick(albums):
+        questions.append(('album', f"Which songs of the album {album} do I have?",
+                          lambda doc, a=album: doc.metadata.get('album_name') == a))
+    for genre in pick(genres):
+        questions.append(('genre', f"Which of my artists play {genre}?",
+                          lambda doc, g=genre: g in _genres(doc)))
+    for playlist in pick(playlists):
+        questions.append(('playlist', f"What kind of music is in my playlist {playlist}?",
+                          lambda doc, p=playlist: doc.page_content.startswith(f"PLAYLIST: {p} (")))
+    return questions
+
+
+def _genres(doc):
+    """Genres listed in an artist document"""
+    if doc.metadata.get('type') not in ('artist', 'artist_rollup'):
+        return []
+    for line in doc.page_content.splitlines():
+        if line.startswith("Genres: "):
+            return line[len("Genres: "):].split(', ')
+    return []
+
+
+def _key(doc):
+    return doc.metadata.get('type'), doc.page_content
+
+
+def build(mode, music_data, embeddings):
+    """Knowledge base, advisor and every document of one ingestion mode"""
+    user_id = music_data['user_profile']['id']
+    knowledge_base = MusicKnowledgeBase(
+        user_id=user_id, embedding_model=embeddings, client=LocalVectorStore(), ingestion_mode=mode
+    )
+    documents = knowledge_base._create_documents(music_data)
+    if not any(doc.metadata.get('type') == 'playlist_tracks' for doc in documents):
+        # Rollup mode adds playlists after the background playlist sync
+        documents += knowledge_base._create_playlist_documents(music_data)
+    knowledge_base._create_collection(knowledge_base._get_weaviate_client())
+    knowledge_base._add_documents_to_collection(knowledge_base._get_weaviate_client(), documents)
+    knowledge_base._update_cache()
+    knowledge_base.save_entity_index(music_data)
+    advisor = MusicAdvisor(knowledge_base, music_data, session=None, llm=FakeLLM(latency=0))
+    return knowledge_base, advisor, documents
+
+
+def evaluate(knowledge_base, advisor, pipeline, questions, expected, k, max_distance, types, args):
+    """Score one setting over the golden set"""
+    knowledge_base.search_limit = k
+    knowledge_base.search_max_distance = max_distance
+    knowledge_base.search_types = types
+
+    recalls, hits, tokens, retrieval, end_to_end = [], [], [], [], []
+    for (kind, question, _), relevant in zip(questions, expected):
+        start = time.perf_counter()
+        if pipeline == 'advisor':
+            results = advisor._search(question)
+        else:
+            results = knowledge_base.search(question, k=k, max_distance=max_distance, types=types)
+        info = ''.join(f"\n{doc.page_content}\n" for doc in results) or "No specific information"
+        prompt = advisor._build_prompt(question, info, "")
+        seconds = time.perf_counter() - start
+
+        found = len(relevant & {_key(doc) for doc in results})
+        recalls.append(min(1.0, found / min(len(relevant), k)) if relevant else 1.0)
+        hits.append(found > 0)
+        prompt_tokens = len(prompt) // 4
+        tokens.append(prompt_tokens)
+        retrieval.append(seconds * 1000)
+        end_to_end.append(seconds * 1000 + args.llm_base_ms + prompt_tokens / 1000 * args.llm_ms_per_1k_tokens)
+
+    return {
+        'recall': round(statistics.fmean(recalls), 3),
+        'hit_rate': round(statistics.fmean(hits), 3),
+        'prompt_tokens_p50': int(percentile(tokens, 50)),
+        'retrieval_p50_ms': round(percentile(retrieval, 50), 2),
+        'e2e_p50_ms': round(percentile(end_to_end, 50), 1),
+        'e2e_p95_ms': round(percentile(end_to_end, 95), 1),
+        'recall_by_kind': {
+            kind: round(statistics.fmean(r for (q_kind, _, _), r in zip(questions, recalls) if q_kind == kind), 3)
+            for kind in sorted({q[0] for q in questions})
+        },
+    }
+
+
+def parse_list(text, cast):
+    return [None if item.strip().lower() == 'none' else cast(item) for item in text.split(',') if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency benchmark")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='medium')
+    parser.add_argument('--embeddings', choices=('hash', 'torch', 'onnx'), default='hash')
+    parser.add_argument('--ingestion', default='tracks,rollup', help="Comma-separated ingestion modes")
+    parser.add_argument('--pipelines', default='advisor,vector')
+    parser.add_argument('--k', default='5,10,15,25,50')
+    parser.add_argument('--max-distance', default='none,0.9,0.8',
+                        help="Cosine distance cutoffs (none: no cutoff); useful values depend on the embedding model")
+    parser.add_argument('--filters', default=','.join(FILTERS), help=f"Presets: {', '.join(FILTERS)}")
+    parser.add_argument('--questions-per-kind', type=int, default=10)
+    parser.add_argument('--llm-base-ms', type=float, default=500.0, help="Modeled LLM time of an empty prompt")
+    parser.add_argument('--llm-ms-per-1k-tokens', type=float, default=100.0, help="Modeled prefill cost")
+    parser.add_argument('--min-recall', type=float, default=0.8, help="Quality bar for the recommendation")
+    parser.add_argument('--output', help="Write every setting's scores as JSON")
+    args = parser.parse_args(argv)
+
+    if args.embeddings == 'hash':
+        embeddings = HashEmbeddings()
+    else:
+        from core.embeddings import get_embedding_model
+        embeddings = get_embedding_model(args.embeddings)
+    music_data = build_music_data(generate_raw_profile(args.profile))
+    questions = golden_set(music_data, per_kind=args.questions_per_kind)
+
+    repo_root = os.getcwd()
+    results = []
+    # Collection caches and entity indexes are written relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='chatify_retrieval_') as workdir:
+        os.chdir(workdir)
+        try:
+            for mode in [m.strip() for m in args.ingestion.split(',') if m.strip()]:
+                knowledge_base, advisor, documents = build(mode, music_data, embeddings)
+                expected = [{_key(doc) for doc in documents if is_expected(doc)} for _, _, is_expected in questions]
+                types = {doc.metadata['type'] for doc in documents if doc.metadata.get('indexed', True)}
+                print(f"\n{mode} ingestion: {len(documents)} documents, {len(questions)} golden questions "
+                      f"({args.profile} profile, {args.embeddings} embeddings)")
+                print(f"{'pipeline':<8} {'k':>3} {'maxdist':>7} {'filter':<12} {'recall':>6} {'hit':>5} "
+                      f"{'tokens':>6} {'retr ms':>7} {'e2e p50':>7} {'e2e p95':>7}")
+                grid = itertools.product(
+                    [p.strip() for p in args.pipelines.split(',') if p.strip()],
+                    parse_list(args.k, int), parse_list(args.max_distance, float),
+                    [f.strip() for f in args.filters.split(',') if f.strip()]
+                )
+                for pipeline, k, max_distance, filter_name in grid:
+                    scores = evaluate(knowledge_base, advisor, pipeline, questions, expected, k, max_distance,
+                                      FILTERS[filter_name](types), args)
+                    scores.update(mode=mode, pipeline=pipeline, k=k, max_distance=max_distance, filter=filter_name)
+                    results.append(scores)
+                    distance = '-' if max_distance is None else f"{max_distance:g}"
+                    print(f"{pipeline:<8} {k:>3} {distance:>7} {filter_name:<12} {scores['recall']:>6.2f} "
+                          f"{scores['hit_rate']:>5.2f} {scores['prompt_tokens_p50']:>6} "
+                          f"{scores['retrieval_p50_ms']:>7.2f} {scores['e2e_p50_ms']:>7.0f} {scores['e2e_p95_ms']:>7.0f}")
+        finally:
+            os.chdir(repo_root)
+
+    print(f"\nFastest setting with recall@k >= {args.min_recall:g}:")
+    for mode, pipeline in sorted({(r['mode'], r['pipeline']) for r in results}):
+        candidates = [r for r in results if r['mode'] == mode and r['pipeline'] == pipeline
+                      and r['recall'] >= args.min_recall]
+        if not candidates:
+            print(f"  {mode}/{pipeline}: none reaches the quality bar")
+            continue
+        best = min(candidates, key=lambda r: (r['e2e_p50_ms'], -r['recall']))
+        print(f"  {mode}/{pipeline}: k={best['k']}, max distance {best['max_distance']}, filter {best['filter']} "
+              f"(recall {best['recall']:.2f}, {best['prompt_tokens_p50']} prompt tokens, "
+              f"e2e p50 {best['e2e_p50_ms']:.0f} ms) by kind: {best['recall_by_kind']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
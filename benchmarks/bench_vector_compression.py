@@ -0,0 +1,85 @@
+"""
+Vector compression benchmark for per-user indexes
+For each mode (none, float16, int8, pq) reports in-memory vector bytes per user,
+recall@k against exact float32 search, and query latency.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_vector_compression --profile large --k 10
+    python -m benchmarks.bench_vector_compression --profile medium --embeddings onnx
+"""
+import argparse
+import time
+
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.run_benchmarks import summarize
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile, sample_questions
+from core.local_vector_store import LocalVectorStore
+from core.music_knowledge_base import MusicKnowledgeBase
+
+MODES = ('none', 'float16', 'int8', 'pq')
+
+
+def build_collection(mode, knowledge_base, documents, vectors):
+    store = LocalVectorStore(compression=mode)
+    knowledge_base._create_collection(store)
+    knowledge_base._upload_documents(store, documents, vectors)
+    collection = store.collections.get(knowledge_base.collection_name)
+    collection.train()
+    return store, collection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vector compression benchmark")
+    parser.add_argument('--profile', choices=sorted(PROFILE_SIZES), default='medium')
+    parser.add_argument('--embeddings', choices=('hash', 'torch', 'onnx'), default='hash')
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args(argv)
+
+    if args.embeddings == 'hash':
+        embeddings = HashEmbeddings()
+    else:
+        from core.embeddings import get_embedding_model
+        embeddings = get_embedding_model(args.embeddings)
+
+    music_data = build_music_data(generate_raw_profile(args.profile))
+    knowledge_base = MusicKnowledgeBase(user_id="bench", embedding_model=embeddings)
+    documents = knowledge_base._create_documents(music_data)
+    vectors = knowledge_base._embed_documents(documents)
+    questions = sample_questions(music_data, n=args.questions)
+    query_vectors = [embeddings.embed_query(q) for q in questions]
+
+    exact = None
+    print(f"{len(documents)} documents, {len(questions)} queries, k={args.k} ({args.profile} profile)\n")
+    print(f"{'mode':<8} {'build s':>8} {'KB/user':>10} {'ratio':>7} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+
+    baseline_bytes = None
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        start = time.perf_counter()
+        store, collection = build_collection(mode, knowledge_base, documents, vectors)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        results = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            response = collection.query.near_vector(near_vector=vector, limit=args.k)
+            latencies.append(time.perf_counter() - start)
+            # uuids differ between stores, compare by content instead
+            results.append({obj.properties['content'] for obj in response.objects})
+
+        if exact is None:
+            exact = results
+        recall = sum(len(r & e) for r, e in zip(results, exact)) / (len(exact) * args.k)
+
+        memory = collection.memory_bytes()
+        baseline_bytes = baseline_bytes or memory
+        stats = summarize(latencies)
+        print(f"{mode:<8} {build_seconds:>8.2f} {memory / 1024:>10.1f} {baseline_bytes / max(memory, 1):>6.1f}x "
+              f"{recall:>9.3f} {stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f}")
+        store.collections.delete(knowledge_base.collection_name)
+
+
+if __name__ == '__main__':
+    main()
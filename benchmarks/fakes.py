@@ -0,0 +1,305 @@
+"""
+Offline stand-ins for the cloud services Chatify talks to
+- FakeSpotifyServer: local HTTP server speaking the subset of the Web API we use (and the token endpoint)
+- FakeLLM: Gemini stand-in with configurable latency
+- HashEmbeddings: deterministic feature-hashing embeddings (no model download)
+The Weaviate stand-in is core.local_vector_store.LocalVectorStore; SlowVectorStore adds
+a network round trip to its calls.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from core.play_history import parse_played_at
+
+
+class FakeSpotifyServer:
+    """
+    Serve a synthetic profile (see benchmarks.synthetic) over HTTP
+    Set SPOTIFY_API_PREFIX to `server.api_prefix` so SpotifyClient talks to it.
+    Args:
+        per_token_users: Report each access token as a different user (same library),
+                         to simulate many users in load tests
+    """
+
+    def __init__(self, raw_profile, latency=0.0, jitter=0.0, host='127.0.0.1', port=0, per_token_users=False):
+        self.raw = raw_profile
+        self.per_token_users = per_token_users
+        self.latency = latency
+        self.jitter = jitter
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._artists = {a['id']: a for a in raw_profile['artists']}
+        self._playlists = {pl['id']: pl for pl in raw_profile['playlists']}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_prefix(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    @property
+    def token_url(self):
+        """Stand-in for SpotifyOAuth.OAUTH_TOKEN_URL"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/token"
+
+    @staticmethod
+    def token(form):
+        """
+        Token response of the OAuth token endpoint
+        The access token of an authorization code is the code itself, so with
+        per_token_users each code logs in a different user.
+        """
+        if form.get('grant_type') == 'refresh_token':
+            access_token = form.get('refresh_token', '').replace('refresh_', '', 1)
+        else:
+            access_token = form.get('code', '')
+        if not access_token:
+            return 400, {'error': 'invalid_grant'}
+        return 200, {
+            'access_token': access_token,
+            'token_type': 'Bearer',
+            'expires_in': 3600,
+            'refresh_token': f"refresh_{access_token}",
+            'scope': form.get('scope', ''),
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @staticmethod
+    def _page(items, limit, offset, url):
+        page = items[offset:offset + limit]
+        next_url = f"{url}?offset={offset + limit}&limit={limit}" if offset + limit < len(items) else None
+        return {'items': page, 'total': len(items), 'limit': limit, 'offset': offset, 'next': next_url}
+
+    def route(self, path, params, token=None):
+        """Return (status, payload) for a GET request path under /v1/"""
+        limit = int(params.get('limit', 20))
+        offset = int(params.get('offset', 0))
+        url = self.api_prefix + path
+
+        if path == 'me':
+            if self.per_token_users and token:
+                return 200, dict(self.raw['profile'], id=token)
+            return 200, self.raw['profile']
+        if path == 'me/top/artists':
+            return 200, self._page(self.raw['top_artists'], limit, offset, url)
+        if path == 'me/top/tracks':
+            return 200, self._page(self.raw['top_tracks'], limit, offset, url)
+        if path == 'me/tracks':
+            items = [{'added_at': '2024-01-01T00:00:00Z', 'track': t} for t in self.raw['saved_tracks']]
+            return 200, self._page(items, limit, offset, url)
+        if path == 'me/playlists':
+            items = [
+                {'id': pl['id'], 'name': pl['name'], 'snapshot_id': pl['snapshot_id'],
+                 'tracks': {'total': len(pl['tracks'])}}
+                for pl in self.raw['playlists']
+            ]
+            return 200, self._page(items, limit, offset, url)
+        if path == 'me/player/recently-played':
+            after = int(params['after']) if params.get('after') else None
+            plays = sorted(self.raw['recently_played'], key=lambda p: p['played_at'], reverse=True)
+            if after is not None:
+                plays = [p for p in plays if parse_played_at(p['played_at']) > after]
+            plays = plays[:limit]
+            cursors = None
+            if plays:
+                stamps = [parse_played_at(p['played_at']) for p in plays]
+                cursors = {'after': str(max(stamps)), 'before': str(min(stamps))}
+            return 200, {'items': plays, 'cursors': cursors, 'limit': limit, 'next': None}
+
+        match = re.fullmatch(r'playlists/([^/]+)/(tracks|items)', path)
+        if match and match.group(1) in self._playlists:
+            items = [{'track': t} for t in self._playlists[match.group(1)]['tracks']]
+            return 200, self._page(items, limit, offset, url)
+
+        match = re.fullmatch(r'artists/([^/]+)', path)
+        if match and match.group(1) in self._artists:
+            return 200, self._artists[match.group(1)]
+        if path == 'artists' and params.get('ids'):
+            ids = params['ids'].split(',')
+            return 200, {'artists': [self._artists.get(i) for i in ids]}
+
+        return 404, {'error': {'status': 404, 'message': f"Unknown endpoint: {path}"}}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _wait(self):
+                delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                with server._lock:
+                    server.request_count += 1
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                path = parsed.path.strip('/')
+                if path.startswith('v1/'):
+                    path = path[3:]
+
+                self._wait()
+                token = self.headers.get('Authorization', '').replace('Bearer ', '', 1) or None
+                self._send(*server.route(path, params, token))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = {k: v[-1] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                self._wait()
+                if urlparse(self.path).path.strip('/') == 'api/token':
+                    self._send(*server.token(form))
+                else:
+                    self._send(404, {'error': {'status': 404, 'message': f"Unknown endpoint: {self.path}"}})
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakeLLM:
+    """
+    Stand-in for ChatGoogleGenerativeAI: invoke(prompt) -> message with .content
+    Args:
+        latency: Base seconds per call
+        jitter: Extra random seconds (uniform 0..jitter)
+        answer_words: Length of the generated answer
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, answer_words=150, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.answer_words = answer_words
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        words = re.findall(r"\w+", prompt)[-self.answer_words:] or ['ok']
+        content = ' '.join(words)
+        return SimpleNamespace(
+            content=content,
+            usage_metadata={
+                'input_tokens': max(1, len(prompt) // 4),
+                'output_tokens': max(1, len(content) // 4),
+            }
+        )
+
+
+class HashEmbeddings:
+    """
+    Deterministic bag-of-words embeddings via feature hashing
+    Texts sharing words get similar vectors, so retrieval benchmarks stay meaningful.
+    Args:
+        dim: Vector size (384 matches all-MiniLM-L6-v2)
+        latency: Optional seconds per text, to mimic model cost
+    """
+
+    def __init__(self, dim=384, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            for i in range(0, 6, 2):
+                index = int.from_bytes(digest[i:i + 2], 'little') % self.dim
+                vector[index] += 1.0 if digest[i + 6] & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        if self.latency:
+            time.sleep(self.latency)
+        return [v / norm for v in vector]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+
+class SlowVectorStore:
+    """
+    LocalVectorStore with the round trip of a remote Weaviate cluster
+    Every call that would go over the network (collection lookups and schema changes,
+    queries, inserts, batch flushes) sleeps `latency` seconds first; everything else is
+    passed through to the wrapped object.
+    Args:
+        store: LocalVectorStore (or any object from it: collection, query, batch)
+        latency: Seconds per remote call
+    """
+
+    REMOTE_CALLS = {
+        'exists', 'create', 'delete', 'list_all', 'near_vector', 'fetch_objects',
+        'insert', 'insert_many', 'delete_many', 'over_all',
+    }
+
+    def __init__(self, store, latency=0.0):
+        self._target = store
+        self._latency = latency
+
+    def _wrap(self, value):
+        if type(value).__module__ == 'core.local_vector_store':
+            return SlowVectorStore(value, self._latency)
+        return value
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return self._wrap(value)
+
+        def call(*args, **kwargs):
+            if self._latency and name in self.REMOTE_CALLS:
+                time.sleep(self._latency)
+            return self._wrap(value(*args, **kwargs))
+
+        return call
+
+    def __len__(self):
+        return len(self._target)
+
+    def __enter__(self):
+        return self._wrap(self._target.__enter__())
+
+    def __exit__(self, exc_type, exc, tb):
+        # Leaving a batch context flushes it
+        if self._latency:
+            time.sleep(self._latency)
+        return self._target.__exit__(exc_type, exc, tb)
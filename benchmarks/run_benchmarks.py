@@ -0,0 +1,258 @@
+"""
+Chatify benchmark harness
+Runs the hot paths (collect, build_documents, embed, upload, search, ask)
+fully offline against a fake Spotify server, LocalVectorStore and FakeLLM,
+then reports per-stage latency percentiles and memory.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --profile medium --iterations 5
+    python -m benchmarks.run_benchmarks --profile small --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --profile small --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from benchmarks.fakes import FakeLLM, FakeSpotifyServer, HashEmbeddings
+from benchmarks.synthetic import PROFILE_SIZES, build_music_data, generate_raw_profile, sample_questions
+from core.local_vector_store import LocalVectorStore
+from core.music_advisor import MusicAdvisor
+from core.music_data_collector import MusicDataCollector
+from core.music_knowledge_base import MusicKnowledgeBase
+
+STAGES = ('collect', 'build_documents', 'embed', 'upload', 'search', 'ask')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary (milliseconds) for a list of seconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def max_rss_mb():
+    """Peak resident set size of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class StageRecorder:
+    """Collects latency samples and (optionally) traced peak allocations per stage"""
+
+    def __init__(self, trace_memory=False):
+        self.samples = {}
+        self.peak_alloc = {}
+        self.trace_memory = trace_memory
+
+    @contextmanager
+    def measure(self, stage):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.samples.setdefault(stage, []).append(elapsed)
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.peak_alloc[stage] = max(self.peak_alloc.get(stage, 0), peak)
+
+    def report(self):
+        report = {}
+        for stage in STAGES:
+            if stage not in self.samples:
+                continue
+            report[stage] = summarize(self.samples[stage])
+            if stage in self.peak_alloc:
+                report[stage]['peak_alloc_mb'] = round(self.peak_alloc[stage] / (1024 * 1024), 3)
+        return report
+
+
+def make_embeddings(kind):
+    if kind == 'hash':
+        return HashEmbeddings()
+    from core.embeddings import get_embedding_model
+    return get_embedding_model(kind)
+
+
+def run_profile(size, args):
+    """Run every stage for one synthetic profile and return its report"""
+    recorder = StageRecorder(trace_memory=args.trace_memory)
+    raw = generate_raw_profile(size, seed=args.seed)
+    music_data = build_music_data(raw)
+    questions = sample_questions(music_data, n=args.questions, seed=args.seed)
+    user_id = music_data['user_profile']['id']
+
+    embeddings = make_embeddings(args.embeddings)
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter)
+    store = LocalVectorStore()
+    knowledge_base = MusicKnowledgeBase(
+        user_id=user_id, embedding_model=embeddings, client=store, ingestion_mode=args.ingestion
+    )
+    token_info = {'access_token': 'benchmark-token'}
+
+    with FakeSpotifyServer(raw, latency=args.spotify_latency) as server:
+        os.environ['SPOTIFY_API_PREFIX'] = server.api_prefix
+        for _ in range(args.iterations if args.collect else 0):
+            with recorder.measure('collect'):
+                collector = MusicDataCollector(token_info)
+                collector.collect_all_data(include_playlist_tracks=True)
+
+    for _ in range(args.iterations):
+        with recorder.measure('build_documents'):
+            documents = knowledge_base._create_documents(music_data)
+
+        with recorder.measure('embed'):
+            vectors = knowledge_base._embed_documents(documents)
+
+        if store.collections.exists(knowledge_base.collection_name):
+            store.collections.delete(knowledge_base.collection_name)
+        with recorder.measure('upload'):
+            knowledge_base._create_collection(store)
+            knowledge_base._upload_documents(store, documents, vectors)
+        knowledge_base._update_cache()
+
+    for question in questions:
+        with recorder.measure('search'):
+            knowledge_base.search(question, k=args.k or knowledge_base.search_limit)
+
+    advisor = MusicAdvisor(knowledge_base, music_data, session=None, llm=llm)
+    for question in questions:
+        with recorder.measure('ask'):
+            advisor.ask(question)
+
+    report = recorder.report()
+    report['_meta'] = {
+        'library_tracks': len(music_data['saved_tracks']),
+        'documents': len(documents),
+        'vectors': sum(vector is not None for vector in vectors),
+        'max_rss_mb': round(max_rss_mb(), 1),
+    }
+    return report
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of regression messages (p50/p95 above baseline * (1 + tolerance))"""
+    regressions = []
+    for profile, stages in results.items():
+        for stage, stats in stages.items():
+            if stage.startswith('_'):
+                continue
+            base = baseline.get(profile, {}).get(stage)
+            if not base:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                limit = base[key] * (1 + tolerance)
+                if stats[key] > limit and stats[key] - base[key] > 1.0:
+                    regressions.append(
+                        f"{profile}/{stage} {key}: {stats[key]:.1f} ms > baseline {base[key]:.1f} ms "
+                        f"(+{(stats[key] / base[key] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def print_report(results):
+    header = f"{'profile':<8} {'stage':<16} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'alloc MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for profile, stages in results.items():
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            s = stages[stage]
+            alloc = f"{s['peak_alloc_mb']:.2f}" if 'peak_alloc_mb' in s else '-'
+            print(f"{profile:<8} {stage:<16} {s['count']:>5} {s['p50_ms']:>10.2f} "
+                  f"{s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} {alloc:>9}")
+        meta = stages['_meta']
+        print(f"{profile:<8} {meta['library_tracks']} tracks, {meta['documents']} documents, "
+              f"{meta.get('vectors', meta['documents'])} vectors, "
+              f"max RSS {meta['max_rss_mb']} MB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of Chatify's hot paths")
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILE_SIZES),
+                        help="Synthetic profile size (repeatable, default: small)")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--k', type=int, default=None,
+                        help="Documents retrieved per search (default: the ingestion mode's search limit)")
+    parser.add_argument('--ingestion', choices=('tracks', 'rollup'), default=None,
+                        help="Document layout (default: CHATIFY_INGESTION_MODE)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--embeddings', choices=('hash', 'torch', 'onnx'), default='hash',
+                        help="hash (no model), torch (sentence-transformers) or onnx (int8 ONNX Runtime)")
+    parser.add_argument('--spotify-latency', type=float, default=0.0, help="Seconds per fake Spotify request")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument('--llm-jitter', type=float, default=0.0)
+    parser.add_argument('--no-collect', dest='collect', action='store_false',
+                        help="Skip the collection stage (slow for large profiles)")
+    parser.add_argument('--trace-memory', action='store_true', help="Record tracemalloc peaks per stage")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--baseline', help="Compare against this JSON report")
+    parser.add_argument('--save-baseline', help="Write the report as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiles = args.profile or ['small']
+    repo_root = os.getcwd()
+
+    # Cache files and play logs are written relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='chatify_bench_') as workdir:
+        os.chdir(workdir)
+        try:
+            results = {size: run_profile(size, args) for size in profiles}
+        finally:
+            os.chdir(repo_root)
+
+    print_report(results)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
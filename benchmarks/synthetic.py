@@ -0,0 +1,167 @@
+"""
+Synthetic Spotify profiles for benchmarks
+Generates raw Spotify API objects (served by FakeSpotifyServer) and the
+equivalent music_data dict produced by MusicDataCollector.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+# Number of library tracks per profile size
+PROFILE_SIZES = {
+    'small': 100,
+    'medium': 1000,
+    'large': 5000,
+    'xl': 10000,
+}
+
+GENRES = [
+    'pop', 'rock', 'indie rock', 'hip hop', 'trap', 'reggaeton', 'latin pop', 'salsa',
+    'cumbia', 'jazz', 'bossa nova', 'techno', 'house', 'drum and bass', 'metal',
+    'punk', 'folk', 'r&b', 'soul', 'funk', 'k-pop', 'classical', 'lo-fi', 'ambient'
+]
+
+SYLLABLES = [
+    'la', 'mo', 'ri', 'sa', 'ven', 'tor', 'ka', 'lu', 'mi', 'no', 'zar', 'el',
+    'do', 'bri', 'ta', 'sol', 'fe', 'qui', 'ra', 'gon', 'vi', 'der', 'ne', 'pa'
+]
+
+
+def _name(rng, words):
+    return ' '.join(
+        ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        for _ in range(words)
+    )
+
+
+def _artist(artist_id, rng):
+    return {
+        'id': artist_id,
+        'name': _name(rng, rng.randint(1, 2)),
+        'type': 'artist',
+        'genres': rng.sample(GENRES, rng.randint(1, 3)),
+        'popularity': rng.randint(5, 95),
+        'followers': {'total': rng.randint(100, 5_000_000)},
+    }
+
+
+def generate_raw_profile(size='small', seed=42):
+    """
+    Build raw Spotify API objects for a synthetic user
+    Args:
+        size: Key of PROFILE_SIZES or an explicit number of library tracks
+        seed: Random seed (same seed -> same profile)
+    """
+    n_tracks = PROFILE_SIZES[size] if isinstance(size, str) else int(size)
+    rng = random.Random(seed)
+
+    n_artists = max(10, n_tracks // 8)
+    artists = [_artist(f"artist{i:06d}", rng) for i in range(n_artists)]
+    albums = [
+        {'id': f"album{i:06d}", 'name': _name(rng, rng.randint(1, 3)), 'artist': rng.choice(artists)}
+        for i in range(max(5, n_tracks // 10))
+    ]
+
+    tracks = []
+    for i in range(n_tracks):
+        album = rng.choice(albums)
+        track_artists = [album['artist']]
+        if rng.random() < 0.2:
+            track_artists.append(rng.choice(artists))
+        tracks.append({
+            'id': f"track{i:06d}",
+            'name': _name(rng, rng.randint(1, 4)),
+            'type': 'track',
+            'popularity': rng.randint(0, 100),
+            'artists': [{'id': a['id'], 'name': a['name']} for a in track_artists],
+            'album': {'id': album['id'], 'name': album['name']},
+        })
+
+    n_playlists = max(2, n_tracks // 50)
+    playlists = []
+    for i in range(n_playlists):
+        pl_tracks = rng.sample(tracks, min(len(tracks), rng.randint(10, 150)))
+        playlists.append({
+            'id': f"playlist{i:05d}",
+            'name': f"{_name(rng, 2)} Mix",
+            'snapshot_id': f"snap{seed}_{i}",
+            'tracks': pl_tracks,
+        })
+
+    now = datetime.now(timezone.utc)
+    recently_played = []
+    for i in range(50):
+        played_at = now - timedelta(minutes=4 * i)
+        recently_played.append({
+            'played_at': played_at.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'track': rng.choice(tracks),
+        })
+
+    user_id = f"synthetic_{size}_{seed}"
+    return {
+        'profile': {'id': user_id, 'display_name': f"Bench User {seed}", 'type': 'user'},
+        'artists': artists,
+        'top_artists': artists[:50],
+        'top_tracks': tracks[:50],
+        'saved_tracks': tracks,
+        'playlists': playlists,
+        'recently_played': recently_played,
+    }
+
+
+def _track_info(track):
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artists': [a['name'] for a in track['artists']],
+        'artist_ids': [a['id'] for a in track['artists']],
+        'album': track['album']['name'],
+        'popularity': track.get('popularity', 0),
+    }
+
+
+def _artist_info(artist):
+    return {
+        'id': artist['id'],
+        'name': artist['name'],
+        'genres': artist['genres'],
+        'popularity': artist['popularity'],
+        'followers': artist['followers']['total'],
+    }
+
+
+def build_music_data(raw):
+    """Convert a raw synthetic profile into the music_data dict used by the knowledge base"""
+    return {
+        'user_profile': {'id': raw['profile']['id'], 'display_name': raw['profile']['display_name'].split()[0]},
+        'top_artists': [_artist_info(a) for a in raw['top_artists'][:30]],
+        'top_tracks': [_track_info(t) for t in raw['top_tracks'][:30]],
+        'saved_tracks': [_track_info(t) for t in raw['saved_tracks']],
+        'playlists': [
+            {'id': pl['id'], 'name': pl['name'], 'tracks_total': len(pl['tracks']), 'snapshot_id': pl['snapshot_id']}
+            for pl in raw['playlists']
+        ],
+        'playlist_tracks': {pl['id']: [_track_info(t) for t in pl['tracks']] for pl in raw['playlists']},
+        'recently_played': [_track_info(p['track']) for p in raw['recently_played']],
+        'artists_info': {a['id']: _artist_info(a) for a in raw['top_artists'][:30]},
+    }
+
+
+def sample_questions(music_data, n=10, seed=7):
+    """Chat questions that mention entities from the profile"""
+    rng = random.Random(seed)
+    artists = [a['name'] for a in music_data['top_artists']] or ['my favorite artist']
+    tracks = [t['name'] for t in music_data['saved_tracks']] or ['my favorite song']
+    templates = [
+        "What do you think about {artist}?",
+        "Recommend me songs similar to {track}",
+        "Which of my playlists fit a rainy day?",
+        "What are my top music genres?",
+        "What did I listen to last week?",
+        "Tell me more about {artist} and why I like them",
+        "Is {track} one of my favorite songs?",
+        "Suggest new artists based on my taste",
+    ]
+    return [
+        rng.choice(templates).format(artist=rng.choice(artists), track=rng.choice(tracks))
+        for _ in range(n)
+    ]
@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load .env once for every core module (several settings are read at import time)
+load_dotenv()
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import threading
+import time
+
+from .metrics import REGISTRY
+from .user_store import UserStore
+
+# LLM-generated texts of the user (profile analysis, ...), by artifact name
+ARTIFACTS_FILE = "generated_artifacts.json"
+
+# One generation at a time per user and artifact, so a click waits for a running
+# background regeneration instead of paying for a second LLM call
+_generation_locks = {}
+_locks_lock = threading.Lock()
+
+# Read-modify-write of the artifacts file
+_write_lock = threading.Lock()
+
+
+def fingerprint(*inputs):
+    """Stable hash of the inputs an artifact is generated from"""
+    digest = hashlib.sha256()
+    for value in inputs:
+        digest.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+class ArtifactCache:
+    """
+    Generated artifacts of one user, kept in the user's data directory across sessions
+    An entry is only returned for the fingerprint it was generated from, so it goes
+    stale by itself when the underlying data changes.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.store = UserStore(user_id)
+
+    def entry(self, name):
+        """The stored entry (fingerprint, content, created_at), current or not"""
+        return (self.store.read_json(ARTIFACTS_FILE) or {}).get(name)
+
+    def get(self, name, key):
+        """Content generated from `key`, or None"""
+        entry = self.entry(name)
+        hit = entry is not None and entry.get('fingerprint') == key
+        REGISTRY.increment("chatify_artifact_cache_total", artifact=name, result="hit" if hit else "miss")
+        return entry['content'] if hit else None
+
+    def put(self, name, key, content):
+        with _write_lock:
+            artifacts = self.store.read_json(ARTIFACTS_FILE) or {}
+            artifacts[name] = {'fingerprint': key, 'content': content, 'created_at': time.time()}
+            self.store.write_json(ARTIFACTS_FILE, artifacts)
+
+    def lock(self, name):
+        with _locks_lock:
+            return _generation_locks.setdefault((self.user_id, name), threading.Lock())
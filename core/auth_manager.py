@@ -1,11 +1,8 @@
 import streamlit as st
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 import os
-from dotenv import load_dotenv
 import time
-
-load_dotenv()
+from .spotify_session import SpotifySession, create_spotify_oauth
 
 class AuthManager:
     def __init__(self):
@@ -15,14 +12,7 @@ class AuthManager:
         self.client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
         self.redirect_uri = os.getenv("SPOTIFY_REDIRECT_URI")
         
-        self.sp_oauth = SpotifyOAuth(
-            client_id=self.client_id,
-            client_secret=self.client_secret,
-            redirect_uri=self.redirect_uri,
-            scope="user-library-read user-top-read playlist-read-private user-read-recently-played",
-            cache_path=None,
-            show_dialog=True
-        )
+        self.sp_oauth = create_spotify_oauth()
     
     def get_auth_url(self):
         """Generate authorization URL for users"""
@@ -31,12 +21,21 @@ class AuthManager:
     def get_access_token(self, code):
         """Exchange authorization code for access token"""
         try:
-            token_info = self.sp_oauth.get_access_token(code, as_dict=True)
+            # Always exchange the code: with check_cache spotipy returns any cached token,
+            # which may belong to the previous user who logged in
+            token_info = self.sp_oauth.get_access_token(code, as_dict=True, check_cache=False)
             return token_info
         except Exception as e:
             print(f"Error getting access token: {e}")
             return None
     
+    def create_session(self, token_info):
+        """
+        Per-login SpotifySession: caches the profile once and refreshes the token
+        before it expires, shared by SpotifyClient and MusicDataCollector
+        """
+        return SpotifySession(token_info, oauth=self.sp_oauth)
+    
     def refresh_token_if_needed(self, token_info):
         """
         Refresh token if it's expired or about to expire
@@ -94,20 +93,21 @@ class AuthManager:
         # Create client with USER'S access token
         return spotipy.Spotify(auth=token_info['access_token'])
     
-    def get_user_id(self, token_info):
+    def get_user_id(self, session):
         """
         Get user ID using the USER'S token
         This will return the ID of the logged-in user, not the developer
+        Args:
+            session: SpotifySession (profile cached after the first call) or token_info dict
         """
         try:
-            sp = self.get_spotify_client(token_info)
-            if sp:
-                profile = sp.current_user()
-                user_id = profile.get('id', 'unknown_user')
-                print(f"Retrieved user ID: {user_id}")  # Debug
-                return user_id
+            if not isinstance(session, SpotifySession):
+                session = SpotifySession(self.refresh_token_if_needed(session))
+            user_id = session.get_profile().get('id', 'unknown_user')
+            print(f"Retrieved user ID: {user_id}")  # Debug
+            return user_id
         except Exception as e:
             print(f"Error getting user ID: {e}")
             import traceback
             print(traceback.format_exc())
-        return 'unknown_user'
\ No newline at end of file
+        return 'unknown_user'
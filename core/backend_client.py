@@ -0,0 +1,100 @@
+import os
+import threading
+
+import requests
+
+from .chatify_service import SessionNotFound
+
+BACKEND_URL = os.getenv("CHATIFY_BACKEND_URL")
+
+# Collection and ingestion can take minutes for large libraries
+LONG_TIMEOUT = 600
+REQUEST_TIMEOUT = 120
+
+# Keep-alive HTTP sessions, one per thread, shared by every client of the process
+_http = threading.local()
+
+
+class BackendError(Exception):
+    """Error reported by the Chatify backend"""
+
+
+class BackendClient:
+    """
+    Thin client for core.backend_service, same methods as ChatifyService
+    so app.py can use either one. It holds the session tokens of its own logins:
+    app.py keeps one client per browser session, so a logout (or an expired token)
+    in one tab never signs the same user out of their other tabs.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or BACKEND_URL).rstrip('/')
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(_http, 'session', None)
+        if session is None:
+            session = requests.Session()
+            _http.session = session
+        return session
+
+    def _token(self, user_id):
+        with self._tokens_lock:
+            return self._tokens.get(user_id)
+
+    def _post(self, path, payload=None, timeout=REQUEST_TIMEOUT, user_id=None):
+        headers = {}
+        if user_id is not None:
+            token = self._token(user_id)
+            if token is None:
+                raise SessionNotFound(f"No session for user {user_id}, log in again")
+            headers['Authorization'] = f"Bearer {token}"
+        response = self._session().post(f"{self.base_url}{path}", json=payload or {}, headers=headers,
+                                        timeout=timeout)
+        data = response.json() if response.content else {}
+        # 401: the backend doesn't know the token (restarted, expired): sign in again
+        if response.status_code in (401, 404):
+            raise SessionNotFound(data.get('error', path))
+        if response.status_code >= 400:
+            raise BackendError(data.get('error', f"HTTP {response.status_code}"))
+        return data
+
+    def login(self, token_info):
+        data = self._post("/login", {'token_info': token_info})
+        with self._tokens_lock:
+            self._tokens[data['user_id']] = data['session_token']
+        return data['user_id']
+
+    def initialize(self, user_id, progress=None):
+        if progress:
+            progress("Preparing your knowledge base...")
+        return self._post(f"/users/{user_id}/initialize", timeout=LONG_TIMEOUT, user_id=user_id)['music_data']
+
+    def update(self, user_id, progress=None):
+        if progress:
+            progress("Collecting fresh music data...")
+        return self._post(f"/users/{user_id}/update", timeout=LONG_TIMEOUT, user_id=user_id)['music_data']
+
+    def ask(self, user_id, question):
+        return self._post(f"/users/{user_id}/ask", {'question': question}, user_id=user_id)['answer']
+
+    def analyze_profile(self, user_id):
+        return self._post(f"/users/{user_id}/analyze", user_id=user_id)['analysis']
+
+    def search(self, user_id, query, k=5):
+        return self._post(f"/users/{user_id}/search", {'query': query, 'k': k}, user_id=user_id)['results']
+
+    def clear_conversation(self, user_id):
+        self._post(f"/users/{user_id}/clear", user_id=user_id)
+
+    def logout(self, user_id):
+        try:
+            self._post(f"/users/{user_id}/logout", user_id=user_id)
+        finally:
+            with self._tokens_lock:
+                self._tokens.pop(user_id, None)
+
+    def health(self):
+        response = self._session().get(f"{self.base_url}/health", timeout=REQUEST_TIMEOUT)
+        return response.json()
@@ -0,0 +1,255 @@
+"""
+Headless Chatify backend: the core pipeline (collect, ingest, search, ask) over HTTP
+Several Streamlit replicas (CHATIFY_BACKEND_URL) share one backend process, its
+worker pool and its caches (embedding model, vector store client, LLM client).
+
+    python -m core.backend_service            # listens on CHATIFY_BACKEND_PORT (8600)
+
+Endpoints (JSON bodies):
+    POST /login                    {"token_info": {...}}  -> {"user_id", "session_token"}
+    POST /users/<id>/initialize                           -> {"music_data"}
+    POST /users/<id>/update                               -> {"music_data"}
+    POST /users/<id>/ask           {"question"}           -> {"answer"}
+    POST /users/<id>/analyze                              -> {"analysis"}
+    POST /users/<id>/search        {"query", "k"}         -> {"results"}
+    POST /users/<id>/clear                                -> {}
+    POST /users/<id>/logout                               -> {}
+    GET  /health, GET /metrics
+
+Every /users/<id>/... call needs "Authorization: Bearer <session_token>" from that
+user's login. The backend has no other authentication: keep its port on the internal
+network (docker compose doesn't publish it).
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .chatify_service import ChatifyService, SessionNotFound, profile_summary
+from .metrics import REGISTRY
+from .refresh_scheduler import RefreshScheduler
+from .session_manager import SESSION_EXPIRE_HOURS, SessionManager
+
+BACKEND_PORT = int(os.getenv("CHATIFY_BACKEND_PORT", "8600"))
+
+# Pipeline calls running at once; the rest wait in the pool's queue.
+# Most of the work is waiting on Spotify/Weaviate/Gemini, so oversubscribe the cores.
+BACKEND_WORKERS = int(os.getenv("CHATIFY_BACKEND_WORKERS", str((os.cpu_count() or 1) * 4)))
+
+# Largest request body accepted (token dicts and questions are tiny)
+MAX_BODY_BYTES = 1024 * 1024
+
+_USER_ROUTE = re.compile(r"/users/([^/]+)/(initialize|update|ask|analyze|search|clear|logout)")
+
+
+def _required(body, key):
+    value = body.get(key)
+    if value in (None, ""):
+        raise ValueError(f"Missing '{key}'")
+    return value
+
+
+class Unauthorized(Exception):
+    """Missing, unknown or expired session token, or a token of another user"""
+
+
+class BackendServer:
+    """
+    HTTP front of a ChatifyService with a bounded worker pool
+    Args:
+        service: ChatifyService to expose (defaults to one with the production clients)
+        workers: Size of the worker pool (defaults to CHATIFY_BACKEND_WORKERS)
+        refresh: Run the background RefreshScheduler (defaults to True for the production service)
+        evict: Evict idle sessions with a SessionManager (defaults to True for the production service)
+    """
+
+    def __init__(self, service=None, host="0.0.0.0", port=None, workers=None, refresh=None, evict=None):
+        if service is None:
+            from .spotify_session import create_spotify_oauth
+            service = ChatifyService(oauth=create_spotify_oauth())
+            refresh = True if refresh is None else refresh
+            evict = True if evict is None else evict
+        self.service = service
+        self.scheduler = RefreshScheduler(service) if refresh else None
+        self.sessions = SessionManager(service)
+        self._evict = bool(evict)
+        self.pool = ThreadPoolExecutor(max_workers=workers or BACKEND_WORKERS, thread_name_prefix="chatify-backend")
+        self.httpd = ThreadingHTTPServer((host, BACKEND_PORT if port is None else port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+        # session token -> [user_id, last used]
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        if host in ("0.0.0.0", ""):
+            host = "127.0.0.1"
+        return f"http://{host}:{port}"
+
+    def _start_background(self):
+        if self.scheduler is not None:
+            self.scheduler.start()
+        if self._evict:
+            self.sessions.start()
+
+    def start(self):
+        """Serve in a daemon thread (tests and benchmarks)"""
+        self._start_background()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        print(f"Chatify backend listening on {self.url}")
+        self._start_background()
+        self.httpd.serve_forever()
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self.sessions.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _issue_token(self, user_id):
+        """New session token for a login; tokens unused for CHATIFY_SESSION_EXPIRE_HOURS are dropped"""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._tokens_lock:
+            if SESSION_EXPIRE_HOURS > 0:
+                expired = now - SESSION_EXPIRE_HOURS * 3600
+                for stale in [t for t, (_, last_used) in self._tokens.items() if last_used < expired]:
+                    del self._tokens[stale]
+            self._tokens[token] = [user_id, now]
+        return token
+
+    def _authorize(self, user_id, token):
+        with self._tokens_lock:
+            entry = self._tokens.get(token) if token else None
+            if entry is None or entry[0] != user_id:
+                raise Unauthorized(f"Invalid session token for user {user_id}, log in again")
+            entry[1] = time.time()
+
+    def _revoke_token(self, token):
+        with self._tokens_lock:
+            self._tokens.pop(token, None)
+
+    def _run(self, func, *args):
+        """Run a pipeline call on the worker pool and record how long it queued"""
+        submitted = time.perf_counter()
+
+        def task():
+            REGISTRY.observe("backend.queue_wait", time.perf_counter() - submitted)
+            return func(*args)
+
+        return self.pool.submit(task).result()
+
+    def dispatch(self, method, path, body, token=None):
+        """
+        Return (status, payload) for a request
+        Args:
+            token: Session token from the Authorization header
+        """
+        service = self.service
+        if method == "GET" and path == "/health":
+            return 200, {'status': 'ok', 'active_users': service.active_users(), 'memory': self.sessions.report()}
+        if method != "POST":
+            return 404, {'error': f"Unknown endpoint: {method} {path}"}
+
+        if path == "/login":
+            user_id = self._run(service.login, _required(body, 'token_info'))
+            return 200, {'user_id': user_id, 'session_token': self._issue_token(user_id)}
+
+        match = _USER_ROUTE.fullmatch(path)
+        if not match:
+            return 404, {'error': f"Unknown endpoint: {method} {path}"}
+        user_id, action = match.groups()
+        self._authorize(user_id, token)
+
+        if action == "initialize":
+            return 200, {'music_data': profile_summary(self._run(service.initialize, user_id))}
+        if action == "update":
+            return 200, {'music_data': profile_summary(self._run(service.update, user_id))}
+        if action == "ask":
+            return 200, {'answer': self._run(service.ask, user_id, _required(body, 'question'))}
+        if action == "analyze":
+            return 200, {'analysis': self._run(service.analyze_profile, user_id)}
+        if action == "search":
+            return 200, {'results': self._run(service.search, user_id, _required(body, 'query'), int(body.get('k', 5)))}
+        if action == "clear":
+            service.clear_conversation(user_id)
+            return 200, {}
+        self._revoke_token(token)
+        service.logout(user_id)
+        return 200, {}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, payload, content_type="application/json"):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method):
+                path = self.path.split('?', 1)[0].rstrip('/') or '/'
+                if method == "GET" and path == "/metrics":
+                    server.sessions.report()
+                    self._send(200, REGISTRY.render().encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8")
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY_BYTES:
+                    self._send(413, {'error': "Request body too large"})
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                    authorization = self.headers.get('Authorization') or ''
+                    token = authorization[7:].strip() if authorization.startswith('Bearer ') else None
+                    status, payload = server.dispatch(method, path, body, token)
+                except Unauthorized as e:
+                    status, payload = 401, {'error': str(e)}
+                except SessionNotFound as e:
+                    status, payload = 404, {'error': str(e.args[0]) if e.args else "Not found"}
+                except (ValueError, TypeError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except TimeoutError as e:
+                    status, payload = 504, {'error': str(e)}
+                except Exception as e:
+                    print(f"Backend error on {method} {path}: {e}")
+                    status, payload = 500, {'error': str(e)}
+                self._send(status, payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    BackendServer().serve_forever()
@@ -0,0 +1,417 @@
+"""
+Headless bulk ingestion: build the knowledge bases of many users without the Streamlit flow
+
+Input directory (searched recursively):
+- user_music_data_<user_id>.json files (the cache format of older versions)
+- exported user directories (a copy of data/users/<user_id>/): music_data.json, and
+  kb_snapshot.bin.gz if present, which is imported instead of embedding anything
+
+Stages overlap across users:
+    documents (main thread) -> embedding batches mixing several users (one thread,
+    the process pool with CHATIFY_EMBEDDING_WORKERS > 1) -> bounded upload queue ->
+    upload threads writing to the vector store
+The bounded queues are the backpressure: when the vector store writes slowly, embedding and
+document building wait instead of piling vectors up in memory. Each finished user is
+recorded in a checkpoint file, so an interrupted run resumes with the users not yet done
+(a partially written collection is dropped and rebuilt).
+
+Usage (from the repository root):
+    python -m core.bulk_ingest exports/ --upload-threads 4
+    python -m core.bulk_ingest exports/ --local --ingestion rollup   # dry run in LocalVectorStore
+"""
+import argparse
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+from .chatify_service import MUSIC_DATA_FILE, save_music_data
+from .embedding_pipeline import get_embedding_pipeline
+import numpy as np
+
+from .kb_snapshot import read_snapshot_header
+from .music_knowledge_base import (KB_SNAPSHOT_DTYPE, KB_SNAPSHOT_FILE, KB_SNAPSHOTS, MusicKnowledgeBase,
+                                   connect_weaviate)
+from .user_store import DATA_DIR
+
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "bulk_ingest_checkpoint.json")
+
+# Documents embedded per call, across users (small profiles share a batch)
+EMBEDDING_BATCH = 1024
+
+# Embedded batches waiting for an upload thread before embedding blocks
+MAX_PENDING_UPLOADS = 8
+
+UPLOAD_THREADS = 4
+
+# Progress line every this many finished users
+PROGRESS_EVERY = 25
+
+_DONE = object()
+
+
+def find_profiles(directory):
+    """
+    Music data files under `directory`
+    Returns: List of (path, snapshot path or None), sorted by path
+    """
+    profiles = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            if name == MUSIC_DATA_FILE or name.startswith("user_music_data_"):
+                snapshot = os.path.join(root, KB_SNAPSHOT_FILE) if name == MUSIC_DATA_FILE else None
+                profiles.append((os.path.join(root, name), snapshot if snapshot and os.path.exists(snapshot) else None))
+    return sorted(profiles)
+
+
+def _fingerprint(path):
+    """Changes when the source file changes, so an updated export is ingested again"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class Checkpoint:
+    """Users already ingested, written atomically after each one"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.data = {'completed': {}, 'failed': {}}
+
+    def is_done(self, user_id, fingerprint):
+        entry = self.data['completed'].get(user_id)
+        return entry is not None and entry.get('fingerprint') == fingerprint
+
+    def record(self, user_id, entry, failed=False):
+        with self._lock:
+            done, other = ('failed', 'completed') if failed else ('completed', 'failed')
+            self.data[done][user_id] = entry
+            self.data[other].pop(user_id, None)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class UserJob:
+    """One user's ingestion: documents still to upload and what to do once they are in"""
+
+    def __init__(self, user_id, source, fingerprint, music_data, knowledge_base):
+        self.user_id = user_id
+        self.source = source
+        self.fingerprint = fingerprint
+        self.music_data = music_data
+        self.knowledge_base = knowledge_base
+        self.expected = 0
+        self.uploaded = 0
+        self.error = None
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        # (uuid, properties, vector) of the uploaded batches, written as the user's snapshot
+        # when the last one is in (reading the collection back would stall the upload thread)
+        self.snapshot_objects = [] if KB_SNAPSHOTS else None
+
+    def add_uploaded(self, documents, vectors):
+        """Returns: True when this upload completed the user"""
+        with self.lock:
+            if self.snapshot_objects is not None:
+                properties = self.knowledge_base._document_properties
+                self.snapshot_objects.extend(
+                    (None, properties(doc), np.asarray(vector, dtype=KB_SNAPSHOT_DTYPE))
+                    for doc, vector in zip(documents, vectors)
+                )
+            self.uploaded += len(documents)
+            return self.uploaded == self.expected
+
+
+class BulkIngestion:
+    """
+    Args:
+        client: Weaviate client or LocalVectorStore shared by every user
+        embedding_model: Defaults to the shared model (and its process pool for large batches)
+        ingestion_mode: "tracks" or "rollup" (defaults to CHATIFY_INGESTION_MODE)
+        checkpoint: Checkpoint of finished users
+        skip_existing: Keep collections that already exist instead of rebuilding them
+        use_snapshots: Import exported kb_snapshot.bin.gz files instead of embedding
+    """
+
+    def __init__(self, client, checkpoint, embedding_model=None, ingestion_mode=None,
+                 embedding_batch=EMBEDDING_BATCH, max_pending_uploads=MAX_PENDING_UPLOADS,
+                 upload_threads=UPLOAD_THREADS, skip_existing=False, use_snapshots=True):
+        self.client = client
+        self.checkpoint = checkpoint
+        self.embedding_model = embedding_model
+        self.ingestion_mode = ingestion_mode
+        self.embedding_batch = embedding_batch
+        self.upload_threads = upload_threads
+        self.skip_existing = skip_existing
+        self.use_snapshots = use_snapshots
+        # A long run amortizes the process pool's startup, so every batch uses it
+        self.pipeline = get_embedding_pipeline() if embedding_model is None else None
+
+        # Bounded queues: a full one blocks the stage before it (backpressure)
+        self._embed_queue = queue.Queue(maxsize=2)
+        self._upload_queue = queue.Queue(maxsize=max_pending_uploads)
+        self._stats_lock = threading.Lock()
+        self.stats = {'completed': 0, 'skipped': 0, 'failed': 0, 'from_snapshot': 0, 'documents': 0}
+        self._start = time.perf_counter()
+
+    def _knowledge_base(self, user_id):
+        return MusicKnowledgeBase(user_id=user_id, embedding_model=self.embedding_model, client=self.client,
+                                  ingestion_mode=self.ingestion_mode)
+
+    def run(self, profiles):
+        """
+        Ingest every profile not in the checkpoint
+        Args:
+            profiles: (music data path, snapshot path or None) pairs from find_profiles
+        Returns: stats dict
+        """
+        embedder = threading.Thread(target=self._embed_loop, name="bulk-embed", daemon=True)
+        uploaders = [threading.Thread(target=self._upload_loop, name=f"bulk-upload-{i}", daemon=True)
+                     for i in range(max(1, self.upload_threads))]
+        embedder.start()
+        for uploader in uploaders:
+            uploader.start()
+
+        # On KeyboardInterrupt the (daemon) stages are abandoned: unfinished users aren't in
+        # the checkpoint, so the next run rebuilds them
+        batch, seen = [], set()
+        for path, snapshot in profiles:
+            job = self._prepare(path, snapshot, seen)
+            if job is None:
+                continue
+            for doc in job.documents:
+                batch.append((job, doc))
+                if len(batch) >= self.embedding_batch:
+                    self._embed_queue.put(batch)
+                    batch = []
+            job.documents = None
+        if batch:
+            self._embed_queue.put(batch)
+        self._embed_queue.put(_DONE)
+        embedder.join()
+        for _ in uploaders:
+            self._upload_queue.put(_DONE)
+        for uploader in uploaders:
+            uploader.join()
+        self._report(final=True)
+        return self.stats
+
+    # --- stages ---
+
+    def _prepare(self, path, snapshot, seen):
+        """Load one profile and create its collection; returns a job with its documents, or None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                music_data = json.load(f)
+            user_id = (music_data.get('user_profile') or {}).get('id')
+            if not user_id:
+                raise ValueError("no user_profile.id")
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            self._count('failed')
+            return None
+
+        if user_id in seen:
+            print(f"Skipping {path}: {user_id} was already read from another file")
+            return None
+        seen.add(user_id)
+        fingerprint = _fingerprint(path)
+        if self.checkpoint.is_done(user_id, fingerprint):
+            self._count('skipped')
+            return None
+
+        knowledge_base = self._knowledge_base(user_id)
+        job = UserJob(user_id, path, fingerprint, music_data, knowledge_base)
+        try:
+            if self.client.collections.exists(knowledge_base.collection_name):
+                if self.skip_existing:
+                    self._finish(job, documents=0)
+                    return None
+                # Stale, or left half-written by an interrupted run
+                self.client.collections.delete(knowledge_base.collection_name)
+                knowledge_base._clear_cache()
+
+            if snapshot and self.use_snapshots:
+                try:
+                    mode = read_snapshot_header(snapshot).get("ingestion_mode")
+                    if mode != knowledge_base.ingestion_mode:
+                        raise ValueError(f"built in {mode} mode")
+                    count = knowledge_base.import_snapshot(snapshot, client=self.client)
+                    if KB_SNAPSHOTS and os.path.abspath(snapshot) != os.path.abspath(knowledge_base.snapshot_path()):
+                        os.makedirs(os.path.dirname(knowledge_base.snapshot_path()), exist_ok=True)
+                        shutil.copyfile(snapshot, knowledge_base.snapshot_path())
+                    self._count('from_snapshot')
+                    self._finish(job, documents=count)
+                    return None
+                except Exception as e:
+                    print(f"Not using the snapshot of {user_id}, embedding instead: {e}")
+                    if self.client.collections.exists(knowledge_base.collection_name):
+                        self.client.collections.delete(knowledge_base.collection_name)
+
+            knowledge_base._create_collection(self.client)
+            job.documents = knowledge_base._create_documents(music_data)
+            if not any(doc.metadata.get("type") == "playlist_tracks" for doc in job.documents):
+                # Rollup mode: interactive logins add these after the background playlist sync
+                job.documents += knowledge_base._create_playlist_documents(music_data)
+            job.expected = len(job.documents)
+        except Exception as e:
+            self._fail(job, e)
+            return None
+        if not job.expected:
+            self._finish(job, documents=0)
+            return None
+        return job
+
+    def _embed_loop(self):
+        """Embed batches mixing several users' documents, then route each user's share to the upload queue"""
+        while True:
+            batch = self._embed_queue.get()
+            if batch is _DONE:
+                return
+            owners = {id(doc): job for job, doc in batch}
+            documents = [doc for job, doc in batch if job.error is None]
+
+            def route(docs, vectors):
+                by_job = {}
+                for doc, vector in zip(docs, vectors):
+                    job = owners[id(doc)]
+                    _, job_docs, job_vectors = by_job.setdefault(id(job), (job, [], []))
+                    job_docs.append(doc)
+                    job_vectors.append(vector)
+                for job, job_docs, job_vectors in by_job.values():
+                    # Blocks while the upload threads are behind
+                    self._upload_queue.put((job, job_docs, job_vectors))
+
+            try:
+                if self.pipeline is not None:
+                    self.pipeline.embed_and_upload(documents, route)
+                else:
+                    route(documents, batch[0][0].knowledge_base._embed_documents(documents))
+            except Exception as e:
+                for job in {id(job): job for job, _ in batch}.values():
+                    self._fail(job, e)
+
+    def _upload_loop(self):
+        while True:
+            item = self._upload_queue.get()
+            if item is _DONE:
+                return
+            job, documents, vectors = item
+            if job.error is not None:
+                continue
+            try:
+                job.knowledge_base._upload_documents(self.client, documents, vectors)
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            if job.add_uploaded(documents, vectors):
+                self._finish(job, documents=job.expected)
+
+    # --- bookkeeping ---
+
+    def _finish(self, job, documents):
+        """Everything a login expects next to the collection, then the checkpoint"""
+        try:
+            knowledge_base = job.knowledge_base
+            knowledge_base.save_entity_index(job.music_data)
+            knowledge_base._update_cache()
+            save_music_data(job.user_id, job.music_data, source="bulk")
+            if job.snapshot_objects:
+                knowledge_base.export_snapshot(objects=job.snapshot_objects)
+        except Exception as e:
+            self._fail(job, e)
+            return
+        self.checkpoint.record(job.user_id, {
+            'source': job.source, 'fingerprint': job.fingerprint, 'documents': documents,
+            'seconds': round(time.perf_counter() - job.started, 2), 'finished_at': time.time(),
+        })
+        job.music_data = None
+        job.snapshot_objects = None
+        self._count('completed', documents)
+
+    def _fail(self, job, error):
+        with job.lock:
+            if job.error is not None:
+                return
+            job.error = error
+        print(f"Failed to ingest {job.user_id}: {error}")
+        try:
+            # Never leave a partial collection behind: it would pass for a complete one
+            self.client.collections.delete(job.knowledge_base.collection_name)
+            job.knowledge_base._clear_cache()
+        except Exception:
+            pass
+        self.checkpoint.record(job.user_id, {'source': job.source, 'error': str(error), 'failed_at': time.time()},
+                               failed=True)
+        job.music_data = None
+        job.snapshot_objects = None
+        self._count('failed')
+
+    def _count(self, key, documents=0):
+        with self._stats_lock:
+            self.stats[key] += 1
+            self.stats['documents'] += documents
+            report = key == 'completed' and self.stats['completed'] % PROGRESS_EVERY == 0
+        if report:
+            self._report()
+
+    def _report(self, final=False):
+        elapsed = time.perf_counter() - self._start
+        with self._stats_lock:
+            stats = dict(self.stats)
+        print(f"{'Done' if final else 'Progress'}: {stats['completed']} users ingested "
+              f"({stats['from_snapshot']} from snapshots), {stats['skipped']} already done, {stats['failed']} failed; "
+              f"{stats['documents']} documents in {elapsed:.0f}s "
+              f"({stats['completed'] / elapsed if elapsed else 0:.1f} users/s, "
+              f"{stats['documents'] / elapsed if elapsed else 0:.0f} documents/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the knowledge bases of many users")
+    parser.add_argument('directory', help="Directory of user_music_data_*.json files or exported user directories")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help="Progress file used to resume")
+    parser.add_argument('--ingestion', choices=('tracks', 'rollup'), help="Defaults to CHATIFY_INGESTION_MODE")
+    parser.add_argument('--embedding-batch', type=int, default=EMBEDDING_BATCH)
+    parser.add_argument('--upload-threads', type=int, default=UPLOAD_THREADS)
+    parser.add_argument('--max-pending-uploads', type=int, default=MAX_PENDING_UPLOADS)
+    parser.add_argument('--skip-existing', action='store_true', help="Keep collections that already exist")
+    parser.add_argument('--no-snapshots', action='store_true', help="Embed even when a snapshot is exported")
+    parser.add_argument('--local', action='store_true', help="Ingest into an in-process LocalVectorStore (dry run)")
+    args = parser.parse_args(argv)
+
+    profiles = find_profiles(args.directory)
+    print(f"Found {len(profiles)} profiles in {args.directory}")
+    if args.local:
+        from .local_vector_store import LocalVectorStore
+        client = LocalVectorStore()
+    else:
+        client = connect_weaviate()
+    try:
+        ingestion = BulkIngestion(
+            client, Checkpoint(args.checkpoint), ingestion_mode=args.ingestion,
+            embedding_batch=args.embedding_batch, max_pending_uploads=args.max_pending_uploads,
+            upload_threads=args.upload_threads, skip_existing=args.skip_existing,
+            use_snapshots=not args.no_snapshots
+        )
+        stats = ingestion.run(profiles)
+    except KeyboardInterrupt:
+        print(f"Interrupted; run the same command again to resume ({args.checkpoint})")
+        return 130
+    finally:
+        client.close()
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
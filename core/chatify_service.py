@@ -0,0 +1,491 @@
+import os
+import threading
+import time
+
+from .metrics import REGISTRY, set_user, span
+from .llm_gateway import get_llm_gateway
+from .music_advisor import MusicAdvisor
+from .music_data_collector import MusicDataCollector
+from .music_knowledge_base import MusicKnowledgeBase, connect_weaviate
+from .profiling import profiled
+from .spotify_session import SpotifySession
+from .user_store import UserStore, schedule_eviction
+
+# Per-user cache of the collected Spotify data (data/users/<user_id>/music_data.json)
+MUSIC_DATA_FILE = "music_data.json"
+
+# When (and by whom) the cached music data was collected
+MUSIC_DATA_META_FILE = "music_data_meta.json"
+
+# Conversation of an evicted session, restored when the user comes back
+SESSION_SNAPSHOT_FILE = "session_snapshot.json"
+
+
+def load_cached_music_data(user_id):
+    """Load the user's cached music data file, or None"""
+    store = UserStore(user_id)
+    legacy_file = f"user_music_data_{user_id}.json"
+    if not os.path.exists(store.path(MUSIC_DATA_FILE)) and os.path.exists(legacy_file):
+        # Cache written by older versions in the working directory
+        os.makedirs(store.directory, exist_ok=True)
+        os.replace(legacy_file, store.path(MUSIC_DATA_FILE))
+    return store.read_json(MUSIC_DATA_FILE)
+
+
+def save_music_data(user_id, music_data, source="login"):
+    """
+    Atomically write the user's music data cache and mark it as fresh
+    Args:
+        source: What collected it ("login", "update", "scheduler" or "bulk")
+    Returns: The collection timestamp
+    """
+    store = UserStore(user_id)
+    store.write_json(MUSIC_DATA_FILE, music_data, indent=2)
+    collected_at = time.time()
+    store.write_json(MUSIC_DATA_META_FILE, {'collected_at': collected_at, 'source': source})
+    return collected_at
+
+
+def music_data_collected_at(user_id):
+    """Timestamp of the user's cached music data, or None if unknown"""
+    meta = UserStore(user_id).read_json(MUSIC_DATA_META_FILE)
+    return meta.get('collected_at') if meta else None
+
+
+def _json_safe(value):
+    """Conversation vectors may be numpy arrays"""
+    return [float(x) for x in value] if value is not None else None
+
+
+def profile_summary(music_data):
+    """The part of music_data the UI shows (small enough to send over HTTP)"""
+    music_data = music_data or {}
+    return {
+        'user_profile': music_data.get('user_profile', {}),
+        'top_artists': music_data.get('top_artists', [])[:10],
+    }
+
+
+class SessionNotFound(KeyError):
+    """The user has no session in this service (never logged in, logged out or evicted)"""
+
+
+class UserContext:
+    """
+    Everything the service keeps for one logged-in user
+    music_data, knowledge_base and advisor are the heavy part: they are dropped when the
+    session goes idle and rebuilt from the user's directory on the next request.
+    """
+
+    def __init__(self, user_id, session):
+        self.user_id = user_id
+        self.session = session
+        self.music_data = None
+        self.knowledge_base = None
+        self.advisor = None
+        # Last request from the user and age of their data (background refresh scheduling)
+        self.last_active = time.time()
+        self.collected_at = None
+        # Set once the knowledge base is ready; stays set while the heavy objects are evicted
+        self.initialized = False
+        # Serializes initialize/update for the user (several tabs or replicas)
+        self.lock = threading.Lock()
+
+
+class ChatifyService:
+    """
+    Core pipeline (collect, ingest, search, ask) for many users in one process
+    Used in-process by app.py, or behind core.backend_service so several Streamlit
+    replicas share one backend. Heavy objects are shared by all users: the embedding
+    model, one vector store client and one LLM client.
+    Args:
+        oauth: SpotifyOAuth used to refresh user tokens
+        vector_client: Weaviate client or LocalVectorStore (defaults to Weaviate Cloud)
+        embedding_model: Defaults to the process-wide model (CHATIFY_EMBEDDING_BACKEND)
+        llm: Chat model (defaults to the process-wide LLMGateway in front of Gemini)
+    """
+
+    def __init__(self, oauth=None, vector_client=None, embedding_model=None, llm=None):
+        self.oauth = oauth
+        self._vector_client = vector_client
+        self._embedding_model = embedding_model
+        self._llm = llm
+        self._users = {}
+        self._lock = threading.Lock()
+
+    # --- shared resources ---
+
+    @property
+    def vector_client(self):
+        with self._lock:
+            if self._vector_client is None:
+                self._vector_client = connect_weaviate()
+            return self._vector_client
+
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = get_llm_gateway()
+            return self._llm
+
+    def _context(self, user_id):
+        with self._lock:
+            context = self._users.get(user_id)
+        if context is None:
+            raise SessionNotFound(f"No session for user {user_id}, log in again")
+        context.last_active = time.time()
+        return context
+
+    # --- pipeline ---
+
+    def login(self, token_info):
+        """
+        Start (or replace) the user's Spotify session
+        Returns: user_id
+        """
+        session = SpotifySession(token_info, oauth=self.oauth)
+        user_id = session.user_id
+        if not user_id or user_id == 'unknown_user':
+            session.close()
+            raise ValueError("Could not get user ID from token")
+
+        with self._lock:
+            context = self._users.get(user_id)
+            if context is None:
+                self._users[user_id] = UserContext(user_id, session)
+                return user_id
+            previous, context.session = context.session, session
+            context.last_active = time.time()
+        previous.close()
+        if context.advisor is not None:
+            context.advisor.session = session
+        return user_id
+
+    @profiled("initialize_system", user=lambda self, user_id, *args, **kwargs: user_id)
+    def initialize(self, user_id, progress=None):
+        """
+        Load or build the user's knowledge base and advisor (no-op if already done)
+        Args:
+            progress: Optional callback receiving status labels
+        Returns: The user's music data
+        """
+        progress = progress or (lambda label: None)
+        context = self._context(user_id)
+        set_user(user_id)
+        with context.lock, span("initialize_system"):
+            if context.advisor is not None:
+                return context.music_data
+            if context.initialized:
+                # Evicted while idle: rebuild from the snapshot instead of the full pipeline
+                return self._rehydrate(context)
+
+            # Only evict the least recently used beyond the disk quota, never a user with a
+            # live session here: idle (snapshotted) sessions rehydrate from those files
+            # (in the background, throttled: the scan walks every user's directory)
+            schedule_eviction(keep=self.live_users)
+
+            progress("Checking knowledge base...")
+            knowledge_base = MusicKnowledgeBase(
+                user_id=user_id, embedding_model=self._embedding_model, client=self.vector_client
+            )
+
+            # Check if collection exists (uses cache, very fast)
+            music_data = None
+            if knowledge_base.collection_exists():
+                progress("Knowledge base found! Loading your data...")
+                music_data = load_cached_music_data(user_id)
+                # Verify it's the same user
+                if music_data and music_data.get('user_profile', {}).get('id') == user_id:
+                    progress("Data loaded from cache!")
+                    context.collected_at = music_data_collected_at(user_id)
+                else:
+                    # No cached data or different user - collect fresh data
+                    progress("Collecting your music profile...")
+                    collector = MusicDataCollector(context.session)
+                    music_data = collector.collect_all_data()
+                    context.collected_at = save_music_data(user_id, music_data)
+                    self._start_playlist_sync(collector, knowledge_base, None, user_id, rebuilt=False)
+            else:
+                # Collection doesn't exist, need to collect all data
+                previous_data = load_cached_music_data(user_id)
+                if previous_data and previous_data.get('user_profile', {}).get('id') == user_id:
+                    # Collection lost (Weaviate wipe, new cluster): reload its snapshot, no embedding
+                    progress("Restoring your knowledge base...")
+                    if knowledge_base.restore_snapshot():
+                        music_data = previous_data
+                        context.collected_at = music_data_collected_at(user_id)
+                if music_data is None:
+                    progress("Collecting your music profile...")
+                    collector = MusicDataCollector(context.session)
+                    music_data = collector.collect_all_data()
+
+                    progress("Creating knowledge base...")
+                    knowledge_base.initialize_knowledge_base(music_data, force_recreate=False)
+                    context.collected_at = save_music_data(user_id, music_data)
+                    self._start_playlist_sync(collector, knowledge_base, previous_data, user_id, rebuilt=True)
+
+            progress("Setting up your Chatify...")
+            context.knowledge_base = knowledge_base
+            context.music_data = music_data
+            context.advisor = MusicAdvisor(knowledge_base, music_data, context.session, llm=self.llm)
+            context.initialized = True
+            return music_data
+
+    @profiled("update_knowledge_base", user=lambda self, user_id, *args, **kwargs: user_id)
+    def update(self, user_id, progress=None):
+        """
+        Re-collect the user's data and rebuild the knowledge base
+        Returns: The fresh music data
+        """
+        progress = progress or (lambda label: None)
+        context = self._context(user_id)
+        if not context.initialized:
+            return self.initialize(user_id, progress)
+
+        set_user(user_id)
+        with context.lock, span("update_knowledge_base"):
+            if context.advisor is None:
+                self._rehydrate(context)
+            progress("Collecting fresh music data...")
+            previous_data = context.music_data
+            collector = MusicDataCollector(context.session)
+            music_data = collector.collect_all_data()
+
+            progress("Updating knowledge base...")
+            context.knowledge_base.update_knowledge_base(music_data)
+            context.collected_at = save_music_data(user_id, music_data, source="update")
+            self._start_playlist_sync(collector, context.knowledge_base, previous_data, user_id, rebuilt=True)
+
+            progress("Refreshing advisor...")
+            context.music_data = music_data
+            context.advisor = MusicAdvisor(context.knowledge_base, music_data, context.session, llm=self.llm)
+            self._start_artifact_refresh(context.advisor, user_id)
+            return music_data
+
+    def refresh(self, user_id):
+        """
+        Background refresh: re-collect the user's data (playlists included) and bring the
+        knowledge base up to date, keeping the advisor and its conversation. Skipped while
+        the user is initializing or updating.
+        - nothing changed: no ingestion at all
+        - only some playlists changed (snapshot_id): only their documents are replaced
+        - anything else: rebuilt into the user's other collection, which then replaces
+          the served one (searches never see a missing knowledge base)
+        Returns: True if refreshed
+        Raises: Whatever the collection raised (e.g. SpotifyException on 429)
+        """
+        with self._lock:
+            context = self._users.get(user_id)
+        if context is None or not context.initialized:
+            return False
+        if not context.lock.acquire(blocking=False):
+            return False
+        try:
+            with span("background_refresh"):
+                if context.knowledge_base is None:
+                    self._rehydrate(context)
+                previous_data = context.music_data
+                collector = MusicDataCollector(context.session)
+                music_data = collector.collect_all_data()
+                changed_playlists = collector.collect_playlist_tracks(previous_data)
+                knowledge_base = context.knowledge_base
+                if knowledge_base.library_changed(previous_data, music_data):
+                    knowledge_base.rebuild_knowledge_base(music_data)
+                    REGISTRY.increment("chatify_refresh_ingestion_total", result="rebuilt")
+                elif changed_playlists:
+                    knowledge_base.add_playlist_documents(music_data, playlist_ids=changed_playlists)
+                    REGISTRY.increment("chatify_refresh_ingestion_total", result="playlists")
+                else:
+                    REGISTRY.increment("chatify_refresh_ingestion_total", result="unchanged")
+                context.collected_at = save_music_data(user_id, music_data, source="scheduler")
+                context.music_data = music_data
+                if context.advisor is not None:
+                    context.advisor.music_data = music_data
+                    self._start_artifact_refresh(context.advisor, user_id)
+            return True
+        finally:
+            context.lock.release()
+
+    def refresh_candidates(self):
+        """(user_id, last_active, collected_at) of every initialized user"""
+        with self._lock:
+            contexts = list(self._users.values())
+        return [
+            (c.user_id, c.last_active, c.collected_at)
+            for c in contexts if c.initialized
+        ]
+
+    def _start_playlist_sync(self, collector, knowledge_base, previous_data, user_id, rebuilt):
+        """
+        Fetch playlist contents in a background thread so login never waits for it.
+        The collected data dict is shared with the session, so it is updated in place.
+        Args:
+            previous_data: Data the collection's playlist documents were built from (None if unknown)
+            rebuilt: The collection was just (re)built without playlist documents
+        """
+        def sync():
+            try:
+                changed = collector.collect_playlist_tracks(previous_data)
+                # A fresh collection needs every playlist; otherwise only the changed and removed
+                # ones are replaced (snapshot_id unchanged: documents and vectors are kept)
+                playlist_ids = None if rebuilt or previous_data is None else changed
+                knowledge_base.add_playlist_documents(collector.collected_data, playlist_ids=playlist_ids)
+                save_music_data(user_id, collector.collected_data)
+            except Exception as e:
+                print(f"Error syncing playlists: {e}")
+
+        threading.Thread(target=sync, daemon=True).start()
+
+    def _start_artifact_refresh(self, advisor, user_id):
+        """Regenerate the user's stale cached profile analysis in the background"""
+        def regenerate():
+            set_user(user_id)
+            try:
+                advisor.refresh_profile_analysis()
+            except Exception as e:
+                print(f"Error refreshing profile analysis: {e}")
+
+        threading.Thread(target=regenerate, daemon=True).start()
+
+    def _advisor(self, user_id):
+        """
+        The user's context and advisor, rehydrated if the session was evicted
+        Callers keep the returned advisor: context.advisor may be evicted meanwhile.
+        """
+        context = self._context(user_id)
+        advisor = context.advisor
+        if advisor is None:
+            if not context.initialized:
+                raise SessionNotFound(f"User {user_id} is not initialized")
+            with context.lock:
+                if context.advisor is None:
+                    self._rehydrate(context)
+                advisor = context.advisor
+        return context, advisor
+
+    # --- idle eviction ---
+
+    def _rehydrate(self, context):
+        """
+        Rebuild an evicted user's data, knowledge base and advisor (caller holds context.lock).
+        Everything comes from the user's directory: the collection is already in the
+        vector store and the embedding model, vector client and LLM are shared.
+        Returns: The user's music data
+        """
+        user_id = context.user_id
+        with span("rehydrate"):
+            music_data = load_cached_music_data(user_id)
+            if music_data is None:
+                # Cache evicted from disk too: run the full initialization again
+                context.initialized = False
+                raise SessionNotFound(f"Cached data of user {user_id} is gone, initialize again")
+            knowledge_base = MusicKnowledgeBase(
+                user_id=user_id, embedding_model=self._embedding_model, client=self.vector_client
+            )
+            advisor = MusicAdvisor(knowledge_base, music_data, context.session, llm=self.llm)
+            snapshot = UserStore(user_id).read_json(SESSION_SNAPSHOT_FILE)
+            if snapshot:
+                advisor.memory.load_dict(snapshot.get('conversation', {}))
+
+            context.music_data = music_data
+            context.knowledge_base = knowledge_base
+            context.advisor = advisor
+            context.collected_at = music_data_collected_at(user_id)
+        print(f"Session of {user_id} rehydrated")
+        return music_data
+
+    def _save_snapshot(self, context):
+        """Persist what can't be rebuilt from the data cache: the conversation"""
+        conversation = context.advisor.memory.to_dict()
+        for turn in conversation['turns']:
+            turn['vector'] = _json_safe(turn.get('vector'))
+        UserStore(context.user_id).write_json(SESSION_SNAPSHOT_FILE, {
+            'conversation': conversation,
+            'saved_at': time.time(),
+        })
+
+    def evict_idle(self, idle_seconds, expire_seconds=None):
+        """
+        Drop the heavy objects of sessions idle for `idle_seconds` (snapshot first), and
+        log out sessions idle for `expire_seconds`
+        Returns: (evicted, expired) counts
+        """
+        now = time.time()
+        with self._lock:
+            contexts = list(self._users.values())
+
+        evicted = expired = 0
+        for context in contexts:
+            idle = now - context.last_active
+            if expire_seconds is not None and idle >= expire_seconds:
+                self.logout(context.user_id)
+                expired += 1
+                continue
+            if idle < idle_seconds or context.advisor is None:
+                continue
+            # Skip users with an initialize/update/refresh in progress
+            if not context.lock.acquire(blocking=False):
+                continue
+            try:
+                if time.time() - context.last_active < idle_seconds or context.advisor is None:
+                    continue
+                self._save_snapshot(context)
+                context.advisor = None
+                context.knowledge_base = None
+                context.music_data = None
+                evicted += 1
+            except Exception as e:
+                print(f"Error evicting session of {context.user_id}: {e}")
+            finally:
+                context.lock.release()
+        return evicted, expired
+
+    def hydrated_users(self):
+        """Users whose heavy objects are in memory"""
+        with self._lock:
+            return sum(1 for c in self._users.values() if c.advisor is not None)
+
+    def ask(self, user_id, question):
+        context, advisor = self._advisor(user_id)
+        answer = advisor.ask(question)
+        # The advisor may have (re)collected data during auto-initialization
+        if advisor.music_data and context.advisor is advisor:
+            context.music_data = advisor.music_data
+        return answer
+
+    def analyze_profile(self, user_id):
+        return self._advisor(user_id)[1].analyze_profile()
+
+    def search(self, user_id, query, k=5):
+        """Knowledge base search results as plain dicts"""
+        documents = self._advisor(user_id)[1].knowledge_base.search(query, k=k)
+        return [{'content': doc.page_content, 'metadata': doc.metadata} for doc in documents]
+
+    def clear_conversation(self, user_id):
+        self._advisor(user_id)[1].clear_conversation_history()
+
+    def music_data(self, user_id):
+        return self._advisor(user_id)[1].music_data
+
+    def logout(self, user_id):
+        """Forget the user's session; cached data on disk is kept for the next login"""
+        if self._drop(user_id):
+            # The next login starts a new conversation
+            UserStore(user_id).delete(SESSION_SNAPSHOT_FILE)
+
+    def _drop(self, user_id):
+        with self._lock:
+            context = self._users.pop(user_id, None)
+        if context is not None:
+            context.session.close()
+        return context is not None
+
+    def active_users(self):
+        with self._lock:
+            return len(self._users)
+
+    def live_users(self):
+        """IDs of every logged-in user, including sessions evicted to their snapshot"""
+        with self._lock:
+            return list(self._users)
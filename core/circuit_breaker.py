@@ -0,0 +1,165 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .metrics import REGISTRY
+
+# Vector searches slower than this count against the breaker (latency SLO)
+VECTOR_SEARCH_SLO_MS = float(os.getenv("CHATIFY_VECTOR_SEARCH_SLO_MS", "1500"))
+
+# A chat turn stops waiting for the vector store after this long and answers from the fallback
+VECTOR_SEARCH_TIMEOUT_SECONDS = float(os.getenv("CHATIFY_VECTOR_SEARCH_TIMEOUT_SECONDS", "5"))
+
+# Seconds the breaker stays open before letting one probe search through
+VECTOR_BREAKER_COOLDOWN_SECONDS = float(os.getenv("CHATIFY_VECTOR_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# The breaker opens when more than this share of the recent calls failed or missed the SLO
+FAILURE_RATIO = 0.5
+WINDOW = 20
+MIN_CALLS = 5
+
+# Searches in flight; timed out calls keep their thread until the store answers
+SEARCH_THREADS = 16
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+class CircuitOpen(RuntimeError):
+    """The breaker is open: the call was not attempted"""
+
+
+class CallTimeout(TimeoutError):
+    """The call exceeded the breaker's deadline (it keeps running in the background)"""
+
+
+def get_vector_search_breaker():
+    """Process-wide breaker around vector store reads (shared: a slow cluster is slow for everyone)"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            from .music_knowledge_base import KnowledgeBaseMissing
+            _breaker = CircuitBreaker(
+                "vector_search", slo_seconds=VECTOR_SEARCH_SLO_MS / 1000,
+                timeout=VECTOR_SEARCH_TIMEOUT_SECONDS, cooldown=VECTOR_BREAKER_COOLDOWN_SECONDS,
+                ignore=(KnowledgeBaseMissing,)
+            )
+        return _breaker
+
+
+class CircuitBreaker:
+    """
+    Latency-SLO circuit breaker: call(func, ...) runs func with a deadline
+    - closed: calls go through; each one that raises, times out or is slower than
+      `slo_seconds` is a failure. Over the last `window` calls (at least `min_calls`),
+      a failure share above `failure_ratio` opens the breaker
+    - open: calls raise CircuitOpen immediately for `cooldown` seconds
+    - half_open: one probe call goes through; success closes the breaker, failure reopens it
+    - Metrics: chatify_circuit_state gauge (0 closed, 1 half open, 2 open) and
+      chatify_circuit_transitions_total per breaker and state
+    Args:
+        name: Label in the metrics
+        slo_seconds: Calls slower than this count as failures (None: only errors count)
+        timeout: Deadline in seconds (None: wait for the call)
+        ignore: Exception types that don't count as failures (e.g. a missing collection)
+    """
+
+    def __init__(self, name, slo_seconds=None, timeout=None, failure_ratio=FAILURE_RATIO, window=WINDOW,
+                 min_calls=MIN_CALLS, cooldown=VECTOR_BREAKER_COOLDOWN_SECONDS, ignore=(), threads=SEARCH_THREADS):
+        self.name = name
+        self.slo_seconds = slo_seconds
+        self.timeout = timeout
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.ignore = tuple(ignore)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"chatify-{name}") if timeout else None
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        REGISTRY.set_gauge("chatify_circuit_state", STATE_VALUES[CLOSED], breaker=name)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return HALF_OPEN
+            return self._state
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) through the breaker
+        Raises: CircuitOpen, CallTimeout, or whatever func raised
+        """
+        probe = self._before_call()
+        start = time.perf_counter()
+        try:
+            result = self._run(func, args, kwargs)
+        except self.ignore:
+            self._record(True, probe)
+            raise
+        except BaseException:
+            self._record(False, probe)
+            raise
+        self._record(self.slo_seconds is None or time.perf_counter() - start <= self.slo_seconds, probe)
+        return result
+
+    def _run(self, func, args, kwargs):
+        if self.pool is None:
+            return func(*args, **kwargs)
+        # Spans and the metrics user follow the call into the pool thread
+        future = self.pool.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise CallTimeout(f"{self.name} took longer than {self.timeout:g}s") from None
+
+    def _before_call(self):
+        """Returns: True if this call is the half-open probe"""
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                    raise CircuitOpen(f"{self.name} circuit is open")
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpen(f"{self.name} circuit is half open, probe in flight")
+                self._probing = True
+                return True
+            return False
+
+    def _record(self, success, probe):
+        with self._lock:
+            if probe:
+                self._probing = False
+                self._outcomes.clear()
+                self._transition(CLOSED if success else OPEN)
+                return
+            if self._state != CLOSED:
+                # Started before the breaker opened
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) > self.failure_ratio):
+                self._outcomes.clear()
+                self._transition(OPEN)
+
+    def _transition(self, state):
+        """Caller holds self._lock"""
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != self._state:
+            print(f"Circuit {self.name}: {self._state} -> {state}")
+            self._state = state
+            REGISTRY.set_gauge("chatify_circuit_state", STATE_VALUES[state], breaker=self.name)
+            REGISTRY.increment("chatify_circuit_transitions_total", breaker=self.name, state=state)
@@ -0,0 +1,229 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Rough token estimate (~4 characters per token for Gemini/English-Spanish text)
+CHARS_PER_TOKEN = 4
+
+# One shared worker for summaries and turn embeddings, off the chat critical path
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chatify-memory")
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + " ..."
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ConversationMemory:
+    """
+    Bounded conversation memory for MusicAdvisor
+    - Recent turns are kept verbatim while they fit in recent_token_budget
+    - Older turns are folded into a running summary in the background
+    - Older turns are embedded so the ones relevant to a new question can be recalled;
+      only the last max_recall_turns of them are kept, earlier ones live on in the summary
+    Args:
+        summarizer: callable(previous_summary, transcript) -> new summary (e.g. an LLM call)
+        embedding_model: Object with embed_query (or a zero-argument callable returning one,
+                         resolved on first use), used to recall relevant older turns
+        recent_token_budget: Token budget for verbatim recent turns
+        max_message_tokens: Each message is truncated to this many tokens in the prompt
+        summary_token_budget: Maximum size of the running summary
+        recall_k: Older turns recalled per question
+        max_recall_turns: Summarized turns kept for recall (bounds memory, snapshot size and recall cost)
+    """
+
+    def __init__(self, summarizer=None, embedding_model=None, recent_token_budget=800,
+                 max_message_tokens=250, summary_token_budget=300, recall_k=2, min_recall_similarity=0.3,
+                 max_recall_turns=50):
+        self.summarizer = summarizer
+        self._embedding_model = embedding_model
+        self.recent_token_budget = recent_token_budget
+        self.max_message_tokens = max_message_tokens
+        self.summary_token_budget = summary_token_budget
+        self.recall_k = recall_k
+        self.min_recall_similarity = min_recall_similarity
+        self.max_recall_turns = max_recall_turns
+
+        self._lock = threading.Lock()
+        self.turns = []
+        self.summary = ""
+        self._recent_start = 0
+        self._summarized_upto = 0
+        self._summary_running = False
+        # Bumped when the turns are replaced (clear, load), so a summary of the old ones is dropped
+        self._generation = 0
+
+    @property
+    def embedding_model(self):
+        model = self._embedding_model
+        if callable(model) and not hasattr(model, 'embed_query'):
+            model = self._embedding_model = model()
+        return model
+
+    def _turn_text(self, turn):
+        question = truncate_to_tokens(turn['question'], self.max_message_tokens)
+        answer = truncate_to_tokens(turn['answer'], self.max_message_tokens)
+        return f"User: {question}\nChatify: {answer}\n"
+
+    def add_turn(self, question, answer):
+        """Store a question/answer pair and schedule background summarization/embedding"""
+        turn = {'question': question, 'answer': answer, 'vector': None}
+        with self._lock:
+            self.turns.append(turn)
+            index = len(self.turns) - 1
+
+            # Slide the verbatim window forward until it fits the budget (always keep the last turn)
+            recent_tokens = sum(estimate_tokens(self._turn_text(t)) for t in self.turns[self._recent_start:])
+            while self._recent_start < index and recent_tokens > self.recent_token_budget:
+                recent_tokens -= estimate_tokens(self._turn_text(self.turns[self._recent_start]))
+                self._recent_start += 1
+
+        if self._embedding_model is not None:
+            _background.submit(self._embed_turn, turn)
+        self._schedule_summary()
+
+    def _embed_turn(self, turn):
+        try:
+            if self.embedding_model is None:
+                return
+            turn['vector'] = self.embedding_model.embed_query(f"{turn['question']}\n{turn['answer'][:200]}")
+        except Exception as e:
+            print(f"Error embedding conversation turn: {e}")
+
+    def _schedule_summary(self):
+        with self._lock:
+            if self._summary_running or self._summarized_upto >= self._recent_start:
+                return
+            self._summary_running = True
+        _background.submit(self._update_summary)
+
+    def _update_summary(self):
+        try:
+            while True:
+                with self._lock:
+                    pending = self.turns[self._summarized_upto:self._recent_start]
+                    upto = self._recent_start
+                    previous = self.summary
+                    generation = self._generation
+                    if not pending:
+                        # In the same critical section as the check, so an add_turn racing with
+                        # the exit either is seen here or schedules a new run
+                        self._summary_running = False
+                        return
+
+                transcript = ''.join(self._turn_text(t) for t in pending)
+                summary = None
+                if self.summarizer is not None:
+                    try:
+                        summary = self.summarizer(previous, transcript)
+                    except Exception as e:
+                        print(f"Error summarizing conversation: {e}")
+                if not summary:
+                    # Extractive fallback: keep the user's questions
+                    questions = '; '.join(truncate_to_tokens(t['question'], 40) for t in pending)
+                    summary = f"{previous} Earlier the user asked: {questions}.".strip()
+
+                with self._lock:
+                    if generation != self._generation:
+                        # Cleared (or reloaded) while the LLM was summarizing: start over
+                        continue
+                    self.summary = truncate_to_tokens(summary, self.summary_token_budget)
+                    self._summarized_upto = upto
+                    self._trim_summarized()
+        except BaseException:
+            with self._lock:
+                self._summary_running = False
+            raise
+
+    def _trim_summarized(self):
+        """Forget summarized turns beyond the recall window (caller holds the lock)"""
+        drop = min(self._summarized_upto, self._recent_start - self.max_recall_turns)
+        if drop > 0:
+            del self.turns[:drop]
+            self._recent_start -= drop
+            self._summarized_upto -= drop
+
+    def _recall(self, question):
+        """Older (non-verbatim) turns most similar to the question"""
+        with self._lock:
+            older = [t for t in self.turns[:self._recent_start] if t['vector'] is not None]
+        if not older or self.embedding_model is None or self.recall_k <= 0:
+            return []
+        try:
+            query_vector = self.embedding_model.embed_query(question)
+        except Exception as e:
+            print(f"Error embedding question for recall: {e}")
+            return []
+        scored = sorted(((_cosine(query_vector, t['vector']), t) for t in older), key=lambda x: x[0], reverse=True)
+        return [t for score, t in scored[:self.recall_k] if score >= self.min_recall_similarity]
+
+    def build_context(self, question=None):
+        """Prompt section with the running summary, recalled turns and recent turns"""
+        with self._lock:
+            summary = self.summary
+            recent = list(self.turns[self._recent_start:])
+        if not recent and not summary:
+            return ""
+
+        context = ""
+        if summary:
+            context += f"SUMMARY OF EARLIER CONVERSATION:\n{summary}\n\n"
+
+        recalled = self._recall(question) if question else []
+        if recalled:
+            context += "RELEVANT EARLIER EXCHANGES:\n"
+            context += ''.join(self._turn_text(t) for t in recalled) + "\n"
+
+        context += "PREVIOUS CONVERSATION CONTEXT:\n"
+        context += ''.join(self._turn_text(t) for t in recent)
+        return context + "\n"
+
+    def messages(self):
+        """Stored turns (recent and recallable ones) as role/content messages"""
+        with self._lock:
+            turns = list(self.turns)
+        messages = []
+        for turn in turns:
+            messages.append({"role": "user", "content": turn['question']})
+            messages.append({"role": "assistant", "content": turn['answer']})
+        return messages
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.turns = []
+            self.summary = ""
+            self._recent_start = 0
+            self._summarized_upto = 0
+
+    def to_dict(self):
+        """Serializable state (vectors included so recall survives a reload)"""
+        with self._lock:
+            return {
+                'turns': [dict(t) for t in self.turns],
+                'summary': self.summary,
+                'recent_start': self._recent_start,
+                'summarized_upto': self._summarized_upto,
+            }
+
+    def load_dict(self, state):
+        with self._lock:
+            self._generation += 1
+            self.turns = [dict(t) for t in state.get('turns', [])]
+            self.summary = state.get('summary', "")
+            self._recent_start = min(state.get('recent_start', 0), len(self.turns))
+            self._summarized_upto = min(state.get('summarized_upto', 0), self._recent_start)
+            self._trim_summarized()
+        self._schedule_summary()
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .metrics import span
+
+
+def available_cores():
+    """Cores this process may run on (in a container, its CPU set rather than the host's cores)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # No affinity API (macOS, Windows)
+        return os.cpu_count() or 1
+
+
+# Default cap on the worker count: every worker holds its own copy of the model
+MAX_DEFAULT_EMBEDDING_WORKERS = 4
+
+# Embedding processes for large ingestions (1 keeps everything in the calling thread)
+EMBEDDING_WORKERS = int(os.getenv("CHATIFY_EMBEDDING_WORKERS")
+                        or min(available_cores(), MAX_DEFAULT_EMBEDDING_WORKERS))
+
+# Workers exit (freeing their models) once the pool has been idle this long; 0 keeps them
+EMBEDDING_POOL_IDLE_SECONDS = float(os.getenv("CHATIFY_EMBEDDING_POOL_IDLE_SECONDS", "120"))
+
+# Documents per shard sent to a worker
+EMBEDDING_SHARD_SIZE = int(os.getenv("CHATIFY_EMBEDDING_SHARD_SIZE", "256"))
+
+# Below this many documents the process pool costs more than it saves
+PARALLEL_MIN_DOCUMENTS = int(os.getenv("CHATIFY_EMBEDDING_PARALLEL_MIN_DOCUMENTS", "2000"))
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+# Embedding model of a worker process, loaded once by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_spec):
+    global _worker_model
+    # Each worker gets one core: the pool, not the model, provides the parallelism
+    os.environ["OMP_NUM_THREADS"] = "1"
+    if isinstance(model_spec, str):
+        from .embeddings import get_embedding_model
+        _worker_model = get_embedding_model(model_spec)
+    else:
+        _worker_model = model_spec
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def _embed_shard(texts):
+    """
+    Embed one shard in a worker; the vectors go back through a shared memory block
+    Returns: (shared memory name, shape), the caller reads and unlinks the block
+    """
+    if hasattr(_worker_model, "embed_array"):
+        vectors = _worker_model.embed_array(texts)
+    else:
+        vectors = np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+    shm = SharedMemory(create=True, size=max(vectors.nbytes, 1))
+    np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+    name = shm.name
+    shm.close()
+    return name, vectors.shape
+
+
+def get_embedding_pipeline(backend=None, workers=None):
+    """
+    Process-wide pipeline for the shared embedding model (CHATIFY_EMBEDDING_BACKEND)
+    Returns: EmbeddingPipeline, or None if only one worker is configured
+    """
+    workers = workers or EMBEDDING_WORKERS
+    if workers <= 1:
+        return None
+    backend = (backend or os.getenv("CHATIFY_EMBEDDING_BACKEND", "torch")).lower()
+    with _pipelines_lock:
+        if (backend, workers) not in _pipelines:
+            _pipelines[(backend, workers)] = EmbeddingPipeline(backend, workers=workers)
+        return _pipelines[(backend, workers)]
+
+
+class EmbeddingPipeline:
+    """
+    Embeds documents on a pool of processes while the caller uploads finished shards
+    - Indexed documents are split into shards and embedded in parallel, one model per worker
+    - Vectors come back through shared memory, not pickled lists of floats
+    - Every finished shard is uploaded right away, so upload overlaps embedding
+    Args:
+        model_spec: Embedding backend name ("torch", "onnx") or a picklable model object
+        workers: Number of processes
+        shard_size: Documents per shard
+        idle_seconds: Shut the workers down after this long without work (0: never); the
+                      next ingestion starts them again
+    """
+
+    def __init__(self, model_spec, workers=EMBEDDING_WORKERS, shard_size=EMBEDDING_SHARD_SIZE,
+                 idle_seconds=EMBEDDING_POOL_IDLE_SECONDS):
+        self.model_spec = model_spec
+        self.workers = max(1, workers)
+        self.shard_size = shard_size
+        self.idle_seconds = idle_seconds
+        self._pool = None
+        self._lock = threading.Lock()
+        # Ingestions using the pool, and the pending idle shutdown
+        self._active = 0
+        self._last_used = 0.0
+        self._idle_timer = None
+
+    @property
+    def pool(self):
+        # spawn: torch and ONNX Runtime don't survive a fork of a process that already uses them
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_spec,)
+                )
+            return self._pool
+
+    def _acquire(self):
+        with self._lock:
+            self._active += 1
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+
+    def _release_pool(self):
+        with self._lock:
+            self._active -= 1
+            self._last_used = time.monotonic()
+            if self._active == 0 and self.idle_seconds > 0 and self._pool is not None:
+                self._idle_timer = threading.Timer(self.idle_seconds, self._shutdown_if_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _shutdown_if_idle(self):
+        with self._lock:
+            if (self._active or self._pool is None
+                    or time.monotonic() - self._last_used < self.idle_seconds):
+                return
+            pool, self._pool, self._idle_timer = self._pool, None, None
+        print(f"Embedding pool idle for {self.idle_seconds:g}s, stopping its {self.workers} workers")
+        pool.shutdown(wait=False)
+
+    def warm_up(self):
+        """Start the workers and load their models now"""
+        self._acquire()
+        try:
+            for name, _ in self.pool.map(_embed_shard, [["warm up"]] * self.workers):
+                self._release(name)
+        finally:
+            self._release_pool()
+
+    def embed_and_upload(self, documents, upload):
+        """
+        Args:
+            documents: Documents to ingest (metadata "indexed": False means no vector)
+            upload: Callable(documents, vectors) storing one batch
+        Returns: Number of documents embedded
+        """
+        indexed = [doc for doc in documents if doc.metadata.get("indexed", True)]
+        unindexed = [doc for doc in documents if not doc.metadata.get("indexed", True)]
+        if unindexed:
+            upload(unindexed, [None] * len(unindexed))
+
+        shards = [indexed[i:i + self.shard_size] for i in range(0, len(indexed), self.shard_size)]
+        self._acquire()
+        try:
+            self._embed_shards(shards, upload)
+        finally:
+            self._release_pool()
+        return len(indexed)
+
+    def _embed_shards(self, shards, upload):
+        with span("embedding.pipeline"):
+            pending = {
+                self.pool.submit(_embed_shard, [doc.page_content for doc in shard]): shard
+                for shard in shards
+            }
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        shard = pending.pop(future)
+                        self._upload_shard(future.result(), shard, upload)
+            finally:
+                # On error, drop the blocks of shards nobody will read
+                for future in pending:
+                    if not future.cancel():
+                        try:
+                            self._release(future.result()[0])
+                        except Exception:
+                            pass
+
+    def _upload_shard(self, result, shard, upload):
+        name, shape = result
+        shm = SharedMemory(name=name)
+        try:
+            # One memcpy out of the block, so no view outlives it
+            vectors = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        upload(shard, vectors)
+
+    @staticmethod
+    def _release(name):
+        shm = SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
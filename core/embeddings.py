@@ -0,0 +1,159 @@
+import os
+import threading
+
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_SEQ_LENGTH = 256
+
+# Where the exported/quantized ONNX model lives (prefetched at image build time)
+ONNX_MODEL_DIR = os.getenv("CHATIFY_ONNX_MODEL_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(backend=None):
+    """
+    Process-wide embedding model, shared by every session
+    Args:
+        backend: "torch" (sentence-transformers via HuggingFaceEmbeddings) or
+                 "onnx" (int8 quantized ONNX Runtime); defaults to CHATIFY_EMBEDDING_BACKEND
+    """
+    backend = (backend or os.getenv("CHATIFY_EMBEDDING_BACKEND", "torch")).lower()
+    with _models_lock:
+        if backend not in _models:
+            if backend == "onnx":
+                _models[backend] = OnnxMiniLMEmbeddings()
+            elif backend == "torch":
+                from langchain_huggingface import HuggingFaceEmbeddings
+                _models[backend] = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+            else:
+                raise ValueError(f"Unknown embedding backend: {backend}")
+        return _models[backend]
+
+
+def export_quantized_onnx(model_dir=ONNX_MODEL_DIR, model_name=MODEL_NAME):
+    """
+    Export all-MiniLM-L6-v2 to ONNX and apply int8 dynamic quantization
+    Needs torch + transformers (build time only) and onnx, which onnxruntime's quantizer
+    imports but onnxruntime doesn't install; inference only needs onnxruntime.
+    Returns: path of the quantized model
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model_int8.onnx")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["Chatify export sample"], return_tensors="pt")
+    inputs = (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in
+                    ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")}
+    export_kwargs = dict(
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=14,
+    )
+    with torch.no_grad():
+        try:
+            torch.onnx.export(model, inputs, fp32_path, dynamo=False, **export_kwargs)
+        except TypeError:
+            # torch < 2.5 has no dynamo flag (and uses the TorchScript exporter already)
+            torch.onnx.export(model, inputs, fp32_path, **export_kwargs)
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Quantized ONNX model written to {int8_path}")
+    return int8_path
+
+
+class OnnxMiniLMEmbeddings:
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime with int8 dynamic quantization
+    Same embed_query/embed_documents surface as HuggingFaceEmbeddings
+    (mean pooling + L2 normalization, like the sentence-transformers pipeline).
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, batch_size=32, intra_op_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model_int8.onnx")
+        if not os.path.exists(model_path):
+            print(f"ONNX model not found in {model_dir}, exporting (run prefetch at build time to avoid this)")
+            model_path = export_quantized_onnx(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_array(self, texts):
+        """Embeddings as a float32 (n, 384) array"""
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+        # Sort by length so each batch pads to a similar size
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = np.empty((len(texts), 384), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            result[batch] = self._embed_batch([texts[i] for i in batch])
+        return result
+
+    def embed_documents(self, texts):
+        return self.embed_array(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+
+def prefetch_models(backends=("torch", "onnx")):
+    """
+    Download (torch) and export (onnx) model weights ahead of time, e.g. at image build,
+    so that app startup never downloads anything
+    """
+    for backend in backends:
+        if backend == "torch":
+            from huggingface_hub import snapshot_download
+            path = snapshot_download(MODEL_NAME)
+            print(f"Model weights cached at {path}")
+        elif backend == "onnx":
+            if not os.path.exists(os.path.join(ONNX_MODEL_DIR, "model_int8.onnx")):
+                export_quantized_onnx()
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+if __name__ == "__main__":
+    # python -m core.embeddings [torch,onnx]
+    import sys
+    prefetch_models([b for b in (sys.argv[1] if len(sys.argv) > 1 else "torch,onnx").split(",") if b])
@@ -0,0 +1,128 @@
+import re
+import unicodedata
+
+# Kinds of names indexed, in the order matches are reported
+ENTITY_KINDS = ('artist', 'track', 'album')
+
+# Single-word names that are also everyday words would match most questions
+STOPWORDS = {
+    'a', 'an', 'and', 'the', 'of', 'to', 'in', 'on', 'my', 'me', 'i', 'you', 'is', 'it', 'what', 'who',
+    'songs', 'song', 'music', 'like', 'love', 'more', 'best', 'top', 'new', 'one', 'all',
+    'el', 'la', 'los', 'las', 'de', 'del', 'y', 'que', 'mi', 'mis', 'tu', 'un', 'una', 'yo', 'en',
+    'canciones', 'cancion', 'musica', 'mas', 'por', 'para', 'con', 'se', 'lo', 'es',
+}
+
+# Shortest single-word name that is indexed
+MIN_SINGLE_TOKEN_LENGTH = 3
+
+# Names matched in a question only replace similarity search when they make up this share of
+# its words; otherwise their documents go first and a smaller search (k) fills in the rest
+ENTITY_ONLY_COVERAGE = 0.6
+ENTITY_SEARCH_K = 3
+
+
+def strip_accents(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def normalize(text):
+    """Lowercase, accent-free tokens ("Beyoncé - Halo!" -> ['beyonce', 'halo'])"""
+    return re.findall(r"[a-z0-9]+", strip_accents(text).lower())
+
+
+def name_coverage(text, entities):
+    """
+    Share of the words of `text` (stopwords aside) that belong to the given names:
+    1.0 for "Radiohead?", low when a name is only part of the question
+    ("tell me something about my taste" naming the song "Tell Me Something")
+    """
+    words = [token for token in normalize(text) if token not in STOPWORDS]
+    if not words:
+        return 1.0 if entities else 0.0
+    name_tokens = {token for _, name in entities for token in normalize(name)}
+    return sum(token in name_tokens for token in words) / len(words)
+
+
+class EntityIndex:
+    """
+    Inverted index of the user's artist, track and album names
+    Names are stored as normalized token sequences keyed by their first token, so
+    finding every name mentioned in a question is one dictionary lookup per word
+    plus a comparison of the few candidates (microseconds, no embedding).
+    """
+
+    def __init__(self, entities=None):
+        # (kind, name) -> tokens, and first token -> [(tokens, kind, name)]
+        self.entities = {}
+        self._by_first_token = {}
+        for kind, name in entities or []:
+            self.add(kind, name)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def add(self, kind, name):
+        tokens = tuple(normalize(name))
+        if not tokens or (kind, name) in self.entities:
+            return
+        if len(tokens) == 1 and (len(tokens[0]) < MIN_SINGLE_TOKEN_LENGTH or tokens[0] in STOPWORDS):
+            return
+        self.entities[(kind, name)] = tokens
+        self._by_first_token.setdefault(tokens[0], []).append((tokens, kind, name))
+
+    @classmethod
+    def from_music_data(cls, music_data):
+        """Index every artist, saved/top/playlist track and album of the user"""
+        index = cls()
+        for artist in music_data.get('top_artists', []):
+            index.add('artist', artist['name'])
+        for artist in music_data.get('artists_info', {}).values():
+            index.add('artist', artist['name'])
+
+        tracks = list(music_data.get('top_tracks', [])) + list(music_data.get('saved_tracks', []))
+        for playlist_tracks in music_data.get('playlist_tracks', {}).values():
+            tracks.extend(playlist_tracks)
+        for track in tracks:
+            index.add('track', track['name'])
+            for artist in track.get('artists', []):
+                index.add('artist', artist)
+            if track.get('album'):
+                index.add('album', track['album'])
+        return index
+
+    def find(self, text):
+        """
+        Names mentioned in `text`, longest match first at each position.
+        One-word names only count when written as in the library ("Yesterday" the song,
+        not "yesterday" the day).
+        Returns: List of (kind, name)
+        """
+        tokens = normalize(text)
+        folded = strip_accents(text)
+        found = []
+        position = 0
+        while position < len(tokens):
+            candidates = self._by_first_token.get(tokens[position], ())
+            matches = [
+                (len(entity_tokens), kind, name) for entity_tokens, kind, name in candidates
+                if tuple(tokens[position:position + len(entity_tokens)]) == entity_tokens
+                and (len(entity_tokens) > 1 or strip_accents(name) in folded)
+            ]
+            if not matches:
+                position += 1
+                continue
+            longest = max(length for length, _, _ in matches)
+            for length, kind, name in matches:
+                # Same words can name an artist, a song and an album at once
+                if length == longest and (kind, name) not in found:
+                    found.append((kind, name))
+            position += longest
+        return sorted(found, key=lambda entity: ENTITY_KINDS.index(entity[0]))
+
+    def to_dict(self):
+        return {'entities': [[kind, name] for kind, name in self.entities]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls((kind, name) for kind, name in (data or {}).get('entities', []))
@@ -0,0 +1,111 @@
+import math
+import threading
+from collections import Counter, defaultdict
+
+from .entity_index import ENTITY_ONLY_COVERAGE, ENTITY_SEARCH_K, STOPWORDS, name_coverage, normalize
+from .metrics import span
+
+# BM25 parameters of the keyword scoring
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class FallbackRetriever:
+    """
+    In-memory retrieval over the user's music_data, used while the vector store is unavailable
+    Builds the same documents as the knowledge base (no embedding) on first use, then answers:
+    - names found by the entity index: documents whose artist/track/album fields match exactly,
+      followed by a few keyword matches unless the names are the whole question
+    - anything else: BM25 keyword scoring over the documents that would carry a vector
+    - no keyword match either ("recommend me something"): the profile and top artists
+    Quality is below vector search for vague questions, but it costs no network call.
+    Args:
+        knowledge_base: MusicKnowledgeBase (document builders, entity index, search limit)
+        music_data: The user's collected data
+    """
+
+    def __init__(self, knowledge_base, music_data):
+        self.knowledge_base = knowledge_base
+        self.music_data = music_data
+        self._lock = threading.Lock()
+        self._documents = None
+        self._postings = None
+        self._lengths = None
+        self._average_length = 0.0
+
+    def _build(self):
+        with self._lock:
+            if self._documents is not None:
+                return
+            with span("fallback.build"):
+                documents = self.knowledge_base._create_documents(self.music_data)
+                if not any(doc.metadata.get("type") == "playlist_tracks" for doc in documents):
+                    # Rollup mode adds playlists after the background playlist sync
+                    documents += self.knowledge_base._create_playlist_documents(self.music_data)
+                postings, lengths = defaultdict(list), []
+                for i, doc in enumerate(documents):
+                    tokens = normalize(doc.page_content) if doc.metadata.get("indexed", True) else []
+                    lengths.append(len(tokens))
+                    for token, count in Counter(tokens).items():
+                        postings[token].append((i, count))
+                indexed = [length for length in lengths if length]
+                self._average_length = sum(indexed) / len(indexed) if indexed else 0.0
+                self._postings, self._lengths = dict(postings), lengths
+                self._documents = documents
+
+    def search(self, question, k=None):
+        """
+        Documents about the question, best first
+        Args:
+            k: Maximum number of documents (defaults to the knowledge base's search limit)
+        """
+        self._build()
+        k = k or self.knowledge_base.search_limit
+        with span("fallback.search"):
+            entities, named = self._named(question, k)
+            if named and name_coverage(question, entities) >= ENTITY_ONLY_COVERAGE:
+                return named
+            keyword = self._keyword(question, ENTITY_SEARCH_K if named else k)
+            return named + [doc for doc in keyword if doc not in named] or self._overview(k)
+
+    def _named(self, question, k):
+        """
+        Exact matches of the names the entity index finds in the question
+        Returns: (entities, documents)
+        """
+        index = self.knowledge_base.entity_index
+        entities = index.find(question) if index is not None else []
+        if not entities:
+            return [], []
+        named, artist_tracks = [], []
+        fields = {"artist": "artist_name", "track": "track_name", "album": "album_name"}
+        for doc in self._documents:
+            metadata = doc.metadata
+            if any(metadata.get(fields[kind]) == name for kind, name in entities if kind in fields):
+                named.append(doc)
+            elif any(metadata.get("artists") == name or name in (metadata.get("artist_list") or [])
+                     for kind, name in entities if kind == "artist"):
+                artist_tracks.append(doc)
+        # The named documents first, then the songs of named artists (like MusicKnowledgeBase.lookup)
+        return entities, (named + artist_tracks)[:k]
+
+    def _keyword(self, question, k):
+        """BM25 over the indexed documents"""
+        scores = defaultdict(float)
+        total = len(self._documents)
+        for token in set(normalize(question)) - STOPWORDS:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._average_length or 1))
+                scores[i] += idf * count * (BM25_K1 + 1) / (count + norm)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [self._documents[i] for i in best]
+
+    def _overview(self, k):
+        """Profile summary and artist documents, in the order they were collected (top artists first)"""
+        overview = [doc for doc in self._documents
+                    if doc.metadata.get("type") in ("user_profile", "artist", "artist_rollup")]
+        return overview[:k]
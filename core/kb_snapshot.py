@@ -0,0 +1,149 @@
+"""
+Binary snapshot of a knowledge base collection: properties and vectors, no embedding needed to restore
+
+Layout (the whole file is one gzip stream, written and read record by record):
+    magic b"CHKBSNAP", uint16 version, uint32 header length, header JSON
+    per object: uint32 properties length (> 0), properties JSON, 16-byte UUID,
+                uint8 flags (1 = has vector), then dim values of the header's dtype
+    uint32 0 (end of records), uint64 object count
+"""
+import gzip
+import json
+import os
+import struct
+import uuid as uuid_lib
+
+import numpy as np
+
+MAGIC = b"CHKBSNAP"
+VERSION = 1
+
+# Vectors are stored as float16 by default: half the size, no measurable recall loss
+SNAPSHOT_DTYPES = ("float16", "float32")
+
+_HAS_VECTOR = 1
+
+
+class SnapshotError(ValueError):
+    """Missing, truncated, corrupt or incompatible snapshot"""
+
+
+def _vector_values(vector):
+    """Weaviate v4 returns {"default": [...]} (named vectors); the local store and batches use plain lists"""
+    if isinstance(vector, dict):
+        vector = vector.get("default", next(iter(vector.values()), None))
+    if vector is None or len(vector) == 0:
+        return None
+    return vector
+
+
+def write_snapshot(path, header, objects, dtype="float16"):
+    """
+    Stream objects into a snapshot file (written to a temporary file, then renamed)
+    Args:
+        path: Destination file
+        header: JSON-serializable metadata (collection, model, ingestion mode, ...)
+        objects: Iterable of (uuid, properties, vector or None)
+        dtype: "float16" or "float32"
+    Returns: Number of objects written
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unknown snapshot dtype: {dtype}")
+    objects = iter(objects)
+    # The vector size goes in the header, so look ahead to the first vector
+    buffered, dim = [], None
+    for obj in objects:
+        buffered.append(obj)
+        vector = _vector_values(obj[2])
+        if vector is not None:
+            dim = len(vector)
+            break
+
+    header = dict(header, version=VERSION, dim=dim, dtype=dtype)
+    header_bytes = json.dumps(header).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    count = 0
+    try:
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(MAGIC + struct.pack("<HI", VERSION, len(header_bytes)) + header_bytes)
+            for object_id, properties, vector in _chain(buffered, objects):
+                properties_bytes = json.dumps(properties, ensure_ascii=False).encode("utf-8")
+                f.write(struct.pack("<I", len(properties_bytes)) + properties_bytes)
+                f.write(uuid_lib.UUID(str(object_id)).bytes if object_id else uuid_lib.uuid4().bytes)
+                vector = _vector_values(vector)
+                if vector is None:
+                    f.write(struct.pack("<B", 0))
+                else:
+                    values = np.asarray(vector, dtype=dtype)
+                    if values.shape != (dim,):
+                        raise SnapshotError(f"Vector of size {values.size}, expected {dim}")
+                    f.write(struct.pack("<B", _HAS_VECTOR) + values.tobytes())
+                count += 1
+            f.write(struct.pack("<IQ", 0, count))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+def _chain(first, rest):
+    yield from first
+    yield from rest
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise SnapshotError("Snapshot is truncated")
+    return data
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise SnapshotError("Not a knowledge base snapshot")
+    version, header_length = struct.unpack("<HI", _read_exact(f, 6))
+    if version > VERSION:
+        raise SnapshotError(f"Snapshot version {version} is newer than supported ({VERSION})")
+    return json.loads(_read_exact(f, header_length))
+
+
+def read_snapshot_header(path):
+    """Header of a snapshot without reading its objects"""
+    try:
+        with gzip.open(path, "rb") as f:
+            return _read_header(f)
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"Unreadable snapshot {path}: {e}") from e
+
+
+def read_snapshot(path):
+    """
+    Stream the objects of a snapshot
+    Yields: (uuid string, properties, vector as float32 ndarray or None); raises
+            SnapshotError at the end if the file is truncated or the count doesn't match
+    """
+    try:
+        with gzip.open(path, "rb") as f:
+            header = _read_header(f)
+            dtype = np.dtype(header["dtype"])
+            vector_bytes = (header["dim"] or 0) * dtype.itemsize
+            count = 0
+            while True:
+                (properties_length,) = struct.unpack("<I", _read_exact(f, 4))
+                if properties_length == 0:
+                    break
+                properties = json.loads(_read_exact(f, properties_length))
+                object_id = str(uuid_lib.UUID(bytes=_read_exact(f, 16)))
+                (flags,) = struct.unpack("<B", _read_exact(f, 1))
+                vector = None
+                if flags & _HAS_VECTOR:
+                    vector = np.frombuffer(_read_exact(f, vector_bytes), dtype=dtype).astype(np.float32)
+                count += 1
+                yield object_id, properties, vector
+            (expected,) = struct.unpack("<Q", _read_exact(f, 8))
+            if expected != count:
+                raise SnapshotError(f"Snapshot has {count} objects, footer says {expected}")
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"Unreadable snapshot {path}: {e}") from e
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .metrics import REGISTRY, current_user
+
+# Gemini calls in flight for the whole process (keeps bursts within the API quota)
+LLM_CONCURRENCY = int(os.getenv("CHATIFY_LLM_CONCURRENCY", "8"))
+
+# Deadline of one call, queueing included
+LLM_TIMEOUT_SECONDS = float(os.getenv("CHATIFY_LLM_TIMEOUT_SECONDS", "60"))
+
+# Faster model used for hedged requests and when the primary fails (empty disables it)
+LLM_FALLBACK_MODEL = os.getenv("CHATIFY_LLM_FALLBACK_MODEL", "gemini-2.5-flash-lite")
+
+# A call still running after the primary's p95 latency (never less than this) is hedged
+HEDGE_MIN_SECONDS = float(os.getenv("CHATIFY_LLM_HEDGE_MIN_SECONDS", "2"))
+HEDGE_PERCENTILE = 0.95
+
+# Latencies kept to estimate the p95, and how many are needed before hedging starts
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+class LLMTimeout(TimeoutError):
+    """The LLM call (or its wait for a slot) exceeded its deadline"""
+
+
+def get_llm_gateway():
+    """Process-wide gateway in front of Gemini, shared by every session"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            from .music_advisor import create_llm
+            fallback = create_llm(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else None
+            _gateway = LLMGateway(create_llm(), fallback=fallback)
+        return _gateway
+
+
+def _usage(response):
+    usage = getattr(response, 'usage_metadata', None) or {}
+    return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+
+
+class LLMGateway:
+    """
+    Shared front for the chat model: invoke(prompt) like the model itself
+    - At most `concurrency` calls run at once; waiting calls are served round-robin
+      by user, so one user's burst doesn't starve the others
+    - Every call has a deadline (queue wait included) and raises LLMTimeout past it
+    - A call slower than the primary's p95 is hedged on the fallback model (if a slot
+      is free) and the first answer wins; primary errors go to the fallback too
+    - Metrics: llm.queue_wait / llm.call histograms, token and request counters
+    Args:
+        llm: Primary chat model (anything with invoke(prompt) -> message)
+        fallback: Faster model for hedging and fallback, or None
+        concurrency: Calls in flight
+        timeout: Default deadline in seconds
+    """
+
+    def __init__(self, llm, fallback=None, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT_SECONDS,
+                 hedge_min=HEDGE_MIN_SECONDS, hedge_percentile=HEDGE_PERCENTILE):
+        self.llm = llm
+        self.fallback = fallback
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.hedge_min = hedge_min
+        self.hedge_percentile = hedge_percentile
+
+        # Timed out calls keep their slot (and thread) until the model returns
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="chatify-llm")
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queues = OrderedDict()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # --- slots ---
+
+    def _acquire(self, user, deadline):
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+            while True:
+                if self._active < self.concurrency and self._is_next(user, ticket):
+                    self._dequeue(user)
+                    self._active += 1
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[user].remove(ticket)
+                    if not self._queues[user]:
+                        del self._queues[user]
+                    self._cond.notify_all()
+                    raise LLMTimeout("Timed out waiting for an LLM slot")
+                self._cond.wait(remaining)
+
+    def _is_next(self, user, ticket):
+        first_user = next(iter(self._queues))
+        return first_user == user and self._queues[user][0] is ticket
+
+    def _dequeue(self, user):
+        queue = self._queues[user]
+        queue.popleft()
+        if queue:
+            # The user goes to the back of the rotation
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+
+    def _try_acquire(self):
+        """Take a slot only if it is free and nobody is waiting (hedges never jump the queue)"""
+        with self._cond:
+            if self._active < self.concurrency and not self._queues:
+                self._active += 1
+                return True
+            return False
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    # --- calls ---
+
+    def hedge_delay(self):
+        """Seconds after which a call is hedged (p95 of recent primary calls)"""
+        with self._cond:
+            latencies = sorted(self._latencies)
+        if len(latencies) < LATENCY_MIN_SAMPLES:
+            return max(self.hedge_min, self.timeout / 2)
+        return max(self.hedge_min, latencies[int(self.hedge_percentile * (len(latencies) - 1))])
+
+    def _submit(self, model, prompt, kwargs, role):
+        """
+        Run model.invoke on the pool; the caller must hold a slot, released when it returns
+        Args:
+            role: "primary", "hedged" or "fallback"
+        """
+        label = "primary" if role == "primary" else "fallback"
+
+        def call():
+            start = time.perf_counter()
+            try:
+                response = model.invoke(prompt, **kwargs)
+            finally:
+                self._release()
+            elapsed = time.perf_counter() - start
+            REGISTRY.observe(f"llm.call.{label}", elapsed)
+            if role == "primary":
+                with self._cond:
+                    self._latencies.append(elapsed)
+            tokens_in, tokens_out = _usage(response)
+            REGISTRY.increment("chatify_llm_tokens_total", tokens_in, direction="in", model=label)
+            REGISTRY.increment("chatify_llm_tokens_total", tokens_out, direction="out", model=label)
+            return response
+
+        try:
+            future = self.pool.submit(call)
+        except RuntimeError:
+            self._release()
+            raise
+        future.role = role
+        return future
+
+    def invoke(self, prompt, timeout=None, **kwargs):
+        """
+        Args:
+            prompt: Prompt for the model
+            timeout: Deadline in seconds (defaults to the gateway's)
+        Returns: The model's response message
+        Raises: LLMTimeout, or the model's error if no model answered
+        """
+        user = current_user()
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        queued = time.perf_counter()
+        self._acquire(user, deadline)
+        REGISTRY.observe("llm.queue_wait", time.perf_counter() - queued, user)
+
+        pending = {self._submit(self.llm, prompt, kwargs, "primary")}
+        hedge_at = time.monotonic() + self.hedge_delay() if self.fallback is not None else None
+        error = None
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                REGISTRY.increment("chatify_llm_requests_total", result="timeout")
+                raise LLMTimeout(f"LLM call exceeded {timeout or self.timeout:g}s")
+
+            wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(wait_until - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    result = "ok" if future.role == "primary" else future.role
+                    REGISTRY.increment("chatify_llm_requests_total", result=result)
+                    return future.result()
+                error = future.exception()
+                print(f"LLM {future.role} call failed: {error}")
+
+            if hedge_at is None:
+                if not pending:
+                    REGISTRY.increment("chatify_llm_requests_total", result="error")
+                    raise error
+                continue
+
+            if not pending:
+                # The primary failed: fall back, waiting for a slot like any other call
+                self._acquire(user, deadline)
+                role = "fallback"
+            elif time.monotonic() >= hedge_at and self._try_acquire():
+                role = "hedged"
+            else:
+                if time.monotonic() >= hedge_at:
+                    # No free slot to hedge with, just wait for the primary
+                    hedge_at = None
+                continue
+            pending.add(self._submit(self.fallback, prompt, kwargs, role))
+            hedge_at = None
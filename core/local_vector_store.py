@@ -0,0 +1,339 @@
+import fnmatch
+import threading
+import uuid as uuid_lib
+from types import SimpleNamespace
+
+import numpy as np
+
+from .vector_compression import VECTOR_COMPRESSION, CompressedIndex, FlatIndex, make_codec
+
+
+class LocalVectorStore:
+    """
+    In-process stand-in for the Weaviate v4 client
+    Implements the subset of the API used by MusicKnowledgeBase
+    (collections.exists/create/delete/get, batch inserts, near_vector and filters)
+    so the knowledge base can run without a Weaviate cluster.
+    Args:
+        compression: Vector compression for new collections (defaults to CHATIFY_VECTOR_COMPRESSION)
+    """
+
+    def __init__(self, compression=None):
+        self.collections = _Collections(compression or VECTOR_COMPRESSION)
+
+    def is_ready(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class _Collections:
+    def __init__(self, compression=None):
+        self._compression = compression
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def exists(self, name):
+        return name in self._collections
+
+    def create(self, name, **kwargs):
+        with self._lock:
+            if name in self._collections:
+                raise ValueError(f"Collection {name} already exists")
+            collection = LocalCollection(name, description=kwargs.get("description", ""),
+                                         compression=self._compression)
+            self._collections[name] = collection
+            return collection
+
+    def get(self, name):
+        if name not in self._collections:
+            raise ValueError(f"could not find class {name} in schema")
+        return self._collections[name]
+
+    def delete(self, name):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+        if collection is not None:
+            collection.close()
+
+    def list_all(self):
+        return dict(self._collections)
+
+
+def _operator_name(flt):
+    operator = getattr(flt, "operator", None)
+    return getattr(operator, "value", operator)
+
+
+def matches_filter(flt, properties):
+    """Evaluate a weaviate.classes.query.Filter against a properties dict"""
+    if flt is None:
+        return True
+
+    operator = _operator_name(flt)
+    if operator == "And":
+        return all(matches_filter(f, properties) for f in flt.filters)
+    if operator == "Or":
+        return any(matches_filter(f, properties) for f in flt.filters)
+
+    value = properties.get(flt.target)
+    expected = flt.value
+    if operator == "Equal":
+        return value == expected
+    if operator == "NotEqual":
+        return value != expected
+    if operator == "Like":
+        return value is not None and fnmatch.fnmatchcase(str(value).lower(), str(expected).lower())
+    if operator in ("ContainsAny", "ContainsAll", "ContainsNone"):
+        if isinstance(value, (list, tuple)):
+            present = set(value)
+        else:
+            present = {value} | set(str(value or "").replace(",", " ").split())
+        hits = [v in present for v in expected]
+        if operator == "ContainsAny":
+            return any(hits)
+        if operator == "ContainsAll":
+            return all(hits)
+        return not any(hits)
+    if operator == "IsNull":
+        return (value is None) == bool(expected)
+    raise ValueError(f"Unsupported filter operator for local store: {operator}")
+
+
+class LocalCollection:
+    """
+    A single collection: properties plus a vector index of unit vectors
+    Args:
+        compression: None/"none" (float32 in memory), "float16", "int8" or "pq"
+                     (compressed in memory, rescored from full-precision vectors on disk)
+    """
+
+    def __init__(self, name, description="", compression=None):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._uuids = []
+        self._properties = []
+        # Index row of each object's vector, -1 for objects stored without a vector
+        self._rows = []
+        codec = make_codec(compression)
+        self._index = FlatIndex() if codec is None else CompressedIndex(codec)
+
+        self.batch = _Batch(self)
+        self.data = _Data(self)
+        self.query = _Query(self)
+        self.aggregate = _Aggregate(self)
+
+    def __len__(self):
+        return len(self._uuids)
+
+    @staticmethod
+    def _normalize(vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def insert_many(self, objects):
+        """Insert (properties, vector, uuid) tuples; vector may be None"""
+        object_ids = []
+        with self._lock:
+            # The vectors go to the index as one block (one disk write/encode per call)
+            vectors = []
+            for properties, vector, uuid in objects:
+                object_id = str(uuid or uuid_lib.uuid4())
+                if vector is not None:
+                    self._rows.append(self._index.size + len(vectors))
+                    vectors.append(self._normalize(vector))
+                else:
+                    self._rows.append(-1)
+                self._uuids.append(object_id)
+                self._properties.append(dict(properties))
+                object_ids.append(object_id)
+            if vectors:
+                self._index.add_many(np.stack(vectors))
+        return object_ids
+
+    def insert(self, properties, vector=None, uuid=None):
+        return self.insert_many([(properties, vector, uuid)])[0]
+
+    def delete_where(self, flt):
+        with self._lock:
+            keep = [i for i in range(len(self._uuids)) if not matches_filter(flt, self._properties[i])]
+            removed = len(self._uuids) - len(keep)
+            if removed:
+                self._uuids = [self._uuids[i] for i in keep]
+                self._properties = [self._properties[i] for i in keep]
+                kept_rows = [self._rows[i] for i in keep if self._rows[i] >= 0]
+                if self._index.size:
+                    self._index.keep(kept_rows)
+                old_rows = [self._rows[i] for i in keep]
+                self._rows = []
+                next_row = 0
+                for row in old_rows:
+                    if row >= 0:
+                        self._rows.append(next_row)
+                        next_row += 1
+                    else:
+                        self._rows.append(-1)
+        return removed
+
+    def _object(self, i, distance=None, include_vector=False):
+        vector = {}
+        if include_vector and self._rows[i] >= 0:
+            vector = {"default": self._index.vector(self._rows[i]).tolist()}
+        return SimpleNamespace(
+            uuid=self._uuids[i],
+            properties=dict(self._properties[i]),
+            vector=vector,
+            metadata=SimpleNamespace(distance=distance)
+        )
+
+    def _candidate_indices(self, filters):
+        if filters is None:
+            return None
+        return np.array(
+            [i for i in range(len(self._uuids)) if matches_filter(filters, self._properties[i])],
+            dtype=np.int64
+        )
+
+    def near_vector(self, near_vector, limit=10, filters=None, distance=None, include_vector=False):
+        with self._lock:
+            if self._index.size == 0:
+                return SimpleNamespace(objects=[])
+            query = self._normalize(near_vector)
+
+            rows = np.array(self._rows, dtype=np.int64)
+            candidates = self._candidate_indices(filters)
+            if candidates is None:
+                candidates = np.nonzero(rows >= 0)[0]
+            else:
+                candidates = candidates[rows[candidates] >= 0]
+            if candidates.size == 0:
+                return SimpleNamespace(objects=[])
+
+            distances = self._index.distances(query, rows[candidates])
+            if isinstance(self._index, CompressedIndex) and self._index.codec.trained:
+                # Approximate shortlist, then exact rescoring of the best candidates
+                shortlist = min(max(limit, self._index.rescore_limit), candidates.size)
+                top = np.argpartition(distances, shortlist - 1)[:shortlist]
+                candidates = candidates[top]
+                distances = self._index.rescore(query, rows[candidates])
+
+            k = min(limit, candidates.size)
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+
+            objects = []
+            for j in top:
+                d = float(distances[j])
+                if distance is not None and d > distance:
+                    break
+                objects.append(self._object(int(candidates[j]), distance=d, include_vector=include_vector))
+            return SimpleNamespace(objects=objects)
+
+    def fetch_objects(self, filters=None, limit=None, include_vector=False):
+        with self._lock:
+            objects = []
+            for i in range(len(self._uuids)):
+                if matches_filter(filters, self._properties[i]):
+                    objects.append(self._object(i, include_vector=include_vector))
+                    if limit is not None and len(objects) >= limit:
+                        break
+            return SimpleNamespace(objects=objects)
+
+    def iterator(self, include_vector=False):
+        i = 0
+        while True:
+            # One object at a time under the lock, so a concurrent delete can't break the scan
+            with self._lock:
+                if i >= len(self._uuids):
+                    return
+                obj = self._object(i, include_vector=include_vector)
+            yield obj
+            i += 1
+
+    def memory_bytes(self):
+        """Bytes of vector data held in memory"""
+        return self._index.memory_bytes()
+
+    def train(self):
+        """Fit the compression codec now instead of waiting for the training limit"""
+        with self._lock:
+            if isinstance(self._index, CompressedIndex):
+                self._index.train()
+
+    def close(self):
+        if isinstance(self._index, CompressedIndex):
+            self._index.close()
+
+
+class _Batch:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def dynamic(self):
+        return _BatchContext(self._collection)
+
+    def fixed_size(self, batch_size=100, concurrent_requests=1):
+        return _BatchContext(self._collection)
+
+
+class _BatchContext:
+    """Buffers objects and inserts them when the context exits, like Weaviate batching"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._objects = []
+        self.number_errors = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+    def flush(self):
+        if self._objects:
+            self._collection.insert_many(self._objects)
+            self._objects = []
+
+    def add_object(self, properties, vector=None, uuid=None):
+        object_id = str(uuid or uuid_lib.uuid4())
+        self._objects.append((properties, vector, object_id))
+        return object_id
+
+
+class _Data:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def insert(self, properties, vector=None, uuid=None):
+        return self._collection.insert(properties, vector=vector, uuid=uuid)
+
+    def delete_many(self, where):
+        removed = self._collection.delete_where(where)
+        return SimpleNamespace(matches=removed, successful=removed, failed=0)
+
+
+class _Query:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def near_vector(self, near_vector, limit=10, filters=None, distance=None,
+                    return_metadata=None, include_vector=False, **kwargs):
+        return self._collection.near_vector(
+            near_vector, limit=limit, filters=filters, distance=distance, include_vector=include_vector
+        )
+
+    def fetch_objects(self, filters=None, limit=None, include_vector=False, **kwargs):
+        return self._collection.fetch_objects(filters=filters, limit=limit, include_vector=include_vector)
+
+
+class _Aggregate:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def over_all(self, total_count=True, **kwargs):
+        return SimpleNamespace(total_count=len(self._collection))
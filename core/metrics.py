@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets in seconds (Prometheus convention: cumulative, +Inf implied)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Bound label cardinality: users beyond this share the "other" label
+MAX_USER_LABELS = 1000
+
+RECENT_SPANS = 500
+
+_current_user = contextvars.ContextVar("chatify_metrics_user", default="")
+_current_path = contextvars.ContextVar("chatify_metrics_path", default="")
+
+
+def user_hash(user_id):
+    """Short, non-reversible label for a user ID"""
+    if not user_id:
+        return ""
+    return hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:12]
+
+
+def set_user(user_id):
+    """Tag spans recorded in the current context (thread / Streamlit session) with this user"""
+    _current_user.set(user_hash(user_id))
+
+
+def current_user():
+    """User hash set by set_user() in the current context ("" if none)"""
+    return _current_user.get()
+
+
+class MetricsRegistry:
+    """Thread-safe latency histograms keyed by (stage, user_hash) plus counters and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._users = set()
+        self._recent = deque(maxlen=RECENT_SPANS)
+
+    def _user_label(self, user):
+        if not user or user in self._users:
+            return user
+        if len(self._users) >= MAX_USER_LABELS:
+            return "other"
+        self._users.add(user)
+        return user
+
+    def observe(self, stage, seconds, user="", path=None):
+        with self._lock:
+            user = self._user_label(user)
+            key = (stage, user)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+            self._recent.append((time.time(), path or stage, user, seconds))
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def recent_spans(self, limit=100):
+        """Most recent spans, newest first"""
+        with self._lock:
+            spans = list(self._recent)[-limit:]
+        return [
+            {'timestamp': ts, 'span': path, 'user': user, 'seconds': round(seconds, 6)}
+            for ts, path, user, seconds in reversed(spans)
+        ]
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP chatify_stage_duration_seconds Latency of Chatify pipeline stages",
+            "# TYPE chatify_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        for (stage, user), (buckets, total, count) in sorted(histograms.items()):
+            labels = f'stage="{stage}",user="{user}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f'chatify_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'chatify_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'chatify_stage_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'chatify_stage_duration_seconds_count{{{labels}}} {count}')
+
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            seen = set()
+            for (name, labels), value in sorted(values.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._users.clear()
+            self._recent.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block and record it under `stage`, tagged with the current user
+    Nested spans are also kept in the recent-spans log as "parent/child" paths
+    """
+    parent = _current_path.get()
+    path = f"{parent}/{stage}" if parent else stage
+    token = _current_path.set(path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_path.reset(token)
+        REGISTRY.observe(stage, elapsed, _current_user.get(), path)
+
+
+def timed(stage):
+    """Decorator form of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body = REGISTRY.render().encode('utf-8')
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.startswith("/spans"):
+            body = json.dumps(REGISTRY.recent_spans()).encode('utf-8')
+            content_type = "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    Serve /metrics (Prometheus) and /spans (recent spans as JSON) in a daemon thread
+    Port defaults to CHATIFY_METRICS_PORT; does nothing if unset. Safe to call on every rerun.
+    """
+    global _server
+    port = port or os.getenv("CHATIFY_METRICS_PORT")
+    if not port:
+        return None
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+                _server.daemon_threads = True
+                threading.Thread(target=_server.serve_forever, daemon=True).start()
+                print(f"Metrics available at http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"Could not start metrics server: {e}")
+                return None
+    return _server
@@ -1,41 +1,115 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from .spotify_client import SpotifyClient
 from .music_data_collector import MusicDataCollector
+from .play_history import PlayHistoryStore
+from .metrics import REGISTRY, span, timed, set_user
+from .conversation_memory import ConversationMemory
+from .llm_gateway import get_llm_gateway
+from .profiling import profiled
+from .artifact_cache import ArtifactCache, fingerprint
+from .circuit_breaker import CallTimeout, CircuitOpen
+from .fallback_retriever import FallbackRetriever
+from .music_knowledge_base import KnowledgeBaseMissing
+from .entity_index import ENTITY_ONLY_COVERAGE, ENTITY_SEARCH_K, name_coverage
 from collections import Counter
+from datetime import datetime, timezone
 import os
+import threading
+
+# Phrases (English/Spanish) that map a question to a play-log window
+TIME_WINDOW_PHRASES = [
+    ('today', ['today', 'hoy']),
+    ('last_week', ['last week', 'this week', 'past week', 'semana pasada', 'esta semana', 'ultima semana', 'última semana']),
+    ('this_month', ['this month', 'este mes']),
+    ('last_month', ['last month', 'past month', 'mes pasado', 'ultimo mes', 'último mes']),
+    ('this_year', ['this year', 'este año', 'este ano']),
+    ('last_week', ['recently', 'lately', 'recientemente', 'ultimamente', 'últimamente']),
+]
+
+def create_llm(model="gemini-2.5-flash"):
+    """Gemini chat model (the advisor uses it through core.llm_gateway)"""
+    # Imported here: langchain_google_genai is heavy and only needed once chatting starts
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from .llm_gateway import LLM_TIMEOUT_SECONDS
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.4,
+        timeout=LLM_TIMEOUT_SECONDS,
+        # The gateway handles slow and failed calls with its fallback model
+        max_retries=1
+    )
+
+# Questions about songs drill down from the best artist/album rollups to their tracks
+SONG_QUESTION_WORDS = ('song', 'track', 'album', 'canción', 'cancion', 'tema', 'álbum', 'disco')
+DRILL_DOWN_ROLLUPS = 3
+
+# Name of the cached profile analysis (core.artifact_cache)
+PROFILE_ANALYSIS = "profile_analysis"
+
+# Background rebuilds of missing knowledge bases, one per collection
+_auto_init_jobs = {}
+_auto_init_lock = threading.Lock()
 
 class MusicAdvisor:
-    def __init__(self, knowledge_base, music_data, token_info=None):
+    def __init__(self, knowledge_base, music_data, session=None, llm=None):
         self.knowledge_base = knowledge_base
         self.music_data = music_data
-        self.token_info = token_info
+        # SpotifySession shared with the rest of the app (same cached profile and token)
+        self.session = session
         
-        # Initialize SpotifyClient with token_info
-        if token_info:
-            self.spotify_client = SpotifyClient(token_info)
+        # Initialize SpotifyClient with the user's session
+        if session:
+            self.spotify_client = SpotifyClient(session)
         else:
             self.spotify_client = None  # Or handle this case as needed
         
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            temperature=0.4
-        )
+        # Shared gateway: concurrency limit, deadlines and fallback for every session
+        self.llm = llm or get_llm_gateway()
+        
+        # Built on first use, only when the vector store can't answer
+        self._fallback = None
         
-        self.conversation_history = []
+        # The embedding model is resolved on first use, not when the advisor is built
+        self.memory = ConversationMemory(
+            summarizer=self._summarize_conversation,
+            embedding_model=lambda: getattr(self.knowledge_base, 'embedding_model', None)
+        )
+    
+    @property
+    def conversation_history(self):
+        """All stored messages (role/content), oldest first"""
+        return self.memory.messages()
     
+    @timed("ask")
+    @profiled("ask", user=lambda self, question: getattr(self.knowledge_base, 'user_id', None))
     def ask(self, question):
         # If we need to use Spotify API in responses, check if client is available
         if not self.spotify_client:
             # You can choose to skip Spotify functionality or handle differently
             pass
-            
-        relevant_info = self._get_relevant_info(question)
-        user_profile = self._create_user_profile()
         
-        conversation_context = self._build_conversation_context()
+        set_user(getattr(self.knowledge_base, 'user_id', None))
+        
+        with span("retrieval"):
+            relevant_info = self._get_relevant_info(question)
+            listening_history = self._get_listening_history_info(question)
+        
+        with span("prompt_assembly"):
+            prompt = self._build_prompt(question, relevant_info, listening_history)
+        
+        with span("llm"):
+            response = self.llm.invoke(prompt)
         
-        prompt = f"""You are Chatify, an enthusiastic music advisor with deep knowledge of this user's Spotify habits.
+        self._add_to_conversation(question, response.content)
+        
+        return response.content
+    
+    def _build_prompt(self, question, relevant_info, listening_history):
+        """Assemble the chat prompt from profile, retrieved info and history"""
+        user_profile = self._create_user_profile()
+        conversation_context = self._build_conversation_context(question)
+        
+        return f"""You are Chatify, an enthusiastic music advisor with deep knowledge of this user's Spotify habits.
 
             # USER DATA
             {user_profile}
@@ -43,6 +117,9 @@ class MusicAdvisor:
             # RELEVANT INFORMATION
             {relevant_info}
 
+            # LISTENING HISTORY
+            {listening_history}
+
             # CONVERSATION HISTORY
             {conversation_context}
 
@@ -63,37 +140,31 @@ class MusicAdvisor:
             Question: {question}
 
             Provide a helpful, personalized response in the language the user spoke to you:"""
-        
-        response = self.llm.invoke(prompt)
-        
-        self._add_to_conversation(question, response.content)
-        
-        return response.content
     
-    def _build_conversation_context(self):
-        """Builds previous conversation context"""
-        if not self.conversation_history:
-            return ""
-        
-        context = "PREVIOUS CONVERSATION CONTEXT:\n"
-        # Use only the last 6 messages
-        recent_history = self.conversation_history[-6:]
-        
-        for msg in recent_history:
-            if msg["role"] == "user":
-                context += f"User: {msg['content']}\n"
-            else:
-                context += f"Chatify: {msg['content']}\n"
-        
-        return context + "\n"
+    def _build_conversation_context(self, question=None):
+        """Builds previous conversation context (summary + relevant + recent turns)"""
+        return self.memory.build_context(question)
     
     def _add_to_conversation(self, question, response):
         """Adds messages to conversation history"""
-        self.conversation_history.append({"role": "user", "content": question})
-        self.conversation_history.append({"role": "assistant", "content": response})
-        
-        if len(self.conversation_history) > 10:  # Maximum 5 exchanges
-            self.conversation_history = self.conversation_history[-10:]
+        self.memory.add_turn(question, response)
+    
+    def _summarize_conversation(self, previous_summary, transcript):
+        """Fold older turns into the running summary (runs in the background)"""
+        prompt = f"""Update the summary of a conversation between a user and Chatify, a music advisor.
+Keep names of artists, songs and genres, the user's stated preferences and any open requests.
+Write at most 5 short sentences in the language of the conversation.
+
+Current summary:
+{previous_summary or "(empty)"}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+        with span("llm.summary"):
+            response = self.llm.invoke(prompt)
+        return response.content
     
     def _create_user_profile(self):
         profile = self.music_data
@@ -112,45 +183,165 @@ class MusicAdvisor:
         return f"""Name: {user_name}
             Genres: {genres}"""
     
+    def _entity_lookup(self, question):
+        """
+        Artists/songs/albums named in the question and their documents
+        Returns: (entities, documents), both empty if nothing is named
+        """
+        index = self.knowledge_base.entity_index
+        if index is None and self.music_data:
+            # Knowledge base built before the entity index existed
+            self.knowledge_base.save_entity_index(self.music_data)
+            index = self.knowledge_base.entity_index
+        if index is None:
+            return [], []
+        
+        with span("entity_lookup"):
+            entities = index.find(question)
+        if not entities:
+            return [], []
+        try:
+            return entities, self.knowledge_base.lookup(entities)
+        except (CircuitOpen, CallTimeout):
+            # The vector search would wait for the same slow store: answer from local data
+            raise
+        except Exception as e:
+            # e.g. a collection created before the filtered properties existed
+            print(f"Entity lookup failed, using vector search: {e}")
+            return [], []
+    
+    def _search(self, question):
+        """
+        Exact lookup of the names mentioned in the question, ahead of a vector search that
+        is smaller when something was named and skipped when the names are the whole
+        question. Song questions also get the tracks behind the top rollups.
+        """
+        entities, results = self._entity_lookup(question)
+        if not results or name_coverage(question, entities) < ENTITY_ONLY_COVERAGE:
+            knowledge_base = self.knowledge_base
+            similar = knowledge_base.search(
+                question, k=ENTITY_SEARCH_K if results else knowledge_base.search_limit,
+                max_distance=knowledge_base.search_max_distance, types=knowledge_base.search_types
+            )
+            seen = {doc.page_content for doc in results}
+            results = results + [doc for doc in similar if doc.page_content not in seen]
+        if results and any(word in question.lower() for word in SONG_QUESTION_WORDS):
+            rollups = [doc for doc in results if doc.metadata.get('type', '').endswith('_rollup')]
+            if rollups:
+                results = results + self.knowledge_base.drill_down(rollups[:DRILL_DOWN_ROLLUPS])
+        return results
+    
     def _get_relevant_info(self, question):
-        # RETRIEVAL
+        # RETRIEVAL: the vector store (its calls go through the circuit breaker), local data
+        # when it is slow or down
         try:
-            results = self.knowledge_base.search(question, k=50)
-            
-            if not results:
-                return "No specific information"
-            
-            info_text = ""
-            for doc in results:
-                info_text += f"\n{doc.page_content}\n"
-            
-            return info_text
-        except ValueError as e:
-            if "KNOWLEDGE_BASE_NEEDS_UPDATE" in str(e):
-                # Try to auto-initialize the knowledge base
-                if self._auto_initialize_knowledge_base():
-                    # Retry the search after initialization
-                    try:
-                        results = self.knowledge_base.search(question, k=50)
-                        if not results:
-                            return "No specific information"
-                        info_text = ""
-                        for doc in results:
-                            info_text += f"\n{doc.page_content}\n"
-                        return info_text
-                    except Exception as retry_error:
-                        return f"ERROR: Knowledge base was recreated but search still failed: {str(retry_error)}"
-                else:
-                    return "ERROR: Knowledge base collection not found and could not be auto-initialized. Please try updating your Knowledge Base manually."
+            results = self._search(question)
+        except KnowledgeBaseMissing:
+            # Rebuilding can take minutes: never inside a chat turn
+            self._schedule_auto_initialize()
+            results = self._fallback_search(question, "missing")
+        except CircuitOpen:
+            results = self._fallback_search(question, "circuit_open")
+        except CallTimeout:
+            results = self._fallback_search(question, "timeout")
+        except Exception as e:
+            print(f"Vector search failed, answering from local data: {e}")
+            results = self._fallback_search(question, "error")
+        if not results and self._auto_initializing():
+            # Searches come back empty until the background rebuild finishes
+            results = self._fallback_search(question, "rebuilding")
+        
+        if not results:
+            return "No specific information"
+        
+        info_text = ""
+        for doc in results:
+            info_text += f"\n{doc.page_content}\n"
+        
+        return info_text
+    
+    def _fallback_search(self, question, reason):
+        """In-memory retrieval over music_data (degraded mode, no vector store)"""
+        REGISTRY.increment("chatify_retrieval_fallback_total", reason=reason)
+        if not self.music_data:
+            return []
+        try:
+            if self._fallback is None or self._fallback.music_data is not self.music_data:
+                self._fallback = FallbackRetriever(self.knowledge_base, self.music_data)
+            return self._fallback.search(question)
+        except Exception as e:
+            print(f"Fallback retrieval failed: {e}")
+            return []
+    
+    def _schedule_auto_initialize(self):
+        """
+        Rebuild the missing knowledge base on a background thread
+        Deduplicated per collection: concurrent chat turns of the same user start one job.
+        Returns: True if a job was started
+        """
+        key = self.knowledge_base.collection_names()[0]
+        with _auto_init_lock:
+            job = _auto_init_jobs.get(key)
+            if job is not None and job.is_alive():
+                return False
+            job = threading.Thread(target=self._run_auto_initialize, args=(key,),
+                                   name=f"kb-auto-init-{key}", daemon=True)
+            _auto_init_jobs[key] = job
+        REGISTRY.increment("chatify_kb_auto_initializations_total")
+        job.start()
+        return True
+    
+    def _auto_initializing(self):
+        with _auto_init_lock:
+            job = _auto_init_jobs.get(self.knowledge_base.collection_names()[0])
+        return job is not None and job.is_alive()
+    
+    def _run_auto_initialize(self, key):
+        try:
+            self._auto_initialize_knowledge_base()
+        finally:
+            with _auto_init_lock:
+                if _auto_init_jobs.get(key) is threading.current_thread():
+                    del _auto_init_jobs[key]
+    
+    def _detect_time_window(self, question):
+        """Return the play-log window a question refers to, or None"""
+        text = question.lower()
+        for window, phrases in TIME_WINDOW_PHRASES:
+            if any(phrase in text for phrase in phrases):
+                return window
+        return None
+    
+    def _get_listening_history_info(self, question):
+        """Summarize the play log for temporal questions ("last week", "this year")"""
+        window = self._detect_time_window(question)
+        user_id = self.music_data.get('user_profile', {}).get('id') if self.music_data else None
+        if not window or not user_id:
+            return "Not requested"
+        
+        try:
+            summary = PlayHistoryStore(user_id).summarize_window(window)
         except Exception as e:
-            # For other errors, return a generic message
-            return f"ERROR: Unable to access knowledge base: {str(e)}"
+            print(f"Error reading play history: {e}")
+            return "Not available"
+        
+        if not summary['total_plays']:
+            return f"No plays recorded for {window.replace('_', ' ')}"
+        
+        first = datetime.fromtimestamp(summary['first_played_at'] / 1000, tz=timezone.utc)
+        last = datetime.fromtimestamp(summary['last_played_at'] / 1000, tz=timezone.utc)
+        top_tracks = ', '.join(f"{t} ({c})" for t, c in summary['top_tracks'])
+        top_artists = ', '.join(f"{a} ({c})" for a, c in summary['top_artists'])
+        return f"""Window: {window.replace('_', ' ')} ({first:%Y-%m-%d} to {last:%Y-%m-%d})
+            Total plays: {summary['total_plays']}
+            Most played tracks: {top_tracks}
+            Most played artists: {top_artists}"""
     
     def _auto_initialize_knowledge_base(self):
         """Automatically initialize the knowledge base when it's missing"""
         try:
-            if not self.token_info:
-                print("No token info available for auto-initialization")
+            if not self.session:
+                print("No Spotify session available for auto-initialization")
                 return False
             
             # Get user ID from existing music data or fetch it
@@ -159,7 +350,7 @@ class MusicAdvisor:
             if not user_id:
                 # Need to get user ID first
                 from .music_data_collector import MusicDataCollector
-                collector = MusicDataCollector(self.token_info)
+                collector = MusicDataCollector(self.session)
                 user_id = collector.get_user_id()
                 if user_id == 'unknown_user':
                     print("Could not get user ID for auto-initialization")
@@ -168,7 +359,7 @@ class MusicAdvisor:
             # Check if we have music data, if not, collect it
             if not self.music_data or not self.music_data.get('user_profile'):
                 print("Collecting music data for auto-initialization...")
-                collector = MusicDataCollector(self.token_info)
+                collector = MusicDataCollector(self.session)
                 self.music_data = collector.collect_all_data()
             
             # Initialize the knowledge base
@@ -176,7 +367,7 @@ class MusicAdvisor:
             
             # Update user_id and collection_name BEFORE checking/creating
             self.knowledge_base.user_id = user_id
-            self.knowledge_base.collection_name = f"MusicProfile_{user_id.replace('-', '_')}"
+            self.knowledge_base.collection_name = self.knowledge_base.collection_names()[0]
             
             # Clear any stale cache for this collection
             self.knowledge_base._clear_cache()
@@ -186,9 +377,13 @@ class MusicAdvisor:
             
             # Check without cache first to see if collection really exists
             client = self.knowledge_base._get_weaviate_client()
-            collection_exists = client.collections.exists(self.knowledge_base.collection_name)
+            # Finds the other collection name too, if a rebuild swapped to it
+            collection_exists = self.knowledge_base.collection_exists(use_cache=False)
             
-            if not collection_exists:
+            if not collection_exists and self.knowledge_base.restore_snapshot():
+                # Vectors come from the last snapshot: no re-embedding
+                print("Knowledge base restored from snapshot!")
+            elif not collection_exists:
                 print(f"Collection does not exist, creating it...")
                 # Create the collection directly
                 self.knowledge_base._create_collection(client)
@@ -213,10 +408,10 @@ class MusicAdvisor:
             print(traceback.format_exc())
             return False
     
-    def analyze_profile(self):
+    def _analysis_prompt(self):
         user_profile = self._create_user_profile()
         
-        prompt = f"""Analyze this music profile:
+        return f"""Analyze this music profile:
 
 {user_profile}
 
@@ -226,12 +421,57 @@ Provide an analysis that includes:
 - Suggestions for exploration
 
 Respond in the language the user speaks to you, directly and helpfully, with a cheerful and charismatic touch."""
+    
+    def _artifacts(self):
+        """The user's cache of generated artifacts, or None without a user ID"""
+        user_id = self.music_data.get('user_profile', {}).get('id') if self.music_data else None
+        return ArtifactCache(user_id) if user_id else None
+    
+    def analyze_profile(self, refresh=False):
+        """
+        Analysis of the user's profile, generated once per version of the profile
+        Cached in the user's directory under a fingerprint of the prompt (the profile it
+        describes), so it survives sessions and is regenerated only when the data changes.
+        Args:
+            refresh: Generate a new analysis even if the cached one is current
+        """
+        prompt = self._analysis_prompt()
+        cache = self._artifacts()
+        if cache is None:
+            return self._generate_analysis(prompt)
         
-        print(prompt)
-                
-        response = self.llm.invoke(prompt)
+        key = fingerprint(prompt)
+        if not refresh:
+            cached = cache.get(PROFILE_ANALYSIS, key)
+            if cached is not None:
+                return cached
+        with cache.lock(PROFILE_ANALYSIS):
+            # A background regeneration may have finished while this call waited
+            cached = None if refresh else cache.get(PROFILE_ANALYSIS, key)
+            if cached is None:
+                cached = self._generate_analysis(prompt)
+                cache.put(PROFILE_ANALYSIS, key, cached)
+        return cached
+    
+    def refresh_profile_analysis(self):
+        """
+        Regenerate a cached analysis gone stale after a data refresh, so the next click is instant
+        Users who never asked for an analysis cost no LLM call.
+        Returns: True if a new analysis was generated
+        """
+        cache = self._artifacts()
+        if cache is None or cache.entry(PROFILE_ANALYSIS) is None:
+            return False
+        if cache.get(PROFILE_ANALYSIS, fingerprint(self._analysis_prompt())) is not None:
+            return False
+        self.analyze_profile()
+        return True
+    
+    def _generate_analysis(self, prompt):
+        with span("llm"):
+            response = self.llm.invoke(prompt)
         return response.content
     
     def clear_conversation_history(self):
         """Clears conversation history"""
-        self.conversation_history = []
\ No newline at end of file
+        self.memory.clear()
\ No newline at end of file
@@ -1,21 +1,33 @@
 from .spotify_client import SpotifyClient, extract_artist_info, extract_track_info
+from .play_history import PlayHistoryStore
+from .spotify_session import SpotifySession
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+import threading
 import time
 
+# Bounded concurrency for playlist paging (Spotify rate limits per app/user)
+PLAYLIST_SYNC_WORKERS = 8
+PLAYLIST_PAGE_SIZE = 100
+
 class MusicDataCollector:
-    def __init__(self, token_info=None):
+    def __init__(self, session=None):
         """
         Initializes the collector using user token
         Args:
-            token_info: Dictionary with OAuth token information
+            session: SpotifySession of the user (a token_info dict also works,
+                     but is never refreshed)
         """
-        self.spotify_client = SpotifyClient(token_info)
+        self.session = SpotifySession.ensure(session)
+        self.spotify_client = SpotifyClient(self.session)
+        self._thread_clients = threading.local()
         self.collected_data = {
             'user_profile': {},
             'top_artists': [],
             'top_tracks': [],
             'saved_tracks': [],
             'playlists': [],
+            'playlist_tracks': {},
             'recently_played': [],
             'artists_info': {}
         }
@@ -25,15 +37,16 @@ class MusicDataCollector:
         Get only the user ID quickly without collecting all data
         Returns: user_id string
         """
-        try:
-            profile = self.spotify_client.get_user_profile()
-            return profile.get('id', 'unknown_user')
-        except Exception as e:
-            print(f"Error getting user ID: {e}")
-            return 'unknown_user'
+        return self.session.user_id
     
-    def collect_all_data(self):
-        """Collect all music data from Spotify API"""
+    def collect_all_data(self, include_playlist_tracks=False, previous_data=None):
+        """
+        Collect all music data from Spotify API
+        Args:
+            include_playlist_tracks: Also fetch playlist contents (slow for big libraries,
+                                     see collect_playlist_tracks to run it in the background)
+            previous_data: Previously collected data, used to skip unchanged playlists
+        """
         # Get user profile FIRST (before cleaning)
         self.collected_data['user_profile'] = self.spotify_client.get_user_profile()
         
@@ -49,23 +62,128 @@ class MusicDataCollector:
         saved_tracks = self.spotify_client.get_saved_tracks(limit=50)
         self.collected_data['saved_tracks'] = [extract_track_info(i['track']) for i in saved_tracks['items']]
         
-        playlists = self.spotify_client.get_user_playlists(limit=20)
+        playlists = self.spotify_client.get_all_user_playlists()
         self.collected_data['playlists'] = [
-            {'id': pl['id'], 'name': pl['name'], 'tracks_total': pl['tracks']['total']}
+            {
+                'id': pl['id'],
+                'name': pl['name'],
+                'tracks_total': pl['tracks']['total'],
+                'snapshot_id': pl.get('snapshot_id')
+            }
             for pl in playlists['items']
         ]
         
         recent_tracks = self.spotify_client.get_recently_played(limit=50)
         self.collected_data['recently_played'] = [extract_track_info(i['track']) for i in recent_tracks['items']]
         
+        user_id = self.collected_data['user_profile'].get('id')
+        if user_id:
+            self.collect_play_history(PlayHistoryStore(user_id))
+        
         self._collect_artist_info()
         
+        if include_playlist_tracks:
+            self.collect_playlist_tracks(previous_data)
+        
         # Clean sensitive data AFTER we have everything
         # But keep the user ID for the knowledge base
         self.clean_sensitive_data()
         
         return self.collected_data
     
+    def collect_play_history(self, store):
+        """
+        Append new plays to the user's play log using the `after` cursor
+        Args:
+            store: PlayHistoryStore for the current user
+        Returns: number of new plays stored
+        """
+        try:
+            recent = self.spotify_client.get_recently_played_since(after=store.latest_played_at())
+            added = store.append(recent['items'])
+            print(f"Play history: {added} new plays stored")
+            return added
+        except Exception as e:
+            print(f"Error collecting play history: {e}")
+            return 0
+    
+    def _get_thread_client(self):
+        """One SpotifyClient (and HTTP session) per worker thread"""
+        client = getattr(self._thread_clients, 'client', None)
+        if client is None:
+            client = SpotifyClient(self.session)
+            self._thread_clients.client = client
+        return client
+    
+    def _fetch_playlist_page(self, playlist_id, offset):
+        results = self._get_thread_client().get_playlist_tracks(
+            playlist_id, offset=offset, limit=PLAYLIST_PAGE_SIZE
+        )
+        return [
+            extract_track_info(item['track'])
+            for item in results.get('items', [])
+            if item.get('track') and item['track'].get('id') and item['track'].get('type', 'track') == 'track'
+        ]
+    
+    def collect_playlist_tracks(self, previous_data=None, max_workers=PLAYLIST_SYNC_WORKERS):
+        """
+        Fetch the tracks of every playlist with bounded parallel paging
+        Playlists whose snapshot_id matches previous_data are reused without any request
+        Args:
+            previous_data: Previously collected music data (e.g. the cached JSON file)
+            max_workers: Maximum concurrent Spotify requests
+        Returns: IDs of the playlists that were (re)fetched or removed
+        """
+        previous_data = previous_data or {}
+        previous_snapshots = {pl['id']: pl.get('snapshot_id') for pl in previous_data.get('playlists', [])}
+        previous_tracks = previous_data.get('playlist_tracks', {})
+        
+        playlist_tracks = {}
+        changed = []
+        for playlist in self.collected_data['playlists']:
+            pid = playlist['id']
+            if (playlist.get('snapshot_id')
+                    and previous_snapshots.get(pid) == playlist['snapshot_id']
+                    and pid in previous_tracks):
+                playlist_tracks[pid] = previous_tracks[pid]
+            else:
+                changed.append(playlist)
+        
+        pages = {}
+        failed = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for playlist in changed:
+                for offset in range(0, max(playlist['tracks_total'], 1), PLAYLIST_PAGE_SIZE):
+                    future = executor.submit(self._fetch_playlist_page, playlist['id'], offset)
+                    futures[future] = (playlist['id'], offset)
+            
+            for future in as_completed(futures):
+                pid, offset = futures[future]
+                try:
+                    pages.setdefault(pid, {})[offset] = future.result()
+                except Exception as e:
+                    failed.add(pid)
+                    print(f"Error fetching playlist {pid} at offset {offset}: {e}")
+        
+        for playlist in changed:
+            pid = playlist['id']
+            if pid in failed:
+                # Incomplete contents: forget the snapshot so the next sync retries it
+                playlist['snapshot_id'] = None
+            playlist_pages = pages.get(pid, {})
+            playlist_tracks[pid] = [
+                track for offset in sorted(playlist_pages) for track in playlist_pages[offset]
+            ]
+        
+        self.collected_data['playlist_tracks'] = playlist_tracks
+        print(f"Playlist sync: {len(changed)} fetched, "
+              f"{len(self.collected_data['playlists']) - len(changed)} unchanged")
+        
+        # Playlists removed since the last sync also need their documents dropped
+        removed = [pid for pid in previous_snapshots if pid not in playlist_tracks]
+        return [playlist['id'] for playlist in changed] + removed
+    
     def clean_sensitive_data(self):
         """
         Clean sensitive data but KEEP the user ID
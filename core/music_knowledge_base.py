@@ -1,61 +1,167 @@
-import weaviate
-from weaviate.classes.config import Configure, Property, DataType
-from weaviate.classes.query import MetadataQuery
-from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from collections import Counter
+from collections import Counter, defaultdict
+from .circuit_breaker import get_vector_search_breaker
+from .metrics import span, timed
+from .user_store import UserStore
 import os
+import threading
+import time
+
+# weaviate, langchain_core and the embedding model are imported on first use
+# so that importing this module (e.g. for the login page) stays cheap
+
+# Name of the cached collection, kept in the user's data directory
+COLLECTION_CACHE_FILE = "weaviate_collection.txt"
+
+# Artist/track/album names of the user, built at ingestion (core.entity_index)
+ENTITY_INDEX_FILE = "entity_index.json"
+
+# Properties and vectors of the collection (core.kb_snapshot), restored instead of re-embedding
+# when the collection is lost; refreshed after every ingestion unless CHATIFY_KB_SNAPSHOTS=0
+KB_SNAPSHOT_FILE = "kb_snapshot.bin.gz"
+KB_SNAPSHOTS = os.getenv("CHATIFY_KB_SNAPSHOTS", "1") != "0"
+# float16 halves the file; float32 keeps vectors exact
+KB_SNAPSHOT_DTYPE = os.getenv("CHATIFY_KB_SNAPSHOT_DTYPE", "float16")
+
+# Exports run in the background; one at a time so the last one wins
+_snapshot_lock = threading.Lock()
+
+# Documents fetched for the names mentioned in a question
+ENTITY_LOOKUP_LIMIT = 30
+
+# Playlist contents are chunked so each document stays within the embedding model's window
+PLAYLIST_TRACKS_PER_DOCUMENT = 20
+
+# "tracks": one vector per saved/top track. "rollup": one vector per artist and per album,
+# tracks are stored without vectors and fetched on drill-down (several times fewer vectors)
+INGESTION_MODE = os.getenv("CHATIFY_INGESTION_MODE", "tracks").lower()
+INGESTION_MODES = ("tracks", "rollup")
+
+# Songs listed in a rollup document (the rest are only reachable through drill-down)
+ROLLUP_TRACKS_LISTED = 15
+
+# Albums with fewer songs in the library are covered by their artist's rollup alone
+ALBUM_ROLLUP_MIN_TRACKS = 2
+
+# Documents retrieved per question: rollups are denser, so fewer are needed
+# (CHATIFY_SEARCH_LIMIT overrides both; tune with benchmarks.bench_retrieval)
+SEARCH_LIMITS = {"tracks": 50, "rollup": 15}
+SEARCH_LIMIT = int(os.getenv("CHATIFY_SEARCH_LIMIT") or 0)
+
+# Results farther than this cosine distance are dropped (unset keeps all of them)
+SEARCH_MAX_DISTANCE = float(os.getenv("CHATIFY_SEARCH_MAX_DISTANCE") or 0) or None
+
+# Track documents returned per drill-down
+DRILL_DOWN_LIMIT = 50
+
+class KnowledgeBaseMissing(ValueError):
+    """The user's collection is gone from the vector store (message: KNOWLEDGE_BASE_NEEDS_UPDATE)"""
+
+def connect_weaviate():
+    """Weaviate Cloud client from WEAVIATE_URL / WEAVIATE_API_KEY"""
+    import weaviate
+    return weaviate.connect_to_weaviate_cloud(
+        cluster_url=os.getenv("WEAVIATE_URL"),
+        auth_credentials=weaviate.auth.AuthApiKey(os.getenv("WEAVIATE_API_KEY")),
+    )
 
 class MusicKnowledgeBase:
-    def __init__(self, user_id=None):
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        self.client = None
+    def __init__(self, user_id=None, embedding_model=None, client=None, ingestion_mode=None,
+                 embedding_pipeline=None):
+        """
+        Args:
+            user_id: Spotify user ID (one collection per user)
+            embedding_model: Object with embed_query/embed_documents
+                             (defaults to the shared model selected by CHATIFY_EMBEDDING_BACKEND)
+            client: Weaviate client or a compatible stand-in such as LocalVectorStore
+            ingestion_mode: "tracks" or "rollup" (defaults to CHATIFY_INGESTION_MODE),
+                            applied when the collection is (re)built
+            embedding_pipeline: EmbeddingPipeline for large ingestions (defaults to the
+                                process pool of the shared model, CHATIFY_EMBEDDING_WORKERS)
+        """
+        self._embedding_model = embedding_model
+        self._embedding_pipeline = embedding_pipeline
+        self._shared_model = embedding_model is None
+        self._entity_index = None
+        self.client = client
+        self.ingestion_mode = (ingestion_mode or INGESTION_MODE).lower()
+        if self.ingestion_mode not in INGESTION_MODES:
+            raise ValueError(f"Unknown ingestion mode: {self.ingestion_mode}")
+        # Vector search settings used by MusicAdvisor
+        self.search_limit = SEARCH_LIMIT or SEARCH_LIMITS[self.ingestion_mode]
+        self.search_max_distance = SEARCH_MAX_DISTANCE
+        self.search_types = None
         self.user_id = user_id or "default_user"
-        self.collection_name = f"MusicProfile_{self.user_id.replace('-', '_')}"
+        self.collection_name = self._served_collection_name()
         
+    @property
+    def embedding_model(self):
+        """Embedding model, loaded on first use (shared across sessions)"""
+        if self._embedding_model is None:
+            from .embeddings import get_embedding_model
+            self._embedding_model = get_embedding_model()
+        return self._embedding_model
+    
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self._embedding_model = model
+    
     def _get_weaviate_client(self):
         """Get Weaviate v4 client"""
         if self.client is None:
-            self.client = weaviate.connect_to_weaviate_cloud(
-                cluster_url=os.getenv("WEAVIATE_URL"),
-                auth_credentials=weaviate.auth.AuthApiKey(os.getenv("WEAVIATE_API_KEY")),
-            )
+            self.client = connect_weaviate()
         return self.client
     
+    def collection_names(self):
+        """
+        The user's two collection names: rebuilds go to the one not being served and
+        then swap (see rebuild_knowledge_base)
+        """
+        base = f"MusicProfile_{self.user_id.replace('-', '_')}"
+        return base, f"{base}_b"
+    
+    def _served_collection_name(self):
+        """The collection recorded in the cache file, or the base name"""
+        try:
+            cached_name = (self._user_store().read_text(COLLECTION_CACHE_FILE) or "").strip()
+        except Exception:
+            cached_name = ""
+        names = self.collection_names()
+        return cached_name if cached_name in names else names[0]
+    
     def collection_exists(self, use_cache=True):
-        """Check if user's collection already exists (with caching)"""
-        cache_file = f".weaviate_cache_{self.user_id.replace('-', '_')}.txt"
-        
+        """
+        Check if user's collection already exists (with caching)
+        Raises: CircuitOpen, CallTimeout or the client's error when the vector store can't
+                tell (on a cache miss): an outage must not look like a missing collection
+        """
         # Check local cache first (fastest)
-        if use_cache and os.path.exists(cache_file):
+        if use_cache:
             try:
-                with open(cache_file, 'r') as f:
-                    cached_name = f.read().strip()
-                    if cached_name == self.collection_name:
-                        print(f"[CACHE HIT] Collection {self.collection_name} found in cache")
-                        return True
+                cached_name = (self._user_store().read_text(COLLECTION_CACHE_FILE) or "").strip()
+                if cached_name == self.collection_name:
+                    print(f"[CACHE HIT] Collection {self.collection_name} found in cache")
+                    return True
             except Exception as e:
                 print(f"Error reading cache: {e}")
         
         # If not in cache, check Weaviate
         print(f"[CACHE MISS] Querying Weaviate for collection {self.collection_name}")
-        try:
-            client = self._get_weaviate_client()
-            exists = client.collections.exists(self.collection_name)
-            
-            # Cache the result if collection exists
-            if exists:
-                self._update_cache()
-            else:
-                # Clear cache if collection doesn't exist
-                self._clear_cache()
-            
-            return exists
-        except Exception as e:
-            print(f"Error checking collection existence: {e}")
-            return False
+        client = self._get_weaviate_client()
+        exists = self._query(lambda: client.collections.exists(self.collection_name))
+        if not exists:
+            # Swapped by a rebuild whose cache file is gone (e.g. evicted from disk)
+            other = next(name for name in self.collection_names() if name != self.collection_name)
+            if self._query(lambda: client.collections.exists(other)):
+                self.collection_name, exists = other, True
+        
+        # Cache the result if collection exists
+        if exists:
+            self._update_cache()
+        else:
+            # Clear cache if collection doesn't exist
+            self._clear_cache()
+        
+        return exists
     
     def initialize_knowledge_base(self, music_data, force_recreate=False):
         """
@@ -82,9 +188,11 @@ class MusicKnowledgeBase:
             # Add documents only if collection is new
             documents = self._create_documents(music_data)
             self._add_documents_to_collection(client, documents)
+            self.save_entity_index(music_data)
             
             # Update cache after successful creation
             self._update_cache()
+            self._snapshot_in_background()
         else:
             print(f"Collection {self.collection_name} already exists. Skipping initialization.")
         
@@ -94,14 +202,67 @@ class MusicKnowledgeBase:
         """
         Update knowledge base by recreating it with fresh data
         """
-        return self.initialize_knowledge_base(music_data, force_recreate=True)
+        return self.rebuild_knowledge_base(music_data)
     
-    def _create_collection(self, client):
-        """Create Weaviate collection with proper schema for music data"""
+    def rebuild_knowledge_base(self, music_data):
+        """
+        Re-ingest the user's data into the collection not being served, then switch
+        searches to it and drop the old one. The knowledge base stays searchable during
+        the rebuild (force_recreate would leave it missing until the ingestion finishes).
+        """
+        client = self._get_weaviate_client()
+        if not self.collection_exists(use_cache=False):
+            return self.initialize_knowledge_base(music_data)
+        
+        served = self.collection_name
+        target = next(name for name in self.collection_names() if name != served)
+        if client.collections.exists(target):
+            # Left over by an interrupted rebuild
+            client.collections.delete(target)
+        
+        documents = self._create_documents(music_data)
+        if not any(doc.metadata.get("type") == "playlist_tracks" for doc in documents):
+            # Rollup mode: the served collection has the playlist documents, keep them
+            documents += self._create_playlist_documents(music_data)
+        print(f"Rebuilding {served} into {target}")
+        try:
+            self._create_collection(client, name=target)
+            self._add_documents_to_collection(client, documents, name=target)
+        except Exception:
+            if client.collections.exists(target):
+                client.collections.delete(target)
+            raise
+        self.collection_name = target
+        self.save_entity_index(music_data)
+        self._update_cache()
+        client.collections.delete(served)
+        self._snapshot_in_background()
+        return client
+    
+    def library_changed(self, previous_data, music_data):
+        """
+        Whether music_data gives other documents than previous_data, playlist contents
+        aside (add_playlist_documents replaces those per playlist)
+        """
+        if not previous_data:
+            return True
+        
+        def contents(data):
+            return [(doc.page_content, doc.metadata) for doc in self._create_documents(data)
+                    if doc.metadata.get("type") != "playlist_tracks"]
+        
+        return contents(previous_data) != contents(music_data)
+    
+    def _create_collection(self, client, name=None):
+        """Create Weaviate collection with proper schema for music data (name defaults to collection_name)"""
+        from weaviate.classes.config import Configure, Property, DataType, Tokenization
+        from .vector_compression import weaviate_vector_index_config
+        
         client.collections.create(
-            name=self.collection_name,
+            name=name or self.collection_name,
             description=f"Music profile for user {self.user_id}",
             vectorizer_config=Configure.Vectorizer.none(),
+            vector_index_config=weaviate_vector_index_config(),
             properties=[
                 Property(
                     name="content",
@@ -111,7 +272,8 @@ class MusicKnowledgeBase:
                 Property(
                     name="type",
                     data_type=DataType.TEXT,
-                    description="Type of document (user_profile, artist, saved_track, top_track)"
+                    description="Type of document (user_profile, artist, saved_track, top_track, playlist_tracks, "
+                                "artist_rollup, album_rollup, track)"
                 ),
                 Property(
                     name="artist_name",
@@ -132,62 +294,91 @@ class MusicKnowledgeBase:
                     name="user_id",
                     data_type=DataType.TEXT,
                     description="ID of the user"
+                ),
+                Property(
+                    name="playlist_id",
+                    data_type=DataType.TEXT,
+                    description="ID of the playlist (playlist_tracks documents only)"
+                ),
+                Property(
+                    name="album_name",
+                    data_type=DataType.TEXT,
+                    tokenization=Tokenization.FIELD,
+                    description="Album of the track or album rollup (rollup mode)"
+                ),
+                Property(
+                    name="artist_list",
+                    data_type=DataType.TEXT_ARRAY,
+                    tokenization=Tokenization.FIELD,
+                    description="Every artist of the track (rollup mode drill-down)"
                 )
             ]
         )
     
-    def _add_documents_to_collection(self, client, documents):
+    def _add_documents_to_collection(self, client, documents, name=None):
         """Add documents to Weaviate collection"""
-        collection = client.collections.get(self.collection_name)
+        pipeline = self._get_embedding_pipeline(documents)
+        if pipeline is not None:
+            # Large library: embed on the process pool, uploading shards as they finish
+            pipeline.embed_and_upload(documents, lambda docs, vectors: self._upload_documents(client, docs, vectors, name))
+            return
+        vectors = self._embed_documents(documents)
+        self._upload_documents(client, documents, vectors, name)
+    
+    def _get_embedding_pipeline(self, documents):
+        """Process pool to embed `documents` with, or None to embed them in this thread"""
+        from .embedding_pipeline import PARALLEL_MIN_DOCUMENTS, get_embedding_pipeline
         
-        # Prepare data objects for batch insert
-        data_objects = []
-        for doc in documents:
-            # Generate embedding
-            embedding = self.embedding_model.embed_query(doc.page_content)
-            
-            # Prepare properties
-            properties = {
-                "content": doc.page_content,
-                "type": doc.metadata.get("type", ""),
-                "artist_name": doc.metadata.get("artist_name", ""),
-                "track_name": doc.metadata.get("track_name", ""),
-                "artists": doc.metadata.get("artists", ""),
-                "user_id": doc.metadata.get("user_id", self.user_id)
-            }
-            
-            data_objects.append({
-                "properties": properties,
-                "vector": embedding
-            })
-        
-        # Batch insert
-        with collection.batch.dynamic() as batch:
-            for obj in data_objects:
+        indexed = sum(1 for doc in documents if doc.metadata.get("indexed", True))
+        if indexed < PARALLEL_MIN_DOCUMENTS:
+            return None
+        if self._embedding_pipeline is not None:
+            return self._embedding_pipeline
+        # Custom models (tests, benchmarks) stay in-process unless given a pipeline
+        return get_embedding_pipeline() if self._shared_model else None
+    
+    def _embed_documents(self, documents):
+        """
+        Generate one embedding per document
+        Returns: Vectors aligned with `documents`, None for documents stored without a vector
+        """
+        indexed = [doc for doc in documents if doc.metadata.get("indexed", True)]
+        with span("embedding.documents"):
+            vectors = iter(self.embedding_model.embed_documents([doc.page_content for doc in indexed]))
+        return [next(vectors) if doc.metadata.get("indexed", True) else None for doc in documents]
+    
+    def _document_properties(self, doc):
+        """Weaviate properties for a Document"""
+        return {
+            "content": doc.page_content,
+            "type": doc.metadata.get("type", ""),
+            "artist_name": doc.metadata.get("artist_name", ""),
+            "track_name": doc.metadata.get("track_name", ""),
+            "artists": doc.metadata.get("artists", ""),
+            "user_id": doc.metadata.get("user_id", self.user_id),
+            "playlist_id": doc.metadata.get("playlist_id", ""),
+            "album_name": doc.metadata.get("album_name", ""),
+            "artist_list": doc.metadata.get("artist_list", [])
+        }
+    
+    def _upload_documents(self, client, documents, vectors, name=None):
+        """Batch insert documents with precomputed vectors"""
+        collection = client.collections.get(name or self.collection_name)
+        
+        with span("vector_upload"), collection.batch.dynamic() as batch:
+            for doc, vector in zip(documents, vectors):
                 batch.add_object(
-                    properties=obj["properties"],
-                    vector=obj["vector"]
+                    properties=self._document_properties(doc),
+                    vector=vector
                 )
     
     def _create_documents(self, music_data):
         """Create Document objects from music data"""
-        documents = []
-        
-        # User profile document
-        profile_summary = self._create_profile_summary(music_data)
-        user_name = music_data.get('user_profile', {}).get('display_name', 'User')
-        profile_content = f"Username: {user_name}\n{profile_summary}"
+        if self.ingestion_mode == "rollup":
+            return self._create_rollup_documents(music_data)
         
-        documents.append(Document(
-            page_content=profile_content,
-            metadata={
-                "type": "user_profile",
-                "user_id": self.user_id,
-                "artist_name": "",
-                "track_name": "",
-                "artists": ""
-            }
-        ))
+        from langchain_core.documents import Document
+        documents = [self._create_profile_document(music_data)]
         
         # Artists documents
         for artist_id, artist_info in music_data.get('artists_info', {}).items():
@@ -213,6 +404,7 @@ class MusicKnowledgeBase:
                     "type": "saved_track",
                     "track_name": track['name'],
                     "artists": artists_str,
+                    "album_name": track.get('album', ''),
                     "user_id": self.user_id,
                     "artist_name": ""
                 }
@@ -228,13 +420,222 @@ class MusicKnowledgeBase:
                     "type": "top_track",
                     "track_name": track['name'],
                     "artists": artists_str,
+                    "album_name": track.get('album', ''),
                     "user_id": self.user_id,
                     "artist_name": ""
                 }
             ))
 
+        documents.extend(self._create_playlist_documents(music_data))
+
         return documents
     
+    def _create_profile_document(self, music_data):
+        """User profile document"""
+        from langchain_core.documents import Document
+        profile_summary = self._create_profile_summary(music_data)
+        user_name = music_data.get('user_profile', {}).get('display_name', 'User')
+        profile_content = f"Username: {user_name}\n{profile_summary}"
+        
+        return Document(
+            page_content=profile_content,
+            metadata={
+                "type": "user_profile",
+                "user_id": self.user_id,
+                "artist_name": "",
+                "track_name": "",
+                "artists": ""
+            }
+        )
+    
+    def _create_rollup_documents(self, music_data):
+        """
+        Rollup mode: artist and album documents are the indexed retrieval units.
+        Every saved/top track becomes one (deduplicated) track document stored
+        without a vector, fetched through drill_down().
+        """
+        from langchain_core.documents import Document
+        
+        # Deduplicate tracks that are both saved and top, remembering every list they are in
+        tracks = {}
+        for list_name, key in (("top", 'top_tracks'), ("saved", 'saved_tracks')):
+            for rank, track in enumerate(music_data.get(key, []), 1):
+                track_key = track.get('id') or (track['name'], tuple(track.get('artists', [])))
+                entry = tracks.setdefault(track_key, {'track': track, 'lists': [], 'top_rank': None})
+                entry['lists'].append(list_name)
+                if list_name == "top":
+                    entry['top_rank'] = rank
+        
+        playlist_names = {pl['id']: pl['name'] for pl in music_data.get('playlists', [])}
+        playlists_by_artist = defaultdict(Counter)
+        for pid, playlist_tracks in music_data.get('playlist_tracks', {}).items():
+            for track in playlist_tracks:
+                for artist in track.get('artists', []):
+                    playlists_by_artist[artist][playlist_names.get(pid, pid)] += 1
+        
+        by_artist = defaultdict(list)
+        by_album = defaultdict(list)
+        for entry in tracks.values():
+            track = entry['track']
+            for artist in track.get('artists', []):
+                by_artist[artist].append(entry)
+            if track.get('album'):
+                by_album[(track['album'], ', '.join(track.get('artists', [])[:1]))].append(entry)
+        
+        artists_info = {info['name']: info for info in music_data.get('artists_info', {}).values()}
+        top_artist_rank = {a['name']: i for i, a in enumerate(music_data.get('top_artists', []), 1)}
+        
+        documents = [self._create_profile_document(music_data)]
+        
+        # Artist rollups: every artist with info or songs in the library
+        for artist in sorted(set(artists_info) | set(by_artist) | set(top_artist_rank)):
+            info = artists_info.get(artist, {})
+            entries = by_artist.get(artist, [])
+            lines = [f"ARTIST: {artist}"]
+            if info.get('genres'):
+                lines.append(f"Genres: {', '.join(info['genres'])}")
+            if info:
+                lines.append(f"Popularity: {info.get('popularity', 0)}")
+            if artist in top_artist_rank:
+                lines.append(f"Top artist: #{top_artist_rank[artist]}")
+            if entries:
+                lines.append(f"Songs in your library ({len(entries)}): {self._rollup_track_list(entries)}")
+                albums = Counter(e['track']['album'] for e in entries if e['track'].get('album'))
+                lines.append("Albums: " + ', '.join(f"{a} ({n})" for a, n in albums.most_common(ROLLUP_TRACKS_LISTED)))
+            if playlists_by_artist.get(artist):
+                lines.append("In playlists: " + ', '.join(
+                    f"{p} ({n} songs)" for p, n in playlists_by_artist[artist].most_common(10)
+                ))
+            documents.append(Document(
+                page_content='\n'.join(lines),
+                metadata={
+                    "type": "artist_rollup",
+                    "artist_name": artist,
+                    "user_id": self.user_id,
+                    "track_name": "",
+                    "artists": artist
+                }
+            ))
+        
+        # Album rollups
+        for (album, artist), entries in sorted(by_album.items()):
+            if len(entries) < ALBUM_ROLLUP_MIN_TRACKS:
+                continue
+            documents.append(Document(
+                page_content=f"ALBUM: {album} by {artist}\nSongs in your library ({len(entries)}): "
+                             f"{self._rollup_track_list(entries)}",
+                metadata={
+                    "type": "album_rollup",
+                    "artist_name": artist,
+                    "album_name": album,
+                    "user_id": self.user_id,
+                    "track_name": "",
+                    "artists": artist
+                }
+            ))
+        
+        # Track documents, stored without vectors
+        for entry in tracks.values():
+            track = entry['track']
+            artists_str = ', '.join(track.get('artists', []))
+            lists = ', '.join(
+                f"top songs #{entry['top_rank']}" if name == "top" else "saved songs" for name in entry['lists']
+            )
+            documents.append(Document(
+                page_content=f"SONG: {track['name']}\nArtists: {artists_str}\nAlbum: {track.get('album', '')}\n"
+                             f"In: {lists}\nPopularity: {track.get('popularity', 0)}",
+                metadata={
+                    "type": "track",
+                    "track_name": track['name'],
+                    "artists": artists_str,
+                    "artist_list": list(track.get('artists', [])),
+                    "album_name": track.get('album', ''),
+                    "user_id": self.user_id,
+                    "artist_name": "",
+                    "indexed": False
+                }
+            ))
+        
+        return documents
+    
+    @staticmethod
+    def _rollup_track_list(entries):
+        """'Song A (top #3, saved), Song B (saved), ... and N more', top songs first"""
+        entries = sorted(entries, key=lambda e: (e['top_rank'] is None, e['top_rank'] or 0))
+        listed = []
+        for entry in entries[:ROLLUP_TRACKS_LISTED]:
+            tags = [f"top #{entry['top_rank']}" if name == "top" else name for name in entry['lists']]
+            listed.append(f"{entry['track']['name']} ({', '.join(tags)})")
+        text = ', '.join(listed)
+        if len(entries) > ROLLUP_TRACKS_LISTED:
+            text += f" and {len(entries) - ROLLUP_TRACKS_LISTED} more"
+        return text
+    
+    def _create_playlist_documents(self, music_data, playlist_ids=None):
+        """
+        Create playlist_tracks documents (one per chunk of playlist tracks)
+        Args:
+            music_data: User's music data with 'playlist_tracks'
+            playlist_ids: Only build documents for these playlists (None for all)
+        """
+        from langchain_core.documents import Document
+        documents = []
+        playlist_tracks = music_data.get('playlist_tracks', {})
+        
+        for playlist in music_data.get('playlists', []):
+            pid = playlist['id']
+            if playlist_ids is not None and pid not in playlist_ids:
+                continue
+            tracks = playlist_tracks.get(pid, [])
+            
+            for start in range(0, len(tracks), PLAYLIST_TRACKS_PER_DOCUMENT):
+                chunk = tracks[start:start + PLAYLIST_TRACKS_PER_DOCUMENT]
+                lines = '\n'.join(f"- {t['name']} by {', '.join(t.get('artists', []))}" for t in chunk)
+                content = f"PLAYLIST: {playlist['name']} ({len(tracks)} songs)\nSongs:\n{lines}"
+                artists = sorted({a for t in chunk for a in t.get('artists', [])})
+                documents.append(Document(
+                    page_content=content,
+                    metadata={
+                        "type": "playlist_tracks",
+                        "track_name": "",
+                        "artists": ', '.join(artists),
+                        "user_id": self.user_id,
+                        "artist_name": "",
+                        "playlist_id": pid
+                    }
+                ))
+        
+        return documents
+    
+    def add_playlist_documents(self, music_data, playlist_ids=None):
+        """
+        Replace the playlist_tracks documents of the given playlists
+        Used after a background playlist sync so login never waits for it
+        Args:
+            music_data: User's music data with 'playlist_tracks'
+            playlist_ids: Playlists that changed (None for all)
+        """
+        if not self.collection_exists():
+            return
+        
+        from weaviate.classes.query import Filter
+        client = self._get_weaviate_client()
+        collection = client.collections.get(self.collection_name)
+        
+        stale_filter = Filter.by_property("type").equal("playlist_tracks")
+        if playlist_ids is not None:
+            if not playlist_ids:
+                return
+            stale_filter = stale_filter & Filter.by_property("playlist_id").contains_any(list(playlist_ids))
+        collection.data.delete_many(where=stale_filter)
+        
+        documents = self._create_playlist_documents(music_data, playlist_ids)
+        self._add_documents_to_collection(client, documents)
+        # Playlist songs become searchable by name too
+        self.save_entity_index(music_data)
+        self._snapshot_in_background()
+        print(f"Added {len(documents)} playlist documents")
+    
     def _create_profile_summary(self, music_data):
         """Create a summary of user's music profile"""
         all_genres = []
@@ -252,80 +653,327 @@ Main genres: {genres}
 Total saved songs: {len(music_data.get('saved_tracks', []))}
 Total playlists: {len(music_data.get('playlists', []))}"""
     
-    def search(self, query, k=5):
+    @timed("knowledge_base.search")
+    def search(self, query, k=5, max_distance=None, types=None):
         """
         Search for similar documents in the collection
         Args:
             query: Search query string
             k: Number of results to return
+            max_distance: Drop results farther than this cosine distance
+            types: Only search documents of these types (e.g. ["artist_rollup", "album_rollup"])
         Returns:
-            List of Document objects, or None if there's an error that requires user action
+            List of Document objects
+        Raises:
+            KnowledgeBaseMissing if Weaviate reports the collection as not found; any other
+            error (timeouts, gRPC errors, an open breaker) propagates as is
         """
-        try:
-            client = self._get_weaviate_client()
-            
-            if not self.collection_exists():
-                return []
-            
-            collection = client.collections.get(self.collection_name)
-            
-            # Generate query embedding
+        from weaviate.classes.query import Filter, MetadataQuery
+        
+        client = self._get_weaviate_client()
+        
+        if not self.collection_exists():
+            return []
+        
+        collection = client.collections.get(self.collection_name)
+        
+        # Generate query embedding
+        with span("embedding.query"):
             query_vector = self.embedding_model.embed_query(query)
-            
-            # Perform vector search
-            response = collection.query.near_vector(
+        
+        # Perform vector search
+        with span("vector_search"):
+            response = self._query(lambda: collection.query.near_vector(
                 near_vector=query_vector,
                 limit=k,
+                distance=max_distance,
+                filters=Filter.any_of([Filter.by_property("type").equal(t) for t in types]) if types else None,
                 return_metadata=MetadataQuery(distance=True)
-            )
-            
-            # Convert results to Document objects
-            documents = []
-            for obj in response.objects:
-                documents.append(Document(
-                    page_content=obj.properties.get("content", ""),
-                    metadata={
-                        "type": obj.properties.get("type", ""),
-                        "artist_name": obj.properties.get("artist_name", ""),
-                        "track_name": obj.properties.get("track_name", ""),
-                        "artists": obj.properties.get("artists", ""),
-                        "user_id": obj.properties.get("user_id", "")
-                    }
-                ))
-            
-            return documents
+            ))
+        
+        # Convert results to Document objects
+        return [self._to_document(obj) for obj in response.objects]
+    
+    @staticmethod
+    def _query(request):
+        """
+        Run one vector store read through the process-wide circuit breaker (deadline and
+        latency SLO). Only the network call: query embedding and everything else stay
+        outside, so CPU contention in this process never counts against the vector store.
+        """
+        def run():
+            try:
+                return request()
+            except Exception as e:
+                if "could not find class" in str(e).lower():
+                    # A missing collection is not a vector store failure
+                    raise KnowledgeBaseMissing("KNOWLEDGE_BASE_NEEDS_UPDATE") from e
+                raise
+        
+        return get_vector_search_breaker().call(run)
+    
+    @staticmethod
+    def _to_document(obj):
+        """Document from a Weaviate object"""
+        from langchain_core.documents import Document
+        return Document(
+            page_content=obj.properties.get("content", ""),
+            metadata={
+                "type": obj.properties.get("type", ""),
+                "artist_name": obj.properties.get("artist_name", ""),
+                "track_name": obj.properties.get("track_name", ""),
+                "artists": obj.properties.get("artists", ""),
+                "user_id": obj.properties.get("user_id", ""),
+                "playlist_id": obj.properties.get("playlist_id", ""),
+                "album_name": obj.properties.get("album_name", "")
+            }
+        )
+    
+    @timed("knowledge_base.drill_down")
+    def drill_down(self, documents, limit=DRILL_DOWN_LIMIT):
+        """
+        Track documents behind the artist/album rollups among `documents`
+        (rollup mode; tracks have no vectors, so they are fetched by filter)
+        Args:
+            documents: Search results
+            limit: Maximum number of track documents
+        Returns:
+            List of Document objects
+        """
+        from weaviate.classes.query import Filter
+        
+        rollup_filters = []
+        for doc in documents:
+            if doc.metadata.get("type") == "artist_rollup":
+                rollup_filters.append(Filter.by_property("artist_list").contains_any([doc.metadata["artist_name"]]))
+            elif doc.metadata.get("type") == "album_rollup":
+                rollup_filters.append(Filter.by_property("album_name").equal(doc.metadata["album_name"]))
+        if not rollup_filters or not self.collection_exists():
+            return []
+        
+        collection = self._get_weaviate_client().collections.get(self.collection_name)
+        track_filter = Filter.by_property("type").equal("track") & Filter.any_of(rollup_filters)
+        response = self._query(lambda: collection.query.fetch_objects(filters=track_filter, limit=limit))
+        return [self._to_document(obj) for obj in response.objects]
+    
+    @property
+    def entity_index(self):
+        """The user's EntityIndex, or None if it was never built"""
+        if self._entity_index is None:
+            from .entity_index import EntityIndex
+            data = self._user_store().read_json(ENTITY_INDEX_FILE)
+            if data is not None:
+                self._entity_index = EntityIndex.from_dict(data)
+        return self._entity_index
+    
+    def save_entity_index(self, music_data):
+        """Build the entity index from music_data and keep it in the user's directory"""
+        from .entity_index import EntityIndex
+        try:
+            index = EntityIndex.from_music_data(music_data)
+            self._user_store().write_json(ENTITY_INDEX_FILE, index.to_dict())
+            self._entity_index = index
         except Exception as e:
-            error_message = str(e)
-            # Check if it's the specific Weaviate error about missing class
-            if "could not find class" in error_message.lower() or "MusicProfile" in error_message:
-                # Return a special marker to indicate the knowledge base needs to be updated
-                raise ValueError("KNOWLEDGE_BASE_NEEDS_UPDATE")
-            # For other errors, re-raise them
+            print(f"Error saving entity index: {e}")
+    
+    @timed("knowledge_base.lookup")
+    def lookup(self, entities, limit=ENTITY_LOOKUP_LIMIT):
+        """
+        Fetch the documents about the given names by exact filters, no embedding
+        Args:
+            entities: (kind, name) pairs from EntityIndex.find
+            limit: Maximum number of documents
+        Returns:
+            List of Document objects
+        """
+        from weaviate.classes.query import Filter
+        
+        # The named documents first (artist, song, album), then the songs of named artists
+        named, artist_tracks = [], []
+        for kind, name in entities:
+            if kind == "artist":
+                named.append(Filter.by_property("artist_name").equal(name))
+                artist_tracks.append(Filter.by_property("artists").equal(name))
+                artist_tracks.append(Filter.by_property("artist_list").contains_any([name]))
+            elif kind == "track":
+                named.append(Filter.by_property("track_name").equal(name))
+            elif kind == "album":
+                named.append(Filter.by_property("album_name").equal(name))
+        if not named or not self.collection_exists():
+            return []
+        
+        collection = self._get_weaviate_client().collections.get(self.collection_name)
+        documents, seen = [], set()
+        for filters in (named, artist_tracks):
+            if not filters or len(documents) >= limit:
+                continue
+            response = self._query(lambda: collection.query.fetch_objects(filters=Filter.any_of(filters), limit=limit))
+            for obj in response.objects:
+                if obj.uuid not in seen and len(documents) < limit:
+                    seen.add(obj.uuid)
+                    documents.append(self._to_document(obj))
+        return documents
+    
+    def _embedding_model_name(self):
+        """Identifies the vector space of a snapshot (without loading the shared model)"""
+        if self._shared_model:
+            from .embeddings import MODEL_NAME
+            return MODEL_NAME
+        model = self._embedding_model
+        return getattr(model, "model_name", None) or type(model).__name__
+    
+    def snapshot_path(self):
+        return self._user_store().path(KB_SNAPSHOT_FILE)
+    
+    @timed("kb_snapshot.export")
+    def export_snapshot(self, path=None, dtype=KB_SNAPSHOT_DTYPE, objects=None):
+        """
+        Write the collection's properties and vectors to a snapshot file (core.kb_snapshot)
+        Args:
+            path: Destination (defaults to the user's data directory)
+            dtype: Vector precision, "float16" or "float32"
+            objects: (uuid or None, properties, vector) already in memory, e.g. the batches just
+                     uploaded; by default the collection is read back from the vector store
+        Returns: Number of objects exported
+        """
+        from .kb_snapshot import write_snapshot
+        
+        path = path or self.snapshot_path()
+        header = {
+            "collection": self.collection_name,
+            "user_id": self.user_id,
+            "ingestion_mode": self.ingestion_mode,
+            "embedding_model": self._embedding_model_name(),
+            "created_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if objects is None:
+            collection = self._get_weaviate_client().collections.get(self.collection_name)
+            objects = ((obj.uuid, obj.properties, obj.vector) for obj in collection.iterator(include_vector=True))
+        with _snapshot_lock:
+            count = write_snapshot(path, header, objects, dtype=dtype)
+        print(f"Exported {count} objects of {self.collection_name} to {path}")
+        return count
+    
+    @timed("kb_snapshot.import")
+    def import_snapshot(self, path=None, client=None, replace=False):
+        """
+        Bulk-load a snapshot into a fresh collection, without embedding anything
+        Args:
+            path: Snapshot file (defaults to the user's data directory)
+            client: Target Weaviate client or LocalVectorStore (defaults to this knowledge base's)
+            replace: Delete an existing collection first (otherwise it must not exist)
+        Returns: Number of objects imported
+        Raises: SnapshotError if the file is unreadable or its vectors come from another model
+        """
+        from .kb_snapshot import SnapshotError, read_snapshot, read_snapshot_header
+        
+        path = path or self.snapshot_path()
+        header = read_snapshot_header(path)
+        model_name = self._embedding_model_name()
+        if header.get("embedding_model") != model_name:
+            raise SnapshotError(f"Snapshot vectors come from {header.get('embedding_model')}, not {model_name}")
+        
+        own_client = client is None or client is self.client
+        # Not `client or ...`: truth-testing a client proxy (e.g. a wrapper defining __len__) may raise
+        client = self._get_weaviate_client() if client is None else client
+        if client.collections.exists(self.collection_name):
+            if not replace:
+                raise ValueError(f"Collection {self.collection_name} already exists")
+            client.collections.delete(self.collection_name)
+            if own_client:
+                self._clear_cache()
+        
+        self._create_collection(client)
+        collection = client.collections.get(self.collection_name)
+        count = 0
+        try:
+            with span("vector_upload"), collection.batch.dynamic() as batch:
+                for object_id, properties, vector in read_snapshot(path):
+                    batch.add_object(
+                        properties=properties,
+                        vector=None if vector is None else vector.tolist(),
+                        uuid=object_id
+                    )
+                    count += 1
+        except Exception:
+            # A partial collection would pass for a complete one
+            client.collections.delete(self.collection_name)
             raise
+        
+        if own_client:
+            # Drill-down and search limits follow the shape of the imported collection
+            self.ingestion_mode = header.get("ingestion_mode", self.ingestion_mode)
+            self.search_limit = SEARCH_LIMIT or SEARCH_LIMITS[self.ingestion_mode]
+            self._update_cache()
+        print(f"Imported {count} objects into {self.collection_name} from {path}")
+        return count
+    
+    def restore_snapshot(self):
+        """
+        Rebuild a missing collection from the user's last snapshot
+        Skipped when the snapshot was built in another ingestion mode, so changing
+        CHATIFY_INGESTION_MODE still re-embeds.
+        Returns: True if the collection was restored
+        """
+        from .kb_snapshot import read_snapshot_header
+        
+        path = self.snapshot_path()
+        if not os.path.exists(path):
+            return False
+        try:
+            header = read_snapshot_header(path)
+            if header.get("ingestion_mode") != self.ingestion_mode:
+                print(f"Snapshot of {self.collection_name} is in {header.get('ingestion_mode')} mode, not restoring it")
+                return False
+            self.import_snapshot(path)
+            return True
+        except Exception as e:
+            print(f"Error restoring snapshot of {self.collection_name}: {e}")
+            return False
+    
+    def _snapshot_in_background(self):
+        """Refresh the user's snapshot after an ingestion"""
+        if not KB_SNAPSHOTS:
+            return
+        
+        def export():
+            try:
+                self.export_snapshot()
+            except Exception as e:
+                print(f"Error exporting snapshot of {self.collection_name}: {e}")
+        
+        threading.Thread(target=export, name=f"kb-snapshot-{self.user_id}", daemon=True).start()
     
     def delete_user_data(self):
         """Delete all data for this user"""
         client = self._get_weaviate_client()
         if self.collection_exists(use_cache=False):
-            client.collections.delete(self.collection_name)
+            for name in self.collection_names():
+                if client.collections.exists(name):
+                    client.collections.delete(name)
             self._clear_cache()
+            self._user_store().delete(ENTITY_INDEX_FILE)
+            with _snapshot_lock:
+                self._user_store().delete(KB_SNAPSHOT_FILE)
+            self._entity_index = None
             print(f"Deleted collection: {self.collection_name}")
     
+    def _user_store(self):
+        # user_id can change during auto-initialization, so resolve it on every call
+        return UserStore(self.user_id)
+    
     def _update_cache(self):
         """Update local cache file"""
-        cache_file = f".weaviate_cache_{self.user_id.replace('-', '_')}.txt"
         try:
-            with open(cache_file, 'w') as f:
-                f.write(self.collection_name)
+            self._user_store().write_text(COLLECTION_CACHE_FILE, self.collection_name)
         except Exception as e:
             print(f"Error updating cache: {e}")
     
     def _clear_cache(self):
         """Clear local cache file"""
-        cache_file = f".weaviate_cache_{self.user_id.replace('-', '_')}.txt"
         try:
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
+            self._user_store().delete(COLLECTION_CACHE_FILE)
         except Exception as e:
             print(f"Error clearing cache: {e}")
     
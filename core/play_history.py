@@ -0,0 +1,204 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from .user_store import DATA_DIR, PLAY_HISTORY_DIR, UserStore
+
+# Named windows understood by read_window()
+WINDOWS = ('today', 'last_week', 'last_month', 'this_month', 'this_year', 'all')
+
+
+def parse_played_at(played_at):
+    """Convert Spotify's ISO 8601 played_at string to epoch milliseconds"""
+    if played_at.endswith('Z'):
+        played_at = played_at[:-1] + '+00:00'
+    return int(datetime.fromisoformat(played_at).timestamp() * 1000)
+
+
+def _to_ms(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+class PlayHistoryStore:
+    """
+    Append-only play log for a single user.
+    Plays are partitioned by month (one JSON-lines file per YYYY-MM) so range
+    queries only open the partitions that overlap the requested window.
+    """
+
+    def __init__(self, user_id, base_dir=None):
+        self.user_id = user_id
+        # Lives in the user's directory, but LRU eviction keeps it (it can't be collected again)
+        self.store = UserStore(user_id, base_dir)
+        self.directory = self.store.path(PLAY_HISTORY_DIR)
+        self._migrate_legacy_directory(base_dir)
+        # Created by the first append(): queries for unknown users touch nothing on disk
+        self.state_file = os.path.join(self.directory, "state.json")
+
+    def _migrate_legacy_directory(self, base_dir):
+        """Move a log written before per-user directories existed (data/play_history/<user>)"""
+        legacy = os.path.join(base_dir or DATA_DIR, "play_history", self.user_id.replace('-', '_'))
+        if os.path.isdir(legacy) and not os.path.exists(self.directory):
+            os.makedirs(os.path.dirname(self.directory), exist_ok=True)
+            os.replace(legacy, self.directory)
+
+    def _partition_path(self, key):
+        return os.path.join(self.directory, f"{key}.jsonl")
+
+    @staticmethod
+    def _partition_key(played_at_ms):
+        dt = datetime.fromtimestamp(played_at_ms / 1000, tz=timezone.utc)
+        return f"{dt.year:04d}-{dt.month:02d}"
+
+    def _partitions(self):
+        """Sorted list of existing partition keys"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-len(".jsonl")] for name in os.listdir(self.directory)
+            if name.endswith(".jsonl")
+        )
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state):
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def latest_played_at(self):
+        """Epoch ms of the newest stored play, used as the `after` cursor"""
+        return self._load_state().get('latest_played_at')
+
+    def _existing_timestamps(self, key):
+        timestamps = set()
+        path = self._partition_path(key)
+        if not os.path.exists(path):
+            return timestamps
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    timestamps.add(json.loads(line)['t'])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        return timestamps
+
+    def append(self, items):
+        """
+        Append recently-played items (raw Spotify API objects)
+        Plays are deduplicated on played_at
+        Returns: number of new plays stored
+        """
+        by_partition = {}
+        for item in items:
+            track = item.get('track')
+            if not track or not item.get('played_at'):
+                continue
+            played_at = parse_played_at(item['played_at'])
+            by_partition.setdefault(self._partition_key(played_at), []).append({
+                't': played_at,
+                'id': track.get('id'),
+                'n': track.get('name'),
+                'a': [artist['name'] for artist in track.get('artists', [])],
+                'al': track.get('album', {}).get('name', '')
+            })
+
+        added = 0
+        latest = self.latest_played_at() or 0
+        if by_partition:
+            os.makedirs(self.directory, exist_ok=True)
+        for key, records in by_partition.items():
+            seen = self._existing_timestamps(key)
+            with open(self._partition_path(key), 'a', encoding='utf-8') as f:
+                for record in sorted(records, key=lambda r: r['t']):
+                    if record['t'] in seen:
+                        continue
+                    seen.add(record['t'])
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+                    latest = max(latest, record['t'])
+                    added += 1
+
+        if added:
+            self._save_state({'latest_played_at': latest})
+        if by_partition:
+            self.store.touch()
+        return added
+
+    def read_range(self, start=None, end=None):
+        """
+        Yield plays with start <= played_at < end (datetimes or epoch ms)
+        Only partitions overlapping the range are read
+        """
+        start_ms = _to_ms(start) if start is not None else None
+        end_ms = _to_ms(end) if end is not None else None
+        first_key = self._partition_key(start_ms) if start_ms is not None else None
+        last_key = self._partition_key(end_ms) if end_ms is not None else None
+
+        for key in self._partitions():
+            if first_key and key < first_key:
+                continue
+            if last_key and key > last_key:
+                break
+            with open(self._partition_path(key), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if start_ms is not None and record['t'] < start_ms:
+                        continue
+                    if end_ms is not None and record['t'] >= end_ms:
+                        continue
+                    yield record
+
+    def read_window(self, window, now=None):
+        """Yield plays for a named window (see WINDOWS)"""
+        now = now or datetime.now(timezone.utc)
+        if window == 'today':
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        elif window == 'last_week':
+            start = now - timedelta(days=7)
+        elif window == 'last_month':
+            start = now - timedelta(days=30)
+        elif window == 'this_month':
+            start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        elif window == 'this_year':
+            start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        elif window == 'all':
+            start = None
+        else:
+            raise ValueError(f"Unknown window: {window}")
+        return self.read_range(start, now)
+
+    def summarize_window(self, window, top_n=10, now=None):
+        """Aggregate play counts for a named window"""
+        track_counter = Counter()
+        artist_counter = Counter()
+        total = 0
+        first = last = None
+        for record in self.read_window(window, now=now):
+            total += 1
+            track_counter[f"{record['n']} - {', '.join(record['a'])}"] += 1
+            artist_counter.update(record['a'])
+            first = record['t'] if first is None else min(first, record['t'])
+            last = record['t'] if last is None else max(last, record['t'])
+
+        return {
+            'window': window,
+            'total_plays': total,
+            'first_played_at': first,
+            'last_played_at': last,
+            'top_tracks': track_counter.most_common(top_n),
+            'top_artists': artist_counter.most_common(top_n)
+        }
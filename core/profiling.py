@@ -0,0 +1,193 @@
+import cProfile
+import functools
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+from .metrics import REGISTRY, user_hash
+from .user_store import DATA_DIR
+
+# Users whose initialize/update/ask are always profiled (comma-separated IDs or /metrics user hashes)
+PROFILE_USERS = {u.strip() for u in os.getenv("CHATIFY_PROFILE_USERS", "").split(",") if u.strip()}
+
+# Fraction of all other calls profiled (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("CHATIFY_PROFILE_SAMPLE_RATE", "0"))
+
+# Captures are written here; only the newest CHATIFY_PROFILE_KEEP are kept
+PROFILE_DIR = os.getenv("CHATIFY_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = int(os.getenv("CHATIFY_PROFILE_KEEP", "50"))
+
+# Allocation sites listed in the memory report
+TOP_ALLOCATIONS = 25
+
+# Stack paths below this share of the capture are left out of the collapsed stacks
+MIN_STACK_FRACTION = 0.001
+MAX_STACK_DEPTH = 64
+
+CAPTURE_SUFFIXES = (".pstats", ".collapsed", ".memory.txt")
+
+# One capture at a time: profilers and tracemalloc are process-wide
+_capture_lock = threading.Lock()
+
+
+def should_profile(user_id):
+    if not PROFILE_USERS and not PROFILE_SAMPLE_RATE:
+        return False
+    if user_id and (user_id in PROFILE_USERS or user_hash(user_id) in PROFILE_USERS):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def profiled(stage, user=None):
+    """
+    Decorator: capture cProfile and tracemalloc data for calls of opted-in users
+    With CHATIFY_PROFILE_USERS and CHATIFY_PROFILE_SAMPLE_RATE unset the function is
+    returned unwrapped, so disabled profiling costs nothing.
+    Args:
+        stage: Name used in the capture files ("ask", "initialize_system", ...)
+        user: Callable(*args, **kwargs) returning the user ID of a call
+    """
+    def decorator(func):
+        if not PROFILE_USERS and not PROFILE_SAMPLE_RATE:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            user_id = user(*args, **kwargs) if user else None
+            if not should_profile(user_id) or not _capture_lock.acquire(blocking=False):
+                return func(*args, **kwargs)
+            try:
+                return _capture(stage, user_id, func, args, kwargs)
+            finally:
+                _capture_lock.release()
+        return wrapper
+    return decorator
+
+
+def _capture(stage, user_id, func, args, kwargs):
+    """Run func under cProfile and tracemalloc, then write the capture files (caller holds _capture_lock)"""
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        elapsed = time.perf_counter() - start
+        try:
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            prefix = os.path.join(
+                PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_"
+                             f"{stage}_{user_hash(user_id) or 'anonymous'}"
+            )
+            write_capture(prefix, profiler, after.compare_to(before, "lineno"), peak, elapsed)
+            prune_captures()
+            REGISTRY.increment("chatify_profile_captures_total", stage=stage)
+            print(f"Profile of {stage} ({elapsed:.2f}s) written to {prefix}.*")
+        except Exception as e:
+            print(f"Error writing profile of {stage}: {e}")
+
+
+def write_capture(prefix, profiler, allocations, peak, elapsed):
+    """<prefix>.pstats (snakeviz, pstats), .collapsed (flamegraph.pl, speedscope) and .memory.txt"""
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(f"{prefix}.pstats")
+    with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+        for stack, microseconds in collapsed_stacks(stats):
+            f.write(f"{stack} {microseconds}\n")
+
+    lines = [
+        f"wall time: {elapsed:.3f} s",
+        f"peak traced memory: {peak / (1024 * 1024):.2f} MB",
+        f"net allocated: {sum(s.size_diff for s in allocations) / (1024 * 1024):+.2f} MB",
+        "",
+        f"top {TOP_ALLOCATIONS} allocation sites (net size, count):",
+    ]
+    for stat in allocations[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+10.1f} KB {stat.count_diff:+8d}  {frame.filename}:{frame.lineno}")
+    with open(f"{prefix}.memory.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        # Built-ins: name is already "<built-in method ...>"
+        return name.replace(";", ":")
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ":")
+
+
+def collapsed_stacks(stats):
+    """
+    Collapsed stacks ("root;caller;callee microseconds") rebuilt from cProfile's call graph
+    cProfile only keeps caller/callee pairs, so the time of a function called from several
+    places is split across its stacks in proportion to each caller's share.
+    Returns: List of (stack, microseconds) with self time per stack
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+    total = sum(stats.stats[func][3] for func in roots) or 1.0
+
+    stacks = {}
+
+    def walk(func, path, seconds, depth):
+        _, _, own, cumulative, _ = stats.stats[func]
+        if seconds < total * MIN_STACK_FRACTION or depth > MAX_STACK_DEPTH:
+            return
+        path = path + [_frame_name(func)]
+        share = seconds / cumulative if cumulative else 0.0
+        self_seconds = own * share
+        for callee, edge_cumulative in callees.get(func, ()):
+            if _frame_name(callee) in path:
+                # Recursion: keep its time on the current frame
+                self_seconds += edge_cumulative * share
+                continue
+            walk(callee, path, edge_cumulative * share, depth + 1)
+        if self_seconds > 0:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0.0) + self_seconds
+
+    for root in roots:
+        walk(root, [], stats.stats[root][3], 0)
+    return [(stack, max(1, int(seconds * 1_000_000))) for stack, seconds in sorted(stacks.items())]
+
+
+def prune_captures(directory=None, keep=None):
+    """Delete all but the newest `keep` captures (CHATIFY_PROFILE_KEEP)"""
+    directory = directory or PROFILE_DIR
+    keep = PROFILE_KEEP if keep is None else keep
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    prefixes = sorted({
+        name[:-len(suffix)] for name in names for suffix in CAPTURE_SUFFIXES if name.endswith(suffix)
+    })
+    removed = 0
+    # Prefixes start with the capture time, so sorting them sorts captures oldest first
+    for prefix in prefixes[:max(len(prefixes) - keep, 0)]:
+        for suffix in CAPTURE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, prefix + suffix))
+            except FileNotFoundError:
+                pass
+        removed += 1
+    return removed
@@ -0,0 +1,192 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import REGISTRY
+
+# Refresh a user's data once it is this old (0 disables the scheduler)
+REFRESH_INTERVAL_HOURS = float(os.getenv("CHATIFY_REFRESH_INTERVAL_HOURS", "6"))
+
+# Only users seen within this window are refreshed...
+REFRESH_ACTIVE_HOURS = float(os.getenv("CHATIFY_REFRESH_ACTIVE_HOURS", "24"))
+
+# ...and only once they have been idle this long, so the rebuild never hits an open chat
+REFRESH_IDLE_MINUTES = float(os.getenv("CHATIFY_REFRESH_IDLE_MINUTES", "15"))
+
+# Refreshes running at once (Spotify rate limits are per app)
+REFRESH_CONCURRENCY = int(os.getenv("CHATIFY_REFRESH_CONCURRENCY", "2"))
+
+# Local hours during which refreshes may start, e.g. "1-6" (empty: any time)
+REFRESH_WINDOW = os.getenv("CHATIFY_REFRESH_WINDOW", "")
+
+# Each user's interval is stretched or shrunk by up to this fraction, so users who
+# logged in together are not all refreshed in the same tick
+REFRESH_JITTER = 0.2
+
+# Backoff after Spotify answers 429 (doubles on every consecutive one)
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 60 * 60
+
+# How often the scheduler looks for due users
+TICK_SECONDS = 60
+
+
+def parse_window(window):
+    """'1-6' -> (1, 6); empty -> None. The window may wrap midnight ('22-4')."""
+    if not window:
+        return None
+    start, end = (int(part) for part in window.split('-', 1))
+    return start % 24, end % 24
+
+
+def in_window(window, hour):
+    if window is None:
+        return True
+    start, end = window
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def _rate_limit_delay(error):
+    """Retry-After of a Spotify 429 error, or None if it isn't one"""
+    if getattr(error, 'http_status', None) != 429:
+        return None
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RefreshScheduler:
+    """
+    Refreshes recently active users' profiles and vectors in the background, so their
+    next session finds fresh data instead of waiting on "Update Knowledge Base"
+    - Due users: initialized, active within `active_hours`, idle for `idle_minutes`,
+      data older than their jittered interval
+    - At most `concurrency` refreshes run at once; the most stale users go first
+    - A 429 from Spotify pauses all refreshes with exponential backoff
+    Args:
+        service: ChatifyService whose users are refreshed
+        interval_hours: Target age of each user's data
+        window: Allowed local hours ("1-6"), empty for any time
+    """
+
+    def __init__(self, service, interval_hours=REFRESH_INTERVAL_HOURS, active_hours=REFRESH_ACTIVE_HOURS,
+                 idle_minutes=REFRESH_IDLE_MINUTES, concurrency=REFRESH_CONCURRENCY, window=REFRESH_WINDOW,
+                 jitter=REFRESH_JITTER, tick=TICK_SECONDS, clock=time.time):
+        self.service = service
+        self.interval = interval_hours * 3600
+        self.active_within = active_hours * 3600
+        self.idle_for = idle_minutes * 60
+        self.concurrency = max(1, concurrency)
+        self.window = parse_window(window)
+        self.jitter = jitter
+        self.tick = tick
+        self.clock = clock
+
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="chatify-refresh")
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._intervals = {}
+        self._retry_at = {}
+        self._paused_until = 0.0
+        self._backoff = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            print("Background refresh disabled")
+            return self
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="chatify-refresh-scheduler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _loop(self):
+        # First pass after one (jittered) tick, not while the service is still starting
+        while not self._stop.wait(self.tick * random.uniform(1 - self.jitter, 1 + self.jitter)):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error scheduling refreshes: {e}")
+
+    def _user_interval(self, user_id):
+        """Interval of the user, jittered once and then kept stable"""
+        interval = self._intervals.get(user_id)
+        if interval is None:
+            interval = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self._intervals[user_id] = interval
+        return interval
+
+    def due_users(self, now=None):
+        """Users that need a refresh, most stale first"""
+        now = self.clock() if now is None else now
+        due = []
+        with self._lock:
+            for user_id, last_active, collected_at in self.service.refresh_candidates():
+                if user_id in self._in_flight or now < self._retry_at.get(user_id, 0):
+                    continue
+                if now - last_active > self.active_within or now - last_active < self.idle_for:
+                    continue
+                age = now - (collected_at or 0)
+                if age >= self._user_interval(user_id):
+                    due.append((age, user_id))
+        return [user_id for _, user_id in sorted(due, reverse=True)]
+
+    def run_once(self, now=None):
+        """
+        Submit due users up to the concurrency cap
+        Returns: The user ids submitted
+        """
+        now = self.clock() if now is None else now
+        if now < self._paused_until:
+            return []
+        if not in_window(self.window, time.localtime(now).tm_hour):
+            return []
+
+        with self._lock:
+            free = self.concurrency - len(self._in_flight)
+        submitted = self.due_users(now)[:max(free, 0)]
+        with self._lock:
+            self._in_flight.update(submitted)
+        for user_id in submitted:
+            self.pool.submit(self._refresh, user_id)
+        return submitted
+
+    def _refresh(self, user_id):
+        try:
+            if self.clock() < self._paused_until:
+                return
+            if self.service.refresh(user_id):
+                print(f"Background refresh done for {user_id}")
+                REGISTRY.increment("chatify_background_refresh_total", result="ok")
+                with self._lock:
+                    self._backoff = 0
+            else:
+                REGISTRY.increment("chatify_background_refresh_total", result="skipped")
+        except Exception as e:
+            retry_after = _rate_limit_delay(e)
+            if retry_after is None:
+                print(f"Background refresh failed for {user_id}: {e}")
+                REGISTRY.increment("chatify_background_refresh_total", result="error")
+                # Don't retry a broken user every tick, wait for their next interval
+                with self._lock:
+                    self._retry_at[user_id] = self.clock() + self._user_interval(user_id)
+            else:
+                with self._lock:
+                    delay = min(BACKOFF_BASE_SECONDS * 2 ** self._backoff, BACKOFF_MAX_SECONDS)
+                    self._backoff += 1
+                    self._paused_until = self.clock() + max(delay, retry_after)
+                print(f"Spotify rate limit hit, pausing background refresh for {max(delay, retry_after):.0f}s")
+                REGISTRY.increment("chatify_background_refresh_total", result="rate_limited")
+        finally:
+            with self._lock:
+                self._in_flight.discard(user_id)
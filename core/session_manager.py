@@ -0,0 +1,94 @@
+import os
+import resource
+import threading
+
+from .metrics import REGISTRY
+
+# Sessions idle this long give back their data, knowledge base and advisor
+SESSION_IDLE_MINUTES = float(os.getenv("CHATIFY_SESSION_IDLE_MINUTES", "10"))
+
+# Sessions idle this long are logged out (their Spotify token refresh stops)
+SESSION_EXPIRE_HOURS = float(os.getenv("CHATIFY_SESSION_EXPIRE_HOURS", "24"))
+
+# How often idle sessions are looked for
+SWEEP_SECONDS = 60
+
+
+def resident_memory_mb():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if rss > 1 << 30 else rss / 1024
+
+
+class SessionManager:
+    """
+    Frees the heavy objects of idle sessions in a ChatifyService
+    Every sweep snapshots and evicts sessions idle for `idle_minutes` (the service
+    rebuilds them from the user's directory on their next request) and logs out
+    sessions idle for `expire_hours`. Also reports resident memory per active session.
+    Args:
+        service: ChatifyService whose sessions are managed
+        idle_minutes: Idle time before eviction
+        expire_hours: Idle time before logout (0 never logs out)
+    """
+
+    def __init__(self, service, idle_minutes=SESSION_IDLE_MINUTES, expire_hours=SESSION_EXPIRE_HOURS,
+                 interval=SWEEP_SECONDS):
+        self.service = service
+        self.idle_seconds = idle_minutes * 60
+        self.expire_seconds = expire_hours * 3600 or None
+        self.interval = interval
+        # Memory of the process before any session, to estimate what each one adds
+        self.baseline_rss_mb = resident_memory_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="chatify-session-manager")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error evicting idle sessions: {e}")
+
+    def sweep(self):
+        """Evict and expire idle sessions now; returns the memory report"""
+        evicted, expired = self.service.evict_idle(self.idle_seconds, self.expire_seconds)
+        if evicted or expired:
+            print(f"Idle sessions: {evicted} evicted, {expired} logged out")
+            REGISTRY.increment("chatify_sessions_evicted_total", evicted, reason="idle")
+            REGISTRY.increment("chatify_sessions_evicted_total", expired, reason="expired")
+        return self.report()
+
+    def report(self):
+        """
+        Resident memory per active session
+        Returns: dict with sessions, active_sessions (in memory), rss_mb, baseline_rss_mb and
+                 rss_per_active_session_mb (memory above the baseline / active sessions)
+        """
+        rss = resident_memory_mb()
+        active = self.service.hydrated_users()
+        report = {
+            'sessions': self.service.active_users(),
+            'active_sessions': active,
+            'rss_mb': round(rss, 1),
+            'baseline_rss_mb': round(self.baseline_rss_mb, 1),
+            'rss_per_active_session_mb': round(max(rss - self.baseline_rss_mb, 0) / active, 2) if active else 0.0,
+        }
+        REGISTRY.set_gauge("chatify_sessions", report['sessions'], state="logged_in")
+        REGISTRY.set_gauge("chatify_sessions", active, state="in_memory")
+        REGISTRY.set_gauge("chatify_resident_memory_mb", report['rss_mb'])
+        REGISTRY.set_gauge("chatify_resident_memory_per_session_mb", report['rss_per_active_session_mb'])
+        return report
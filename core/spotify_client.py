@@ -1,32 +1,38 @@
-import spotipy
-from dotenv import load_dotenv
-
-load_dotenv()
+from .metrics import timed
+from .spotify_session import SpotifySession, create_spotify_api
 
 class SpotifyClient:
-    def __init__(self, token_info):
+    def __init__(self, session):
         """
         Initialize Spotify client with USER token only
         No fallback to developer credentials needed
+        Args:
+            session: SpotifySession (or a token_info dict) of the logged-in user
         """
-        if not token_info:
+        if not session:
             raise ValueError("User token is required")
         
         # 👇 Solo usa el token del usuario, NO tus credenciales
-        self.sp = spotipy.Spotify(auth=token_info['access_token'])
+        # The session hands out the current (auto-refreshed) token on every request
+        self.session = SpotifySession.ensure(session)
+        self.sp = create_spotify_api(self.session)
     
+    @timed('spotify.get_user_profile')
     def get_user_profile(self):
-        """Get current user's profile information"""
-        return self.sp.current_user()
+        """Get current user's profile information (cached for the session)"""
+        return self.session.get_profile()
     
+    @timed('spotify.get_top_artists')
     def get_top_artists(self, limit=20, time_range='medium_term'):
         """Get user's top artists"""
         return self.sp.current_user_top_artists(limit=min(limit, 50), time_range=time_range)
     
+    @timed('spotify.get_top_tracks')
     def get_top_tracks(self, limit=20, time_range='medium_term'):
         """Get user's top tracks"""
         return self.sp.current_user_top_tracks(limit=min(limit, 50), time_range=time_range)
     
+    @timed('spotify.get_saved_tracks')
     def get_saved_tracks(self, limit=50):
         """
         Get all saved tracks without duplicates
@@ -55,14 +61,74 @@ class SpotifyClient:
         
         return {'items': all_tracks}
     
-    def get_user_playlists(self, limit=50):
+    @timed('spotify.get_user_playlists')
+    def get_user_playlists(self, limit=50, offset=0):
         """Get user's playlists"""
-        return self.sp.current_user_playlists(limit=limit)
+        return self.sp.current_user_playlists(limit=limit, offset=offset)
+
+    def get_all_user_playlists(self, max_playlists=1000):
+        """Get all of the user's playlists, paging 50 at a time"""
+        all_playlists = []
+        offset = 0
+
+        while len(all_playlists) < max_playlists:
+            results = self.get_user_playlists(limit=50, offset=offset)
+            items = [pl for pl in results['items'] if pl]
+            all_playlists.extend(items)
+
+            if not results.get('next') or not results['items']:
+                break
+            offset += 50
+
+        return {'items': all_playlists[:max_playlists]}
+
+    @timed('spotify.get_playlist_tracks')
+    def get_playlist_tracks(self, playlist_id, offset=0, limit=100):
+        """Get one page of a playlist's tracks (max 100 per request)"""
+        return self.sp.playlist_items(
+            playlist_id,
+            fields="items(track(id,name,popularity,type,artists(id,name),album(name))),total,next",
+            limit=min(limit, 100),
+            offset=offset,
+            additional_types=('track',)
+        )
     
-    def get_recently_played(self, limit=50):
-        """Get user's recently played tracks"""
-        return self.sp.current_user_recently_played(limit=limit)
+    @timed('spotify.get_recently_played')
+    def get_recently_played(self, limit=50, after=None):
+        """
+        Get user's recently played tracks
+        Args:
+            limit: Maximum plays per request (max 50)
+            after: Epoch ms cursor, only plays after this instant are returned
+        """
+        return self.sp.current_user_recently_played(limit=min(limit, 50), after=after)
+
+    def get_recently_played_since(self, after=None, max_pages=20):
+        """
+        Poll recently played tracks with the `after` cursor until no new plays
+        Args:
+            after: Epoch ms of the last stored play (None for the first sync)
+            max_pages: Safety limit on the number of requests
+        """
+        all_items = []
+        cursor = after
+
+        for _ in range(max_pages):
+            results = self.get_recently_played(limit=50, after=cursor)
+            items = results.get('items', [])
+            if not items:
+                break
+
+            all_items.extend(items)
+
+            next_cursor = (results.get('cursors') or {}).get('after')
+            if not next_cursor or (cursor is not None and int(next_cursor) <= int(cursor)):
+                break
+            cursor = int(next_cursor)
+
+        return {'items': all_items}
     
+    @timed('spotify.get_recommendations')
     def get_recommendations(self, seed_artists=None, seed_tracks=None, limit=20):
         """Get track recommendations based on seeds"""
         return self.sp.recommendations(
@@ -71,6 +137,7 @@ class SpotifyClient:
             limit=limit
         )
     
+    @timed('spotify.get_artist_info')
     def get_artist_info(self, artist_id):
         """Get detailed information for a specific artist"""
         return self.sp.artist(artist_id)
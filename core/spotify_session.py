@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+from .metrics import timed
+
+# Refresh this many seconds before the access token expires
+REFRESH_MARGIN_SECONDS = 300
+
+# Wait before retrying a failed refresh (requests keep the current token meanwhile)
+REFRESH_RETRY_SECONDS = 30
+
+
+# Read-only scopes Chatify asks the user for
+SPOTIFY_SCOPE = "user-library-read user-top-read playlist-read-private user-read-recently-played"
+
+
+def create_spotify_oauth():
+    """SpotifyOAuth for the app's credentials (login flow and token refresh)"""
+    from spotipy.cache_handler import CacheHandler
+    from spotipy.oauth2 import SpotifyOAuth
+
+    class NoTokenCache(CacheHandler):
+        """Keeps no token at all, so one user's token can never be handed to another"""
+
+        def get_cached_token(self):
+            return None
+
+        def save_token_to_cache(self, token_info):
+            pass
+
+    return SpotifyOAuth(
+        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+        redirect_uri=os.getenv("SPOTIFY_REDIRECT_URI"),
+        scope=SPOTIFY_SCOPE,
+        # One SpotifyOAuth serves every user: tokens live in their SpotifySession only.
+        # spotipy's default .cache file (or a MemoryCacheHandler) would hold the last
+        # user's token and return it to whoever logs in next.
+        cache_handler=NoTokenCache(),
+        show_dialog=True
+    )
+
+
+def create_spotify_api(auth_manager):
+    """spotipy client authenticated through `auth_manager`, honouring SPOTIFY_API_PREFIX"""
+    import spotipy
+
+    sp = spotipy.Spotify(auth_manager=auth_manager)
+    # Point at a different API host (e.g. the benchmark's fake Spotify server)
+    api_prefix = os.getenv("SPOTIFY_API_PREFIX")
+    if api_prefix:
+        sp.prefix = api_prefix
+    return sp
+
+
+class SpotifySession:
+    """
+    Identity and token of one logged-in user, shared by AuthManager, SpotifyClient
+    and MusicDataCollector for the whole session
+    - The profile is fetched once and cached (user_id, collect_all_data, ...)
+    - Implements spotipy's auth_manager interface (get_access_token), so every
+      client built on it always sends the current token
+    - The first request within refresh_margin of expiry refreshes the token (one
+      caller at a time, the others keep the still valid one), so long collections
+      never hit a 401 halfway through and idle sessions cost no thread
+    Args:
+        token_info: OAuth token dict (access_token, refresh_token, expires_at)
+        oauth: SpotifyOAuth used to refresh; without it the token is used as is
+        refresh_margin: Seconds before expiry at which the token is refreshed
+    """
+
+    def __init__(self, token_info, oauth=None, refresh_margin=REFRESH_MARGIN_SECONDS):
+        if not token_info or not token_info.get('access_token'):
+            raise ValueError("User token is required")
+
+        self.oauth = oauth
+        self.refresh_margin = refresh_margin
+        self._token_info = dict(token_info)
+        self._lock = threading.RLock()
+        self._profile_lock = threading.Lock()
+        self._profile = None
+        self._api = None
+        self._refresh_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._closed = False
+
+    @classmethod
+    def ensure(cls, session_or_token):
+        """Accept either a SpotifySession or a bare token_info dict"""
+        if isinstance(session_or_token, cls):
+            return session_or_token
+        return cls(session_or_token)
+
+    # --- spotipy auth_manager interface ---
+
+    def get_access_token(self, as_dict=False):
+        """Current access token, refreshed first when it is about to expire"""
+        if self._needs_refresh():
+            expired = self._expires_in() <= 0
+            # Only one caller refreshes; the others keep the current token unless it expired
+            if self._refresh_lock.acquire(blocking=expired):
+                try:
+                    if self._needs_refresh() and not self.refresh():
+                        self._retry_at = time.time() + REFRESH_RETRY_SECONDS
+                finally:
+                    self._refresh_lock.release()
+        with self._lock:
+            return dict(self._token_info) if as_dict else self._token_info['access_token']
+
+    def get_cached_token(self):
+        return self.token_info
+
+    # --- token ---
+
+    @property
+    def token_info(self):
+        with self._lock:
+            return dict(self._token_info)
+
+    def _expires_in(self):
+        expires_at = self._token_info.get('expires_at')
+        if not expires_at:
+            return float('inf')
+        return expires_at - time.time()
+
+    def _needs_refresh(self):
+        return (self.oauth is not None and not self._closed and self._token_info.get('refresh_token')
+                and self._expires_in() <= self.refresh_margin and time.time() >= self._retry_at)
+
+    def refresh(self):
+        """
+        Refresh the access token now
+        Returns: True if refreshed
+        """
+        with self._lock:
+            refresh_token = self._token_info.get('refresh_token')
+        if self.oauth is None or not refresh_token:
+            return False
+
+        # Outside the lock: other requests keep using the still valid token meanwhile
+        try:
+            new_token_info = self.oauth.refresh_access_token(refresh_token)
+        except Exception as e:
+            print(f"Error refreshing token: {e}")
+            return False
+
+        # Spotify does not always return a new refresh token
+        new_token_info.setdefault('refresh_token', refresh_token)
+        with self._lock:
+            self._token_info = new_token_info
+        print("Token refreshed successfully")
+        return True
+
+    # --- identity ---
+
+    @property
+    def api(self):
+        """Shared spotipy client for session-level calls"""
+        if self._api is None:
+            self._api = create_spotify_api(self)
+        return self._api
+
+    @timed('spotify.current_user')
+    def _fetch_profile(self):
+        return self.api.current_user()
+
+    def get_profile(self, refresh=False):
+        """The user's profile, fetched from Spotify only once per session"""
+        with self._profile_lock:
+            if self._profile is None or refresh:
+                self._profile = self._fetch_profile()
+            return dict(self._profile)
+
+    @property
+    def user_id(self):
+        try:
+            return self.get_profile().get('id', 'unknown_user')
+        except Exception as e:
+            print(f"Error getting user ID: {e}")
+            return 'unknown_user'
+
+    def close(self):
+        """Stop refreshing the token (on logout)"""
+        with self._lock:
+            self._closed = True
@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+DATA_DIR = os.getenv("CHATIFY_DATA_DIR", "data")
+
+# Disk budget for all user directories together; least recently used users are evicted beyond it
+STORAGE_QUOTA_MB = float(os.getenv("CHATIFY_STORAGE_QUOTA_MB", "1024"))
+
+# Touched on every read/write, its mtime is the user's last access
+LAST_ACCESS_FILE = ".last_access"
+
+# Users accessed this recently count as active and are never evicted
+ACTIVE_SECONDS = 15 * 60
+
+# The user's play log: Spotify only serves the last 50 plays, so it can't be rebuilt.
+# Not counted against the quota and never evicted, only deleted with the account (UserStore.remove)
+PLAY_HISTORY_DIR = "play_history"
+
+# Minimum time between two background eviction passes (each one walks every user directory)
+EVICTION_INTERVAL_SECONDS = 10 * 60
+
+_eviction_lock = threading.Lock()
+_schedule_lock = threading.Lock()
+_last_eviction = None
+
+
+def users_dir(base_dir=None):
+    return os.path.join(base_dir or DATA_DIR, "users")
+
+
+def _safe_name(user_id):
+    return user_id.replace('-', '_').replace(os.sep, '_')
+
+
+class UserStore:
+    """
+    Isolated directory for one user's files (music data cache, play history, ...)
+    Writes are atomic (temp file + rename), so concurrent sessions and background
+    syncs never see half-written files, and every access updates the user's
+    last-access time used for LRU eviction. The directory is created on the first
+    write: reading an unknown user's files leaves nothing behind.
+    """
+
+    def __init__(self, user_id, base_dir=None):
+        self.user_id = user_id
+        self.directory = os.path.join(users_dir(base_dir), _safe_name(user_id))
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def touch(self):
+        """Mark the user as recently used"""
+        marker = self.path(LAST_ACCESS_FILE)
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.utime(marker)
+        except FileNotFoundError:
+            open(marker, 'a').close()
+
+    def exists(self):
+        return os.path.isdir(self.directory)
+
+    def last_access(self):
+        """Last access timestamp, or None if nothing is stored for the user"""
+        for path in (self.path(LAST_ACCESS_FILE), self.directory):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                continue
+        return None
+
+    def read_json(self, name, default=None):
+        """Load a JSON file from the user's directory, or `default` if missing/corrupt"""
+        try:
+            with open(self.path(name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return default
+        self.touch()
+        return data
+
+    def _atomic_write(self, name, text):
+        target = self.path(name)
+        # The directory may have been evicted while the session was idle
+        os.makedirs(self.directory, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.touch()
+
+    def write_json(self, name, data, indent=None):
+        """Atomically replace a JSON file in the user's directory"""
+        self._atomic_write(name, json.dumps(data, indent=indent, ensure_ascii=False))
+
+    def read_text(self, name, default=None):
+        try:
+            with open(self.path(name), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return default
+
+    def write_text(self, name, text):
+        self._atomic_write(name, text)
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def size_bytes(self):
+        return _directory_size(self.directory)
+
+    def remove(self):
+        """Delete everything stored for this user"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _directory_size(directory, exclude=()):
+    total = 0
+    for root, dirs, files in os.walk(directory):
+        if root == directory:
+            dirs[:] = [name for name in dirs if name not in exclude]
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _evict_directory(directory):
+    """Delete a user's cached data, keeping the play log"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name == PLAY_HISTORY_DIR:
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+
+def list_user_stores(base_dir=None):
+    """All stored users as (user directory name, last access, evictable bytes), oldest access first"""
+    root = users_dir(base_dir)
+    if not os.path.isdir(root):
+        return []
+    entries = []
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        marker = os.path.join(directory, LAST_ACCESS_FILE)
+        try:
+            last_access = os.path.getmtime(marker if os.path.exists(marker) else directory)
+        except OSError:
+            continue
+        entries.append((name, last_access, _directory_size(directory, exclude=(PLAY_HISTORY_DIR,))))
+    return sorted(entries, key=lambda entry: entry[1])
+
+
+def evict_least_recently_used(keep=(), quota_mb=None, base_dir=None):
+    """
+    Delete the least recently used users' cached data until the total fits the quota
+    (play logs are neither counted nor deleted, see PLAY_HISTORY_DIR)
+    Args:
+        keep: User IDs that are never evicted (e.g. every user with a live session), or a
+              callable returning them, called once the pass holds the eviction lock;
+              users accessed in the last ACTIVE_SECONDS are kept as well
+        quota_mb: Disk budget in MB (defaults to CHATIFY_STORAGE_QUOTA_MB)
+    Returns: List of evicted user directory names
+    """
+    quota_bytes = (STORAGE_QUOTA_MB if quota_mb is None else quota_mb) * 1024 * 1024
+    evicted = []
+
+    with _eviction_lock:
+        protected = {_safe_name(user_id) for user_id in (keep() if callable(keep) else keep) if user_id}
+        entries = list_user_stores(base_dir)
+        total = sum(size for _, _, size in entries)
+        now = time.time()
+        for name, last_access, size in entries:
+            if total <= quota_bytes:
+                break
+            if name in protected or now - last_access < ACTIVE_SECONDS:
+                continue
+            _evict_directory(os.path.join(users_dir(base_dir), name))
+            total -= size
+            evicted.append(name)
+            idle_hours = (now - last_access) / 3600
+            print(f"Evicted cached data of {name} ({size / 1024:.0f} KB, idle {idle_hours:.1f} h)")
+    return evicted
+
+
+def schedule_eviction(keep=()):
+    """
+    Run evict_least_recently_used in a background thread, at most once per
+    EVICTION_INTERVAL_SECONDS, so logins never wait for the disk scan
+    Args:
+        keep: As in evict_least_recently_used; pass a callable so users who log in
+              before the pass starts are protected too
+    Returns: True if a pass was started
+    """
+    global _last_eviction
+    now = time.monotonic()
+    with _schedule_lock:
+        if _last_eviction is not None and now - _last_eviction < EVICTION_INTERVAL_SECONDS:
+            return False
+        _last_eviction = now
+
+    def run():
+        try:
+            evict_least_recently_used(keep=keep)
+        except Exception as e:
+            print(f"Cache eviction failed: {e}")
+
+    threading.Thread(target=run, daemon=True, name="chatify-eviction").start()
+    return True
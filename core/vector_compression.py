@@ -0,0 +1,321 @@
+import os
+import tempfile
+
+import numpy as np
+
+# none | float16 | int8 | pq
+VECTOR_COMPRESSION = os.getenv("CHATIFY_VECTOR_COMPRESSION", "none").lower()
+
+# Candidates re-ranked with full-precision vectors after an approximate search
+RESCORE_LIMIT = int(os.getenv("CHATIFY_VECTOR_RESCORE_LIMIT", "100"))
+
+# Vectors buffered before a trained codec (int8, pq) is fitted
+TRAINING_LIMIT = int(os.getenv("CHATIFY_VECTOR_TRAINING_LIMIT", "1000"))
+
+
+def weaviate_vector_index_config(mode=None):
+    """
+    Weaviate HNSW config matching a compression mode, or None for the default index
+    Weaviate has no half-precision index, so "float16" only affects LocalVectorStore.
+    """
+    mode = (mode or VECTOR_COMPRESSION).lower()
+    if mode in ("none", "float16"):
+        return None
+
+    from weaviate.classes.config import Configure
+    if mode == "int8":
+        quantizer = Configure.VectorIndex.Quantizer.sq(rescore_limit=RESCORE_LIMIT, training_limit=TRAINING_LIMIT)
+    elif mode == "pq":
+        quantizer = Configure.VectorIndex.Quantizer.pq(segments=96, training_limit=TRAINING_LIMIT)
+    else:
+        raise ValueError(f"Unknown vector compression: {mode}")
+    return Configure.VectorIndex.hnsw(quantizer=quantizer)
+
+
+class Float16Codec:
+    """Half precision: 2 bytes per dimension, no training"""
+    trained = True
+
+    def fit(self, vectors):
+        pass
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float16)
+
+    def distances(self, query, codes):
+        return 1.0 - codes.astype(np.float32) @ query
+
+    def bytes_per_vector(self, dim):
+        return 2 * dim
+
+    def overhead_bytes(self):
+        return 0
+
+
+class ScalarInt8Codec:
+    """Per-dimension min/max scalar quantization to uint8: 1 byte per dimension"""
+
+    def __init__(self):
+        self.trained = False
+        self.offset = None
+        self.scale = None
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        self.offset = low
+        self.scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+        self.trained = True
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, 255).astype(np.uint8)
+
+    def distances(self, query, codes):
+        # q . (offset + scale * c) = q . offset + (q * scale) . c
+        return 1.0 - (float(query @ self.offset) + codes.astype(np.float32) @ (query * self.scale))
+
+    def bytes_per_vector(self, dim):
+        return dim
+
+    def overhead_bytes(self):
+        return 0 if self.offset is None else self.offset.nbytes + self.scale.nbytes
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into `segments` sub-vectors, each stored as
+    the index (1 byte) of its nearest centroid. Search uses per-query lookup tables.
+    """
+
+    def __init__(self, segments=48, centroids=256, iterations=15, seed=0):
+        self.segments = segments
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.trained = False
+        self.codebooks = None
+
+    def _split(self, vectors):
+        n, dim = vectors.shape
+        if dim % self.segments:
+            raise ValueError(f"Dimension {dim} is not divisible by {self.segments} segments")
+        return vectors.reshape(n, self.segments, dim // self.segments)
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        subvectors = self._split(vectors)
+        k = min(self.centroids, len(vectors))
+        rng = np.random.default_rng(self.seed)
+        codebooks = []
+        for s in range(self.segments):
+            data = subvectors[:, s, :]
+            centers = data[rng.choice(len(data), size=k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(data, centers)
+                for c in range(k):
+                    members = data[assignment == c]
+                    if len(members):
+                        centers[c] = members.mean(axis=0)
+            codebooks.append(centers)
+        self.codebooks = np.stack(codebooks)
+        self.trained = True
+
+    @staticmethod
+    def _nearest(data, centers):
+        distances = (data ** 2).sum(axis=1)[:, None] - 2 * data @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors):
+        subvectors = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((len(subvectors), self.segments), dtype=np.uint8)
+        for s in range(self.segments):
+            codes[:, s] = self._nearest(subvectors[:, s, :], self.codebooks[s])
+        return codes
+
+    def distances(self, query, codes):
+        # Asymmetric distance: one dot-product table per segment, then table lookups
+        query_parts = query.reshape(self.segments, -1)
+        tables = np.einsum('sd,skd->sk', query_parts, self.codebooks)
+        similarity = tables[np.arange(self.segments)[None, :], codes].sum(axis=1)
+        return 1.0 - similarity
+
+    def bytes_per_vector(self, dim):
+        return self.segments
+
+    def overhead_bytes(self):
+        return 0 if self.codebooks is None else self.codebooks.nbytes
+
+
+def make_codec(mode):
+    mode = (mode or "none").lower()
+    if mode == "none":
+        return None
+    if mode == "float16":
+        return Float16Codec()
+    if mode == "int8":
+        return ScalarInt8Codec()
+    if mode == "pq":
+        return ProductQuantizer()
+    raise ValueError(f"Unknown vector compression: {mode}")
+
+
+class _DiskVectors:
+    """Append-only float32 vectors on disk (memory-mapped for rescoring)"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        handle, self.path = tempfile.mkstemp(prefix="chatify_vectors_", suffix=".f32")
+        os.close(handle)
+        self.count = 0
+        self._map = None
+
+    def append(self, vectors):
+        with open(self.path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.count += len(vectors)
+        self._map = None
+
+    def rows(self, indices):
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        return np.asarray(self._map[indices])
+
+    def rewrite(self, keep):
+        kept = self.rows(np.asarray(keep, dtype=np.int64)) if self.count else np.zeros((0, self.dim), np.float32)
+        self._map = None
+        with open(self.path, 'wb') as f:
+            f.write(kept.tobytes())
+        self.count = len(kept)
+
+    def close(self):
+        self._map = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class FlatIndex:
+    """Exact search over unit-normalized float32 vectors held in memory"""
+
+    def __init__(self):
+        self._matrix = None
+        self.size = 0
+
+    def add(self, vector):
+        self.add_many(vector[None, :])
+
+    def add_many(self, vectors):
+        """Append a (n, dim) block; the matrix doubles when full"""
+        needed = self.size + len(vectors)
+        if self._matrix is None or needed > self._matrix.shape[0]:
+            capacity = max(64, needed, 2 * (0 if self._matrix is None else self._matrix.shape[0]))
+            grown = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+            if self.size:
+                grown[:self.size] = self._matrix[:self.size]
+            self._matrix = grown
+        self._matrix[self.size:needed] = vectors
+        self.size = needed
+
+    def keep(self, rows):
+        if self._matrix is not None:
+            self._matrix[:len(rows)] = self._matrix[rows]
+        self.size = len(rows)
+
+    def vector(self, row):
+        return self._matrix[row]
+
+    def distances(self, query, rows):
+        return 1.0 - self._matrix[rows] @ query
+
+    def memory_bytes(self):
+        return 0 if self._matrix is None else self.size * self._matrix.shape[1] * 4
+
+
+class CompressedIndex:
+    """
+    Compressed vectors in memory, full-precision copies on disk for rescoring
+    Until the codec is trained, vectors are kept as float32 and searched exactly.
+    """
+
+    def __init__(self, codec, rescore_limit=RESCORE_LIMIT, training_limit=TRAINING_LIMIT):
+        self.codec = codec
+        self.rescore_limit = rescore_limit
+        self.training_limit = training_limit
+        self.size = 0
+        # Codes of the first _code_count vectors; the buffer doubles when full
+        self._codes = None
+        self._code_count = 0
+        self._pending = []
+        self._disk = None
+
+    def add(self, vector):
+        self.add_many(vector[None, :])
+
+    def add_many(self, vectors):
+        """Append a (n, dim) block: one disk write and one encode per block"""
+        if self._disk is None:
+            self._disk = _DiskVectors(vectors.shape[1])
+        self._disk.append(vectors)
+        self.size += len(vectors)
+        if self.codec.trained:
+            self._append_codes(self.codec.encode(vectors))
+        else:
+            self._pending.extend(vectors)
+            if len(self._pending) >= self.training_limit:
+                self.train()
+
+    def _append_codes(self, codes):
+        needed = self._code_count + len(codes)
+        if self._codes is None or needed > len(self._codes):
+            capacity = max(64, needed, 2 * (0 if self._codes is None else len(self._codes)))
+            grown = np.empty((capacity,) + codes.shape[1:], dtype=codes.dtype)
+            if self._code_count:
+                grown[:self._code_count] = self._codes[:self._code_count]
+            self._codes = grown
+        self._codes[self._code_count:needed] = codes
+        self._code_count = needed
+
+    def train(self):
+        """Fit the codec on the buffered vectors and encode everything stored so far"""
+        if self.codec.trained or not self._pending:
+            return
+        pending = np.stack(self._pending)
+        self.codec.fit(pending)
+        self._codes = self.codec.encode(self._disk.rows(np.arange(self.size)))
+        self._code_count = self.size
+        self._pending = []
+
+    def keep(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._disk is not None:
+            self._disk.rewrite(rows)
+        if self._codes is not None:
+            self._codes = self._codes[rows]
+            self._code_count = len(rows)
+        if self._pending:
+            self._pending = [self._disk.rows(np.array([i]))[0] for i in range(len(rows))]
+        self.size = len(rows)
+
+    def vector(self, row):
+        return self._disk.rows(np.array([row]))[0]
+
+    def distances(self, query, rows):
+        if not self.codec.trained:
+            return 1.0 - self._disk.rows(rows) @ query
+        return self.codec.distances(query, self._codes[rows])
+
+    def rescore(self, query, rows):
+        """Exact distances from the on-disk float32 vectors"""
+        return 1.0 - self._disk.rows(rows) @ query
+
+    def memory_bytes(self):
+        if not self.codec.trained:
+            return len(self._pending) * (self._disk.dim * 4 if self._disk else 0)
+        return int(self._codes[:self._code_count].nbytes + self.codec.overhead_bytes())
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()